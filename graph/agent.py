@@ -1,18 +1,75 @@
-import json
-
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import date, datetime
+from decimal import Decimal
+
+from answer_renderer import render_answer
+from approximate import approximate_percent
+from batch import current_result_cache
+from blobstore import blobs
+from cancellation import RunCancelled
 from database import PostgresDB
 from langchain.schema import AIMessage, HumanMessage
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_community.tools.sql_database.tool import QuerySQLCheckerTool
 from langgraph.types import Command, interrupt
-from llm import model
+from llm import gateway, model
+from mirror import is_read_only
+from profiler import ColumnProfiler
 from prompt import (
+    answer_system_prompt,
     format_answer_prompt,
-    get_classification_prompt,
+    format_column_stats,
     get_visualization_prompt,
     interact_prompt,
-    sql_prompt,
+    plan_prompt,
+    sql_question_prompt,
+    sql_system_prompt,
 )
+from snapshots import lookup_snapshot, record_question
+from sql_repair import is_error_result, repair_sql
+from state import InteractionResult, QueryPlan
+from subqueries import MAX_SUB_QUESTIONS, describe_results, looks_compound, merge_results
+
+
+TABLES = ["orders_ia", "orders_items_ia"]
+
+# Número máximo de correções locais (sem LLM) aplicadas a uma mesma execução
+MAX_LOCAL_REPAIRS = 3
+
+# Tempo (em segundos) que os esquemas das tabelas ficam em cache no processo
+SCHEMA_CACHE_TTL = int(os.getenv("SCHEMA_CACHE_TTL", "3600"))
+
+# Temperatura usada para diversificar as candidatas no modo especulativo
+SQL_CANDIDATES_TEMPERATURE = 0.7
+
+# Resultados até este tamanho ficam no estado em forma tabular (usada pelos templates de resposta)
+MAX_STORED_ROWS = 50
+
+# Tentativas de gerar uma SQL válida para cada sub-pergunta antes de voltar ao fluxo de query única
+MAX_SUB_QUERY_ATTEMPTS = 2
+
+
+def status_message(content: str) -> AIMessage:
+    """Mensagem de progresso (ou SQL gerada): aparece no streaming, mas não no histórico da conversa."""
+    return AIMessage(content=content, additional_kwargs={"internal": True})
+
+
+def _json_safe(value):
+    """Converte valores do banco em tipos serializáveis no checkpoint (Decimal → float, datas → ISO)."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _margin_or_inf(approximation: dict) -> float:
+    """Margem de erro da aproximação; `inf` quando não foi calculada (somas e médias)."""
+    return float("inf") if approximation["margin"] is None else approximation["margin"]
 
 
 class EcommerceAgent:
@@ -21,6 +78,44 @@ class EcommerceAgent:
         self.toolkit = SQLDatabaseToolkit(db=self.db.db, llm=model)
         self.query_checker = QuerySQLCheckerTool(db=self.db.db, llm=model)  # 🔹 Instancia o validador SQL
 
+        # 🔹 Estatísticas de colunas calculadas em segundo plano desde a inicialização
+        self.profiler = ColumnProfiler(self.db, TABLES)
+        self.profiler.refresh_async()
+
+        # 🔹 Número de candidatas SQL geradas em paralelo (1 desativa o modo especulativo)
+        self.sql_candidates = int(os.getenv("SQL_CANDIDATES", "1"))
+
+        # 🔹 Cache dos esquemas: `(carregado_em, table_schemas)`
+        self._schema_cache = None
+        self._schema_lock = threading.Lock()
+
+    def find_snapshot(self, state: dict):
+        """Snapshot válido para a última mensagem do usuário (ver `snapshots.py`), ou `None`."""
+        messages = state.get("messages") or []
+        if not messages or not isinstance(messages[-1].content, str):
+            return None
+        return lookup_snapshot(messages[-1].content)
+
+    def serve_snapshot(self, state: dict):
+        """
+        Responde com a resposta pré-calculada, sem LLM nem banco. A SQL e os dados vão para o estado,
+        então "ver mais" e a exportação funcionam como em uma resposta normal.
+        """
+        snapshot = self.find_snapshot(state)
+        if snapshot is None:  # 🔹 Expirou entre a decisão da rota e este nó: segue o fluxo normal
+            return Command(goto=["interact_with_user", "prefetch_schemas"])
+
+        return {
+            "messages": [AIMessage(content=snapshot["answer"])],
+            "final_answer": snapshot["answer"],
+            "sql_query": snapshot.get("sql_query") or "",
+            "query_columns": snapshot.get("columns", []),
+            "query_rows": snapshot.get("rows", []),
+            "query_approximation": None,
+            "visualization": snapshot.get("visualization") or "none",
+            "visualization_reason": snapshot.get("visualization_reason") or "",
+        }
+
     def collect_user_interaction(self, state: dict) -> Command:
         """Função para interromper e coletar a entrada do usuário."""
         entrada_usuario = interrupt(value="Aguardando a entrada do usuário.")
@@ -35,73 +130,171 @@ class EcommerceAgent:
 
         user_message = state["messages"][-1]  # Última mensagem do usuário
 
-        # 🔹 Obtém o System Prompt
-        system_prompt = interact_prompt()
-
         # 🔹 Criamos a lista de mensagens que o LLM receberá
-        messages = [system_prompt, HumanMessage(content=user_message.content)]
+        messages = [interact_prompt(), HumanMessage(content=user_message.content)]
 
-        # 🔹 Enviamos para o LLM e processamos a resposta
-        response = model.invoke(messages).content.strip()
+        # 🔹 Uma única chamada com saída estruturada decide relevância, normaliza a pergunta e extrai a intenção
+        result = gateway.invoke(messages, lane="interaction", schema=InteractionResult)
 
-        # 🔹 Se a resposta for um JSON válido, a pergunta está pronta para o próximo nó
-        if response.startswith("{") and "is_relevant" in response:
-            state["messages"].append(AIMessage(content="✅ Entendi sua pergunta! Vou processá-la."))
-            return state | json.loads(response)
+        if result.is_relevant and result.user_query:
+            state["messages"].append(status_message("✅ Entendi sua pergunta! Vou processá-la."))
+            return state | {
+                "is_relevant": True,
+                "user_query": result.user_query,
+                "query_intent": result.intent.model_dump() if result.intent else {},
+                "sql_attempts": 0,
+            }
 
         # 🔹 Se ainda não for uma pergunta válida, continuamos no mesmo nó
-        state["messages"].append(AIMessage(content=response))
-        return state
+        state["messages"].append(AIMessage(content=result.reply))
+        return state | {"is_relevant": False}
 
-    def classify_query(self, state: dict) -> dict:
+    def analyze_tables(self, state: dict) -> dict:
         """
-        Classifica se a pergunta é relevante para e-commerce.
-        Se for relevante, avança para o refinamento; caso contrário, encerra a interação.
+        Obtém informações das tabelas e adiciona ao estado.
         """
-        user_query = state["messages"][-1].content  # Última mensagem do usuário
+        state["messages"].append(status_message("🔍 Obtendo informações das tabelas relevantes..."))
 
-        # Classificação para saber se a pergunta é sobre e-commerce
-        classification_prompt = get_classification_prompt(user_query)
-        response = model.invoke([HumanMessage(content=classification_prompt)]).content.strip()
+        table_schemas = self.load_table_schemas()
+        column_stats = self.current_column_stats()
 
-        is_valid = response.upper() == "SIM"
+        # 🔹 O estado guarda só as referências do DDL; o conteúdo fica no armazém de blobs (deduplicado entre threads)
+        return state | {"table_schemas": blobs.put_dict(table_schemas), "column_stats": column_stats}
 
-        if is_valid:
-            # Se a pergunta for válida para e-commerce, seguimos para refinamento
-            state["messages"].append(
-                AIMessage(content="✅ Sua pergunta é relevante para e-commerce. Vamos refiná-la se necessário.")
-            )
-            return state | {"is_valid_query": True}
+    def prefetch_schemas(self, state: dict) -> dict:
+        """
+        Carrega os esquemas especulativamente, em paralelo com `interact_with_user`.
+        Não escreve nada no estado: se a pergunta for relevante, `analyze_tables` encontra o cache pronto;
+        caso contrário, o resultado é simplesmente descartado.
+        """
+        self.load_table_schemas()
+        return {}
 
-        # Se for irrelevante, finalizamos o fluxo
-        state["messages"].append(
-            AIMessage(
-                content="❌ Desculpe, só posso responder perguntas relacionadas a vendas, produtos ou faturamento de e-commerces."
-            )
-        )
+    def load_table_schemas(self) -> dict:
+        """
+        Retorna o DDL (com exemplos) das tabelas, mantido em cache por `SCHEMA_CACHE_TTL` segundos.
+        Chamadas concorrentes aguardam a carga em andamento em vez de repetir a consulta ao banco.
+        """
+        with self._schema_lock:
+            if self._schema_cache and time.time() - self._schema_cache[0] < SCHEMA_CACHE_TTL:
+                return self._schema_cache[1]
 
-        return state | {"is_valid_query": False}
+            tools = self.toolkit.get_tools()
+            get_schema_tool = next(tool for tool in tools if tool.name == "sql_db_schema")
 
-    def analyze_tables(self, state: dict) -> dict:
+            table_schemas = {}
+            failed = False
+
+            for table in TABLES:
+                try:
+                    full_info = get_schema_tool.invoke(table)
+                    table_schemas[table] = full_info
+                except Exception:
+                    table_schemas[table] = "Erro ao obter esquema"
+                    failed = True
+
+            # 🔹 Falhas não são cacheadas para que a próxima pergunta tente novamente
+            if not failed:
+                self._schema_cache = (time.time(), table_schemas)
+
+            return table_schemas
+
+    def plan_query(self, state: dict) -> dict:
         """
-        Obtém informações das tabelas e adiciona ao estado.
+        Divide perguntas compostas (comparações, várias métricas) em sub-perguntas independentes.
+        Perguntas simples passam direto, sem chamada ao LLM.
         """
-        state["messages"].append(AIMessage(content="🔍 Obtendo informações das tabelas relevantes..."))
-
-        tools = self.toolkit.get_tools()
-        get_schema_tool = next(tool for tool in tools if tool.name == "sql_db_schema")
+        if not looks_compound(state["user_query"], state.get("query_intent")):
+            return state | {"sub_questions": []}
 
-        tables = ["orders_ia", "orders_items_ia"]
-        table_schemas = {}
+        try:
+            plan = gateway.invoke(
+                [plan_prompt(), HumanMessage(content=state["user_query"])], lane="sql", schema=QueryPlan
+            )
+        except RunCancelled:
+            raise
+        except Exception as e:
+            print("⚠️ Erro ao planejar a pergunta, seguindo com uma única query:", str(e))
+            return state | {"sub_questions": []}
+
+        sub_questions = [q.strip() for q in plan.sub_questions if q.strip()]
+        if len(sub_questions) > MAX_SUB_QUESTIONS:
+            # 🔹 Descartar sub-perguntas deixaria parte da pergunta sem resposta: segue com uma única query
+            print(f"⚠️ Plano com {len(sub_questions)} sub-perguntas (máx. {MAX_SUB_QUESTIONS}); usando uma única query")
+            return state | {"sub_questions": []}
+        if len(sub_questions) < 2:
+            return state | {"sub_questions": []}
+
+        state["messages"].append(status_message(f"🧩 Dividindo a pergunta em {len(sub_questions)} consultas..."))
+        return state | {"sub_questions": sub_questions}
+
+    def run_sub_queries(self, state: dict) -> dict:
+        """
+        Gera e executa a SQL de cada sub-pergunta em paralelo e combina os resultados em Python.
+        Se alguma sub-pergunta falhar, limpa `sub_questions` e o fluxo segue com uma única query.
+        """
+        sub_questions = state["sub_questions"]
+        table_schemas = blobs.get_dict(state.get("table_schemas", {}))
+        column_stats = state.get("column_stats", {})
+
+        # 🔹 Cada tarefa roda em uma cópia do contexto do nó (cancelamento e cache de lote chegam às threads)
+        with ThreadPoolExecutor(max_workers=len(sub_questions)) as executor:
+            futures = [
+                executor.submit(copy_context().run, self._answer_sub_question, question, table_schemas, column_stats)
+                for question in sub_questions
+            ]
+            results = [future.result() for future in futures]
+
+        failed = [question for question, result in zip(sub_questions, results) if result is None]
+        if failed:
+            print(f"⚠️ {len(failed)} sub-pergunta(s) sem SQL válida; seguindo com uma única query")
+            return state | {"sub_questions": []}
+
+        columns, rows = merge_results(results)
+        # 🔹 No modo aproximado, a resposta informa a maior margem de erro entre as sub-perguntas
+        # (margem desconhecida, de somas e médias, conta como a maior)
+        approximations = [result["approximation"] for result in results if result["approximation"]]
+        for result in results:
+            state["messages"].append(status_message(result["sql_query"]))
+        state["messages"].append(status_message("✅ Consultas executadas e combinadas com sucesso."))
 
-        for table in tables:
-            try:
-                full_info = get_schema_tool.invoke(table)
-                table_schemas[table] = full_info
-            except Exception:
-                table_schemas[table] = "Erro ao obter esquema"
+        return state | {
+            # 🔹 Várias queries: "ver mais" e exportação ficam desativados (a SQL não é uma única consulta de leitura)
+            "sql_query": ";\n\n".join(result["sql_query"] for result in results),
+            "query_response": blobs.put(describe_results(results, columns, rows)),
+            "query_columns": columns,
+            "query_rows": [[_json_safe(value) for value in row] for row in rows] if len(rows) <= MAX_STORED_ROWS else [],
+            "query_approximation": max(approximations, key=_margin_or_inf) if approximations else None,
+            "query_error": None,
+            "retry_generate_sql": False,
+        }
 
-        return state | {"table_schemas": table_schemas}
+    def _answer_sub_question(self, question: str, table_schemas: dict, column_stats: dict):
+        """Gera e executa a SQL de uma sub-pergunta, com correção pelo LLM em caso de erro; `None` se falhar."""
+        messages = self.sql_prompt(question, table_schemas, column_stats)
+        for _ in range(MAX_SUB_QUERY_ATTEMPTS):
+            sql_query = gateway.invoke(messages, lane="sql").content.strip()
+            # 🔹 Mesmas barreiras do fluxo principal: só leitura (sem CTEs com DELETE/UPDATE) e validação da SQL
+            if not is_read_only(sql_query):
+                result = "Erro: a resposta não é uma única consulta de leitura (SELECT)."
+            else:
+                result = self._validation_error(sql_query)
+                if result is None:
+                    sql_query, result, columns, rows, approximation = self._run_with_repairs(sql_query, table_schemas)
+                    if not is_error_result(result):
+                        return {
+                            "question": question,
+                            "sql_query": sql_query,
+                            "columns": columns,
+                            "rows": rows,
+                            "approximation": approximation,
+                        }
+
+            messages = messages[:2] + [
+                AIMessage(content=sql_query),
+                HumanMessage(content=f"Sua query retornou com esse erro: {result}. Por favor, corrija."),
+            ]
+        return None
 
     def generate_sql(self, state: dict) -> dict:
         """
@@ -109,102 +302,230 @@ class EcommerceAgent:
         Se houver erro, adiciona uma mensagem no chat pedindo a correção.
         """
         user_query = state["user_query"]
-        table_schemas = state.get("table_schemas", {})
-        query_error = state.get("query_error")  # Verifica se há erro anterior
+        table_schemas = blobs.get_dict(state.get("table_schemas", {}))
+        column_stats = state.get("column_stats", {})
+        query_error = state.get("query_error") or state.get("sql_error")  # Verifica se há erro anterior
 
         if not table_schemas:
             return state | {"sql_query": "Erro: Nenhuma informação de tabela disponível."}
 
-        # 🔹 Formata o contexto do banco de dados
-        schema_context = "\n".join([f"Table {table}: {schema}" for table, schema in table_schemas.items()])
+        messages = self.sql_prompt(user_query, table_schemas, column_stats)
 
-        # 🔹 Se for a primeira tentativa, adicionamos o prompt original
-        if not query_error:
-            sql_prompt_text = sql_prompt(schema_context, user_query)
-            state["messages"].append(HumanMessage(content=sql_prompt_text))
-        else:
-            # 🔹 Se houve erro, adicionamos uma nova mensagem pedindo correção
-            state["messages"].append(
-                HumanMessage(content=f"Sua query retornou com esse erro: {query_error}. Por favor, corrija.")
-            )
-
-        # 🔹 Invocamos o LLM passando o histórico de mensagens
-        llm_response = model.invoke(state["messages"])
+        if query_error:
+            # 🔹 Se houve erro, acrescentamos a tentativa anterior e o erro ao final, sem tocar no prefixo
+            messages += [
+                AIMessage(content=state.get("sql_query", "")),
+                HumanMessage(content=f"Sua query retornou com esse erro: {query_error}. Por favor, corrija."),
+            ]
 
-        sql_query = llm_response.content.strip()
+        # 🔹 No modo especulativo, pedimos N candidatas em paralelo e ficamos com a mais barata válida
+        if self.sql_candidates > 1:
+            sql_query, sql_validated = self._pick_sql_candidate(messages)
+        else:
+            llm_response = gateway.invoke(messages, lane="sql")
+            sql_query, sql_validated = llm_response.content.strip(), False
 
         if not sql_query.lower().startswith("select"):
-            return state | {"sql_query": f"Erro: A query gerada não é válida.\nQuery: {sql_query}"}
+            return state | {"sql_query": f"Erro: A query gerada não é válida.\nQuery: {sql_query}", "sql_validated": False}
 
         # 🔹 Adicionamos a resposta do LLM no histórico
-        state["messages"].append(AIMessage(content=sql_query))
+        state["messages"].append(status_message(sql_query))
 
         return state | {
             "sql_query": sql_query,
+            "sql_validated": sql_validated,  # 🔹 Candidatas aprovadas pelo EXPLAIN pulam a validação via LLM
             "query_error": None,  # 🔹 Resetamos o erro após a correção
+            "sql_error": None,
             "retry_generate_sql": False,  # 🔹 Resetamos a flag para evitar loops infinitos
         }
 
+    def sql_prompt(self, user_query: str, table_schemas: dict, column_stats: dict) -> list:
+        """
+        Prefixo estável (regras + esquema) seguido apenas da parte variável, para aproveitar o cache
+        de prompt do provedor. O histórico do chat não entra no prompt de SQL.
+        """
+        schema_context = "\n".join([f"Table {table}: {schema}" for table, schema in table_schemas.items()])
+        return [sql_system_prompt(schema_context, "\n\n".join(column_stats.values())), sql_question_prompt(user_query)]
+
+    def current_column_stats(self) -> dict:
+        """Estatísticas já calculadas, formatadas para o prompt (o profiling nunca bloqueia a pergunta)."""
+        column_stats = {}
+        for table in TABLES:
+            stats = self.profiler.get_stats(table)
+            if stats:
+                column_stats[table] = format_column_stats(table, stats)
+        return column_stats
+
+    def _pick_sql_candidate(self, messages: list) -> tuple:
+        """
+        Gera `sql_candidates` queries diversas em paralelo, valida todas com `EXPLAIN` ao mesmo tempo
+        e retorna `(query, validada)` com a candidata válida de menor custo estimado.
+        Se nenhuma for válida, retorna a primeira candidata para seguir o fluxo normal de validação.
+        """
+        n = self.sql_candidates
+        responses = gateway.batch([messages] * n, lane="sql", coalesce=False, temperature=SQL_CANDIDATES_TEMPERATURE)
+        candidates = list(
+            dict.fromkeys(
+                response.content.strip()
+                for response in responses
+                if not isinstance(response, Exception) and response.content.strip().lower().startswith("select")
+            )
+        )
+
+        if not candidates:
+            first = next((r for r in responses if not isinstance(r, Exception)), None)
+            return (first.content.strip() if first else ""), False
+
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            explained = list(executor.map(self.db.explain_cost, candidates))
+
+        valid = [(cost, query) for query, (cost, _) in zip(candidates, explained) if cost is not None]
+        print(f"🧪 {len(valid)}/{len(candidates)} candidatas SQL válidas no EXPLAIN")
+
+        if not valid:
+            return candidates[0], False
+
+        return min(valid, key=lambda item: item[0])[1], True
+
     def validate_sql(self, state: dict) -> dict:
         """
         Valida a query SQL antes da execução usando `QuerySQLCheckerTool`.
         """
-        state["messages"].append(AIMessage(content="🔎 Validando a query SQL..."))
+        state["messages"].append(status_message("🔎 Validando a query SQL..."))
 
-        query = state.get("sql_query", "")
-        validation_result = self.query_checker.run(query)  # 🔹 Valida a SQL
+        validation_error = self._validation_error(state.get("sql_query", ""))
 
         # 🔹 Se a validação encontrar erro, retorna para gerar uma nova query
-        if "ERROR:" in validation_result or "SQL state" in validation_result:
-            state["messages"].append(AIMessage(content=f"❌ Erro na validação da query: {validation_result}"))
-            return state | {"sql_error": validation_result, "retry_generate_sql": True}
+        if validation_error:
+            state["messages"].append(status_message(f"❌ Erro na validação da query: {validation_error}"))
+            return state | {
+                "sql_error": validation_error,
+                "sql_attempts": state.get("sql_attempts", 0) + 1,
+                "retry_generate_sql": True,
+            }
 
-        state["messages"].append(AIMessage(content="✅ Query SQL validada com sucesso!"))
+        state["messages"].append(status_message("✅ Query SQL validada com sucesso!"))
         return state | {"sql_error": None}  # 🔹 Reseta qualquer erro anterior
 
+    def _validation_error(self, query: str):
+        """Valida a SQL com `QuerySQLCheckerTool`; retorna a mensagem de erro ou `None` se a query for válida."""
+        validation_result = self.query_checker.run(query)
+        if "ERROR:" in validation_result or "SQL state" in validation_result:
+            return validation_result
+        return None
+
     def execute_sql(self, state: dict) -> dict:
         """
         Executa a consulta SQL no banco de dados e retorna os resultados.
         Se houver erro, volta para o LLM como uma nova mensagem de chat pedindo correção.
         """
-        state["messages"].append(AIMessage(content="⏳ Executando a query no banco de dados..."))
+        state["messages"].append(status_message("⏳ Executando a query no banco de dados..."))
 
-        query = state.get("sql_query", "")
-        result = self.db.run_no_throw(query)  # Retorna sempre uma string
-
-        # 🔹 Se a resposta começa com "ERROR:", consideramos uma falha na execução
-        if result.startswith("ERROR:") or "SQL state:" in result:
-            # 🔹 Ao invés de sobrescrever o prompt, adicionamos uma nova mensagem no chat
-            state["messages"].append(
-                HumanMessage(content=f"Sua query retornou com esse erro: {result}. Por favor, corrija-a.")
-            )
+        query, result, columns, rows, approximation = self._run_with_repairs(
+            state.get("sql_query", ""), blobs.get_dict(state.get("table_schemas", {}))
+        )
 
+        if is_error_result(result):
+            # 🔹 O erro segue para `generate_sql`, que pede a correção ao LLM (até `MAX_SQL_RETRIES` vezes)
             return state | {
                 "query_error": result,
+                "query_response": "",
+                "query_columns": [],
+                "query_rows": [],
+                "query_approximation": None,
+                "sql_attempts": state.get("sql_attempts", 0) + 1,
                 "retry_generate_sql": True,  # 🔹 Apenas ativamos se houver erro
             }
 
-        state["messages"].append(AIMessage(content="✅ Consulta SQL executada com sucesso."))
+        state["messages"].append(status_message("✅ Consulta SQL executada com sucesso."))
+        self._record_question(state, query)
 
         return state | {
-            "query_response": result,
+            "sql_query": query,  # 🔹 Guarda a versão efetivamente executada (com eventuais correções locais)
+            "query_response": blobs.put(result),
+            "query_columns": columns,
+            "query_rows": [[_json_safe(value) for value in row] for row in rows] if len(rows) <= MAX_STORED_ROWS else [],
+            "query_approximation": approximation,
+            "query_error": None,
             "retry_generate_sql": False,  # 🔹 Resetamos para evitar loops
         }
 
+    def _record_question(self, state: dict, query: str):
+        """Registra a pergunta do usuário (como foi digitada) e a SQL que a respondeu, para o aquecimento."""
+        question = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), None)
+        if isinstance(question, str):
+            try:
+                record_question(question, query)
+            except Exception as e:
+                print("⚠️ Erro ao registrar a pergunta:", str(e))
+
+    def _run_with_repairs(self, query: str, table_schemas: dict):
+        """
+        Executa a query e, antes de voltar ao LLM, tenta corrigir localmente as classes de erro conhecidas.
+        Retorna `(query_executada, resultado, colunas, linhas, aproximação)`.
+        """
+        result, columns, rows, approximation = self._run_query(query)
+        for _ in range(MAX_LOCAL_REPAIRS):
+            if not is_error_result(result):
+                break
+
+            repaired = repair_sql(query, result, table_schemas)
+            if not repaired:
+                break
+
+            print(f"🔧 Query corrigida localmente:\n{repaired}")
+            query = repaired
+            result, columns, rows, approximation = self._run_query(query)
+        return query, result, columns, rows, approximation
+
+    def _run_query(self, query: str):
+        """
+        Executa a query e retorna `(resultado, colunas, linhas, aproximação)`.
+        O resultado é a string usada no prompt (ou a mensagem de erro, como em `run_no_throw`).
+        No modo aproximado (`configurable.approximate`), a aproximação descreve a amostra usada.
+        """
+        # 🔹 Em lotes, queries repetidas entre perguntas são executadas uma única vez
+        cache = current_result_cache()
+        try:
+            columns, rows, approximation = cache.fetch(query, self._fetch) if cache else self._fetch(query)
+        except RunCancelled:
+            raise
+        except Exception as e:
+            return f"Error: {e}", [], [], None
+        return (str(rows) if rows else ""), columns, rows, approximation
+
+    def _fetch(self, query: str):
+        """`(colunas, linhas, aproximação)`, pela amostra quando a execução pediu o modo aproximado."""
+        percent = approximate_percent()
+        if percent:
+            return self.db.fetch_approximate(query, percent)
+        return (*self.db.fetch(query), None)
+
     def generate_answer(self, state: dict) -> dict:
         """
         Gera a resposta final para o usuário baseada na consulta SQL e nos dados retornados.
         """
-        state["messages"].append(AIMessage(content="✅ Processando os resultados da consulta..."))
+        state["messages"].append(status_message("✅ Processando os resultados da consulta..."))
 
         sql_query = state.get("sql_query", "")
-        query_response = state.get("query_response", [])
+        query_response = blobs.get(state.get("query_response", []))
 
         if not query_response or "Erro" in query_response[0]:
             return state | {"final_answer": "❌ Desculpe, não foi possível obter uma resposta."}
 
-        answer_prompt = format_answer_prompt(state["user_query"], sql_query, query_response)
-        final_answer = model.invoke([HumanMessage(content=answer_prompt)]).content.strip()
+        # 🔹 Resultados escalares e pequenos rankings são formatados por template, sem chamar o LLM
+        approximation = state.get("query_approximation")
+        final_answer = render_answer(
+            state["user_query"],
+            state.get("query_columns", []),
+            state.get("query_rows", []),
+            state.get("query_intent"),
+            approximation=approximation,
+        )
+
+        if final_answer is None:
+            answer_prompt = format_answer_prompt(state["user_query"], sql_query, query_response, approximation)
+            final_answer = gateway.invoke([answer_system_prompt(), answer_prompt], lane="answer").content.strip()
 
         state["messages"].append(AIMessage(content=final_answer))
 
@@ -213,7 +534,7 @@ class EcommerceAgent:
     def choose_visualization(self, state: dict) -> dict:
         """Choose an appropriate visualization for the data."""
         user_query = state["user_query"]
-        query_response = state["query_response"]
+        query_response = blobs.get(state["query_response"])
         sql_query = state["sql_query"]
 
         # 🔹 Se query_response estiver vazio ou tiver menos de 3 registros, não precisa de visualização
@@ -231,7 +552,7 @@ class EcommerceAgent:
             user_query=user_query, sql_query=sql_query, query_response=query_response
         )
 
-        response = model.invoke(formatted_prompt)
+        response = gateway.invoke(formatted_prompt, lane="visualization")
 
         # 🔹 Garantindo que response é um objeto AIMessage e acessando seu conteúdo
         response_text = response.content if hasattr(response, "content") else str(response)
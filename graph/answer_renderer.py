@@ -0,0 +1,173 @@
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+# Maior resultado tabular renderizado por template (acima disso, o LLM resume)
+MAX_TEMPLATE_ROWS = 10
+MAX_TEMPLATE_COLUMNS = 4
+
+_CURRENCY_COLUMNS = re.compile(
+    r"revenue|faturamento|receita|valor|value|price|preco|preço|ticket|commission|comiss|gasto|frete|shipping|total_sales",
+    re.IGNORECASE,
+)
+_COUNT_COLUMNS = re.compile(
+    r"count|quantidade|quantity|qtd|qtde|pedidos|orders|itens|items|numero|número", re.IGNORECASE
+)
+_PERCENT_COLUMNS = re.compile(r"percent|pct|proporc|porcent|share|taxa|ratio", re.IGNORECASE)
+# Colunas de razão (fração em [0, 1]); `percent`/`pct` já vêm em pontos percentuais
+_RATIO_COLUMNS = re.compile(r"proporc|share|taxa|ratio|fracao|fração", re.IGNORECASE)
+_CURRENCY_METRICS = re.compile(r"faturamento|receita|valor|ticket|gasto|comiss|preço|preco|frete", re.IGNORECASE)
+_RAW_COLUMNS = re.compile(r"^id|(^|_)(id|ano|year|mes|month|dia|day|cep|sku)($|_)", re.IGNORECASE)
+# Nomes que o Postgres dá às agregações sem alias
+_AGGREGATE_LABELS = {
+    "sum": "Soma",
+    "avg": "Média",
+    "count": "Quantidade",
+    "min": "Mínimo",
+    "max": "Máximo",
+    "total": "Total",
+}
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?")
+
+# Perguntas abertas continuam com o LLM, mesmo quando o resultado é pequeno
+_NARRATIVE_QUESTION = re.compile(
+    r"por que|porque|explique|explica|analis|tendência|tendencia|insight|recomend|sugest|compar|avali|interpret",
+    re.IGNORECASE,
+)
+
+
+def _group_thousands(integer_part: str) -> str:
+    return "{:,}".format(int(integer_part)).replace(",", ".")
+
+
+def format_number(value: float, decimals: int = 2) -> str:
+    """Formata um número no padrão pt-BR: `1234567.8` → `1.234.567,80`."""
+    negative = value < 0
+    integer_part, _, fraction = f"{abs(value):.{decimals}f}".partition(".")
+    formatted = _group_thousands(integer_part) + (f",{fraction}" if decimals else "")
+    return f"-{formatted}" if negative else formatted
+
+
+def format_brl(value: float) -> str:
+    """Formata um valor monetário em reais: `1200` → `R$ 1.200,00`."""
+    formatted = format_number(abs(value), 2)
+    return f"-R$ {formatted}" if value < 0 else f"R$ {formatted}"
+
+
+def format_percent(value: float, ratio: bool = False) -> str:
+    """Formata um percentual: `12.5` → `12,5%`; com `ratio`, o valor é uma fração (`0.125` → `12,5%`)."""
+    percent = value * 100 if ratio else value
+    return f"{format_number(percent, 1)}%"
+
+
+def format_date(value: Any) -> str:
+    """Formata datas no padrão `DD/MM/AAAA` (com `HH:MM` quando houver horário diferente de meia-noite)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and (value.hour or value.minute):
+        return value.strftime("%d/%m/%Y %H:%M")
+    return value.strftime("%d/%m/%Y")
+
+
+def _is_date(value: Any) -> bool:
+    return isinstance(value, (date, datetime)) or (isinstance(value, str) and bool(_ISO_DATE.match(value)))
+
+
+def _label(column: str) -> str:
+    """Transforma o nome da coluna em rótulo legível: `total_revenue` → `Total revenue`, `avg` → `Média`."""
+    if column.lower() in _AGGREGATE_LABELS:
+        return _AGGREGATE_LABELS[column.lower()]
+    label = column.replace("_", " ").strip()
+    return label[:1].upper() + label[1:]
+
+
+def format_value(column: str, value: Any, currency_metric: bool = False) -> str:
+    """Formata um valor de acordo com o tipo e o nome da coluna."""
+    if value is None:
+        return "—"
+    if isinstance(value, bool):
+        return "Sim" if value else "Não"
+    if _is_date(value):
+        try:
+            return format_date(value)
+        except ValueError:
+            return str(value)
+    if isinstance(value, (int, float, Decimal)):
+        # 🔹 Identificadores, anos e meses não recebem separador de milhar
+        if _RAW_COLUMNS.search(column):
+            return str(value)
+        value = float(value)
+        if _PERCENT_COLUMNS.search(column):
+            return format_percent(value, ratio=bool(_RATIO_COLUMNS.search(column)))
+        if _CURRENCY_COLUMNS.search(column):
+            return format_brl(value)
+        if _COUNT_COLUMNS.search(column):
+            return format_number(value, 0)
+        # 🔹 Métrica monetária antes do teste de inteiro: `SUM(...)` = 1200 é `R$ 1.200,00`, não `1.200`
+        if currency_metric:
+            return format_brl(value)
+        return format_number(value, 0) if value.is_integer() else format_number(value, 2)
+    return str(value)
+
+
+def approximation_note(approximation: Dict[str, Any]) -> str:
+    """Aviso de resultado estimado por amostra (modo aproximado, ver `approximate.py`)."""
+    percent = f"{approximation['sample_percent']:g}".replace(".", ",")
+    if approximation.get("margin") is None:
+        # 🔹 Somas e médias: a margem depende da variância dos valores, que a amostragem não mede
+        return f"Valores estimados a partir de uma amostra de {percent}% dos dados (sem margem de erro calculada)."
+    margin = format_number(approximation["margin"] * 100, 1)
+    return (
+        f"Valores estimados a partir de uma amostra de {percent}% dos dados "
+        f"(margem de erro de ±{margin}%, com 95% de confiança)."
+    )
+
+
+def render_answer(
+    user_query: str,
+    columns: List[str],
+    rows: List[List[Any]],
+    intent: Optional[Dict[str, Any]] = None,
+    approximation: Optional[Dict[str, Any]] = None,
+) -> Optional[str]:
+    """
+    Renderiza a resposta final sem LLM para resultados escalares e pequenos rankings (top N).
+    Retorna `None` quando a pergunta pede uma resposta narrativa ou o resultado não cabe nos templates.
+    Resultados do modo aproximado terminam com o aviso da amostragem.
+    """
+    answer = _render_template(user_query, columns, rows, intent)
+    if answer is not None and approximation:
+        answer += f"\n\n_{approximation_note(approximation)}_"
+    return answer
+
+
+def _render_template(
+    user_query: str, columns: List[str], rows: List[List[Any]], intent: Optional[Dict[str, Any]]
+) -> Optional[str]:
+    if not columns or not rows or _NARRATIVE_QUESTION.search(user_query or ""):
+        return None
+    if len(rows) > MAX_TEMPLATE_ROWS or len(columns) > MAX_TEMPLATE_COLUMNS:
+        return None
+
+    currency_metric = bool(_CURRENCY_METRICS.search((intent or {}).get("metric") or user_query or ""))
+
+    def fmt(column, value):
+        return format_value(column, value, currency_metric)
+
+    # 🔹 Resultado escalar: um único número/data
+    if len(rows) == 1 and len(columns) == 1:
+        return f"{_label(columns[0])}: {fmt(columns[0], rows[0][0])}"
+
+    # 🔹 Uma linha com várias métricas
+    if len(rows) == 1:
+        return "\n".join(f"- {_label(column)}: {fmt(column, value)}" for column, value in zip(columns, rows[0]))
+
+    # 🔹 Ranking / lista curta: a primeira coluna identifica o item e as demais são métricas
+    lines = []
+    for i, row in enumerate(rows, start=1):
+        item = fmt(columns[0], row[0])
+        metrics = ", ".join(f"{_label(column)}: {fmt(column, value)}" for column, value in zip(columns[1:], row[1:]))
+        lines.append(f"{i}. {item}" + (f" — {metrics}" if metrics else ""))
+
+    return "\n".join(lines)
@@ -12,9 +12,19 @@ to show that you can add custom routes to a langgraph deployment so you can do t
 stream responses or add a custom UI.
 """
 
+import asyncio
+import json
+import os
+import sys
 import uuid
-from typing import AsyncGenerator, Dict
-
+from typing import Any, AsyncGenerator, Dict, List
+
+from answer_renderer import format_value
+from batch import BATCH_CONCURRENCY, MAX_BATCH_SIZE, run_batch
+from cancellation import cancel_run
+from cancellation import metrics as cancellation_metrics
+from database import PostgresDB
+from export import EXPORT_CHUNK_SIZE, csv_chunks, export_query, parquet_chunks, pq
 from fasthtml.common import (  # type: ignore
     H2,
     A,
@@ -25,15 +35,45 @@ from fasthtml.common import (  # type: ignore
     Input,
     Link,
     Script,
+    Table,
+    Tbody,
+    Td,
+    Th,
+    Thead,
     Title,
+    Tr,
     picolink,
+    to_xml,
 )
 from fasthtml.core import Request  # type: ignore
+from history import history_page, visible_messages
 from langgraph_sdk import get_client
-from starlette.responses import RedirectResponse, StreamingResponse
+from mirror import is_read_only
+from pagination import is_pageable, next_page
+from sidebar_cache import ThreadListCache
+from sse import DeltaTracker, RunStreamRegistry
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+
+# Initialize the LangGraph client. With EMBEDDED_GRAPH=true the compiled graph runs inside this process
+# (single-box deployments), skipping the HTTP hop to the LangGraph API server.
+EMBEDDED = os.getenv("EMBEDDED_GRAPH", "false").lower() == "true"
+if EMBEDDED:
+    from embedded import get_embedded_client
+
+    langgraph_client = get_embedded_client()
+else:
+    langgraph_client = get_client()
+
+# Database connection used by the "show more" pagination (created on first use)
+_db: PostgresDB | None = None
+
 
-# Initialize the LangGraph client
-langgraph_client = get_client()
+def get_db() -> PostgresDB:
+    """Return the shared database connection, creating it on first use."""
+    global _db
+    if _db is None:
+        _db = PostgresDB()
+    return _db
 
 # Define HTML headers for styling and client-side functionality
 tlink = (Script(src="https://cdn.tailwindcss.com"),)
@@ -274,7 +314,27 @@ fonts = Link(
     rel="stylesheet",
     href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600&display=swap",
 )
-app = FastHTML(hdrs=(tlink, dlink, picolink, sselink, custom_styles, fonts), live=True)
+
+
+async def start_graph_services():
+    """
+    Server startup for the process that runs the graph (LangGraph API server or embedded mode):
+    warm up caches and connections, then start the snapshot scheduler.
+    """
+    if not (EMBEDDED or "langgraph_api" in sys.modules):
+        return  # 🔹 Standalone UI talking to a remote server: the graph is not loaded in this process
+    from runtime import get_agent, served_graph
+    from snapshots import start_snapshot_scheduler
+    from warmup import warmup
+
+    # The server loads workflow.py under its own module name; `runtime` hands out the agent and graph it serves
+    await asyncio.to_thread(warmup, get_agent())
+    start_snapshot_scheduler(served_graph())
+
+
+app = FastHTML(
+    hdrs=(tlink, dlink, picolink, sselink, custom_styles, fonts), live=True, on_startup=[start_graph_services]
+)
 
 
 def get_user_id(request: Request) -> str:
@@ -388,38 +448,69 @@ def ChatInputBubble(thread_id: str) -> Div:
     )
 
 
-async def ConversationList(user_id: str, current_thread_id: str) -> Div:
-    """Render the sidebar list of conversations.
+SIDEBAR_PAGE_SIZE = int(os.getenv("SIDEBAR_PAGE_SIZE", "20"))
+thread_cache = ThreadListCache(ttl=float(os.getenv("THREAD_LIST_CACHE_TTL", "60")))
+
+
+async def list_threads(user_id: str, cursor: int) -> list:
+    """Return one page of the user's threads, from the cache when possible."""
+    threads = thread_cache.get(user_id, cursor)
+    if threads is None:
+        threads = await langgraph_client.threads.search(
+            metadata={"user_id": user_id}, limit=SIDEBAR_PAGE_SIZE, offset=cursor
+        )
+        thread_cache.put(user_id, cursor, threads)
+    return threads
 
-    Shows all threads for the user with the current thread highlighted.
-    """
-    threads = await langgraph_client.threads.search(
-        metadata={"user_id": user_id}, limit=50, offset=0
-    )
 
+def ThreadPage(threads: list, cursor: int, current_thread_id: str) -> tuple:
+    """Render one page of sidebar entries, followed by a sentinel that loads the next page when scrolled into view."""
+    links = [
+        A(
+            Div(
+                Div(f"Thread {cursor + i + 1}", cls="font-medium text-sm"),
+                Div(f"{thread['created_at']}", cls="text-xs text-gray-500"),
+                cls="flex flex-col",
+            ),
+            href=f"/conversations/{thread['thread_id']}",
+            cls="block px-4 py-3 my-1.5 rounded-xl transition-all duration-200 hover:bg-gray-100"
+            + (
+                " bg-purple-100 border-l-4 border-purple-500"
+                if thread["thread_id"] == current_thread_id
+                else ""
+            ),
+        )
+        for i, thread in enumerate(threads)
+    ]
+    if len(threads) == SIDEBAR_PAGE_SIZE:
+        links.append(
+            Div(
+                "Loading…",
+                hx_get=f"/sidebar?cursor={cursor + SIDEBAR_PAGE_SIZE}&current={current_thread_id}",
+                hx_trigger="revealed",
+                hx_swap="outerHTML",
+                cls="px-4 py-3 text-xs text-gray-400",
+            )
+        )
+    return tuple(links)
+
+
+def ConversationList(current_thread_id: str) -> Div:
+    """Render the sidebar shell.
+
+    The thread list itself is loaded lazily from `/sidebar`, so it never delays the page.
+    """
     return Div(
         Div(
             H2("Threads", cls="text-xl font-medium text-langchain-green mb-4"),
             cls="flex items-center h-[69px] px-6 border-b border-gray-200 bg-white/90 sticky top-0 z-10",
         ),
         Div(
-            *[
-                A(
-                    Div(
-                        Div(f"Thread {i+1}", cls="font-medium text-sm"),
-                        Div(f"{thread['created_at']}", cls="text-xs text-gray-500"),
-                        cls="flex flex-col",
-                    ),
-                    href=f"/conversations/{thread['thread_id']}",
-                    cls="block px-4 py-3 my-1.5 rounded-xl transition-all duration-200 hover:bg-gray-100"
-                    + (
-                        " bg-purple-100 border-l-4 border-purple-500"
-                        if thread["thread_id"] == current_thread_id
-                        else ""
-                    ),
-                )
-                for i, thread in enumerate(threads)
-            ],
+            Div(
+                hx_get=f"/sidebar?cursor=0&current={current_thread_id}",
+                hx_trigger="load",
+                hx_swap="outerHTML",
+            ),
             cls="overflow-y-auto h-[calc(100vh-5rem)] px-2",
         ),
         id="sidebar",
@@ -427,39 +518,47 @@ async def ConversationList(user_id: str, current_thread_id: str) -> Div:
     )
 
 
+@app.get("/sidebar")  # type: ignore[misc]
+async def sidebar(request: Request, cursor: int = 0, current: str = ""):
+    """HTMX fragment with one page of the user's threads (cursor = position in the list)."""
+    threads = await list_threads(get_user_id(request), cursor)
+    return ThreadPage(threads, cursor, current)
+
+
 @app.get("/")  # type: ignore
 async def root(request: Request):
     """Root index for redirecting to a new conversation."""
     thread_id = str(uuid.uuid4())
     user_id = get_user_id(request)
-    response = RedirectResponse(f"/conversations/{thread_id}", status_code=302)
+    response = RedirectResponse(f"/conversations/{thread_id}?new=true", status_code=302)
     response.set_cookie(key="user_id", value=user_id, httponly=True)
     return response
 
 
 @app.get("/conversations/{thread_id}")  # type: ignore[misc]
-async def conversation(thread_id: str, request: Request):
+async def conversation(thread_id: str, request: Request, new: bool = False):
     """Display the chat interface for a specific conversation.
 
-    Shows message history and handles new message streaming.
+    Shows message history and handles new message streaming. `new` is set by the routes that mint the thread id.
     """
     user_id = get_user_id(request)
 
-    # Create thread with user_id in metadata
-    await langgraph_client.threads.create(
-        thread_id=thread_id, if_exists="do_nothing", metadata={"user_id": user_id}
+    # Create the thread (with user_id in metadata) and fetch its state in a single round trip
+    _, state = await asyncio.gather(
+        langgraph_client.threads.create(
+            thread_id=thread_id, if_exists="do_nothing", metadata={"user_id": user_id}
+        ),
+        langgraph_client.threads.get_state(thread_id),
+        return_exceptions=True,
     )
 
-    # Fetch thread state
-    try:
-        state = await langgraph_client.threads.get_state(thread_id)
-        values = state["values"]
-        if isinstance(values, list):
-            messages = values[-1]["messages"]
-        else:
-            messages = values["messages"]
-    except Exception:
-        messages = []
+    # The thread was just created: drop the cached sidebar so it shows up right away
+    if new:
+        thread_cache.invalidate(user_id)
+
+    # Only the last page of user-facing messages is rendered; older ones load on demand
+    messages = visible_messages(messages_from_state(state))
+    page, start = history_page(messages)
 
     # Define the "New Thread" button as a regular link
     new_thread_button = A(
@@ -479,7 +578,7 @@ async def conversation(thread_id: str, request: Request):
             cls="flex justify-between items-center py-4 px-6 bg-white border-b border-gray-200 shadow-sm sticky top-0 z-10",
         ),
         Div(
-            *[ChatMessage(msg, i) for i, msg in enumerate(messages)],
+            *HistoryPage(thread_id, page, start),
             id="chatlist",
             cls="chat-box h-[calc(100vh-10rem)] overflow-y-auto px-6 py-6 bg-gradient-to-br from-purple-50 to-green-50",
         ),
@@ -488,7 +587,7 @@ async def conversation(thread_id: str, request: Request):
     )
 
     page = Div(
-        await ConversationList(user_id, thread_id),
+        ConversationList(thread_id),
         Div(
             "",
             id="sidebar-resizer",
@@ -505,6 +604,52 @@ async def conversation(thread_id: str, request: Request):
     )
 
 
+def messages_from_state(state: Any) -> list:
+    """Extract the message list from a `threads.get_state` result (empty for a brand-new thread)."""
+    try:
+        values = state["values"]
+        if isinstance(values, list):
+            return values[-1]["messages"]
+        return values["messages"]
+    except Exception:
+        # A brand-new thread has no state yet (get_state may fail or race with create)
+        return []
+
+
+def HistoryPage(thread_id: str, messages: list, start: int) -> tuple:
+    """Render a page of history, preceded by a "load older" control when earlier messages exist.
+
+    Message ids use the position in the visible history, so they stay unique across pages.
+    """
+    older = (
+        Div(
+            Button(
+                "Carregar mensagens anteriores",
+                hx_get=f"/conversations/{thread_id}/history?before={start}",
+                hx_target="closest div",
+                hx_swap="outerHTML",
+                cls="rounded-full px-3 py-1 text-xs font-medium text-gray-500 border border-gray-300 hover:bg-gray-100",
+            ),
+            cls="flex justify-center py-2",
+        )
+        if start > 0
+        else None
+    )
+    return (older, *[ChatMessage(msg, start + i) for i, msg in enumerate(messages)])
+
+
+@app.get("/conversations/{thread_id}/history")  # type: ignore[misc]
+async def history(thread_id: str, before: int):
+    """HTMX fragment with the page of messages preceding position `before`, replacing the "load older" control."""
+    try:
+        state = await langgraph_client.threads.get_state(thread_id)
+    except Exception:
+        state = None
+
+    page, start = history_page(visible_messages(messages_from_state(state)), before)
+    return HistoryPage(thread_id, page, start)
+
+
 @app.get("/new-thread")  # type: ignore[misc]
 async def new_thread(request: Request):
     """Create a new conversation thread.
@@ -513,7 +658,7 @@ async def new_thread(request: Request):
     """
     thread_id = str(uuid.uuid4())
     user_id = get_user_id(request)
-    response = RedirectResponse(f"/conversations/{thread_id}", status_code=302)
+    response = RedirectResponse(f"/conversations/{thread_id}?new=true", status_code=302)
     response.set_cookie(key="user_id", value=user_id, httponly=True)
     return response
 
@@ -544,8 +689,12 @@ def AssistantMessagePlaceholder(thread_id: str, run_id: str) -> Div:
                         cls="flex space-x-1 px-4 py-3",
                     ),
                     id=content_id,
-                    cls="px-4 py-3 rounded-2xl rounded-tl-sm bg-message-assistant border border-green-200 text-black shadow-sm",
+                    cls="px-4 py-3 rounded-2xl rounded-tl-sm bg-message-assistant border border-green-200 text-black shadow-sm whitespace-pre-line",
                 ),
+                # Appends `delta` events (new text only) to the message being displayed
+                Div(sse_swap="delta", hx_target=f"#{content_id}", hx_swap="beforeend", cls="hidden"),
+                # Filled with the "show more" button and export links once the answer is complete
+                Div(sse_swap="actions", hx_target="this", hx_swap="innerHTML"),
                 cls="flex flex-col",
             ),
             cls="flex items-start max-w-[80%]",
@@ -555,6 +704,7 @@ def AssistantMessagePlaceholder(thread_id: str, run_id: str) -> Div:
         hx_ext="sse",
         sse_connect=f"/conversations/{thread_id}/get-message?run_id={run_id}",
         sse_swap="message",
+        sse_close="close",
         hx_target=f"#{content_id}",
         hx_swap="innerHTML",
     )
@@ -575,52 +725,273 @@ async def send_message(request: Request, thread_id: str):
     user_msg_div = ChatMessage(
         {"type": "human", "content": msg}, f"user-{uuid.uuid4()}"
     )
+    # A new message supersedes the run still in progress on this thread
+    previous_run_id = active_runs.get(thread_id)
+    if previous_run_id:
+        await asyncio.to_thread(cancel_run, previous_run_id)
+
     run = await langgraph_client.runs.create(
         thread_id=thread_id,
         assistant_id="agent",
         input={"messages": [{"type": "human", "content": msg}]},
+        multitask_strategy="interrupt",
     )
     run_id = run["run_id"]
+    active_runs[thread_id] = run_id
     assistant_placeholder = AssistantMessagePlaceholder(thread_id, run_id)
     return user_msg_div, assistant_placeholder
 
 
-async def message_generator(thread_id: str, run_id: str) -> AsyncGenerator[str, None]:
-    """Stream assistant responses via SSE.
+# Runs followed by this process, with their replay buffers for Last-Event-ID resumes
+run_streams = RunStreamRegistry()
 
-    Yields message chunks as they are received from the LangGraph agent.
+# Last run started on each thread (superseded when the user sends a new message)
+active_runs: Dict[str, str] = {}
+
+
+async def run_events(thread_id: str, run_id: str) -> AsyncGenerator[tuple[str, str], None]:
+    """Translate the agent's stream into incremental UI events.
+
+    Only new content is emitted: a `message` event when a new message is displayed and `delta` events with the
+    text appended to it. Unchanged messages repeated across graph steps are not re-sent.
     """
+    tracker = DeltaTracker()
     async for chunk in langgraph_client.runs.join_stream(thread_id, run_id):
-        if chunk.event == "messages":
-            for chunk_msg in chunk.data:
-                content = chunk_msg.get("content", "")
-                if content and content.strip():
-                    yield f"event: message\ndata: {content}\n\n"
-        elif chunk.event == "values":
-            last_msg = chunk.data["messages"][-1]
-            if last_msg.get("type") != "ai":
-                continue
-            content = last_msg.get("content", "")
-            if isinstance(content, list):
-                content = "".join(
-                    c["text"] for c in content if isinstance(c, dict) and c.get("text")
-                )
-            content = content.strip()
-            if content:
-                yield f"event: message\ndata: {content}\n\n"
-
-    yield "event: close\ndata:\n\n"
+        if chunk.event.startswith("messages"):
+            events = tracker.feed_partial(chunk.data if isinstance(chunk.data, list) else [])
+        elif chunk.event == "values" and isinstance(chunk.data, dict):
+            events = tracker.feed_values(chunk.data)
+        else:
+            events = []
+        for event in events:
+            yield event
+
+    # Offer the next page and the full-result export when the answer came from a SQL query
+    try:
+        values = (await langgraph_client.threads.get_state(thread_id))["values"]
+    except Exception:
+        values = {}
+    if isinstance(values, dict) and values.get("is_relevant") and values.get("sql_query"):
+        yield "actions", to_xml(ResultActions(thread_id, values["sql_query"])).replace("\n", "")
+
+
+async def cancel_abandoned_run(thread_id: str, run_id: str) -> None:
+    """Cancel a run nobody is watching anymore (tab closed and no reconnect within the grace period)."""
+    print(f"🛑 Cancelando a execução {run_id}: nenhum cliente conectado")
+    await asyncio.to_thread(cancel_run, run_id)
+    try:
+        await langgraph_client.runs.cancel(thread_id, run_id)
+    except Exception as e:
+        print("⚠️ Não foi possível cancelar a execução no servidor:", str(e))
+    if active_runs.get(thread_id) == run_id:
+        del active_runs[thread_id]
+
+
+async def message_generator(thread_id: str, run_id: str, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+    """Stream assistant responses via SSE.
+
+    The run is consumed once into a replay buffer; every connection (including browser reconnects carrying
+    Last-Event-ID) reads from it. If the buffer is gone (e.g. after a restart), the run is re-joined and the
+    first event re-sends the full current message.
+    """
+    stream = run_streams.get(run_id)
+    if stream is None:
+        stream = run_streams.start(
+            run_id,
+            run_events(thread_id, run_id),
+            first_id=last_event_id + 1,
+            on_abandoned=lambda: cancel_abandoned_run(thread_id, run_id),
+        )
+
+    async for frame in stream.subscribe(last_event_id):
+        yield frame
 
 
 # Route to stream assistant responses via SSE
 @app.get("/conversations/{thread_id}/get-message")  # type: ignore[misc]
-async def get_message(thread_id: str, run_id: str):
+async def get_message(thread_id: str, run_id: str, request: Request):
     """SSE endpoint for streaming assistant responses.
 
     Sets up proper headers for SSE streaming.
     """
+    try:
+        last_event_id = int(request.headers.get("last-event-id") or 0)
+    except ValueError:
+        last_event_id = 0
+
+    # 204 tells EventSource to stop reconnecting once the client already has the whole run
+    stream = run_streams.get(run_id)
+    if stream is not None and stream.done and last_event_id >= stream.last_id:
+        return Response(status_code=204)
+
     return StreamingResponse(
-        message_generator(thread_id, run_id),
+        message_generator(thread_id, run_id, last_event_id),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"},
+    )
+
+
+def ShowMoreButton(thread_id: str, offset: int) -> Button:
+    """Button that loads the next page of the last result in place."""
+    return Button(
+        "Mostrar mais",
+        hx_get=f"/conversations/{thread_id}/more?offset={offset}",
+        hx_target="this",
+        hx_swap="outerHTML",
+        cls="mt-2 self-start rounded-full px-3 py-1 text-xs font-medium text-langchain-green border border-green-300 hover:bg-green-50",
+    )
+
+
+def ResultActions(thread_id: str, sql_query: str) -> Div:
+    """Actions shown under an answer: "show more" for LIMIT queries and download links for the full result."""
+    link_cls = "text-xs text-gray-500 underline hover:text-langchain-green"
+    return Div(
+        ShowMoreButton(thread_id, next_page(sql_query)[1]) if is_pageable(sql_query) else None,
+        Div(
+            A("CSV", href=f"/conversations/{thread_id}/export.csv", cls=link_cls),
+            A("Parquet", href=f"/conversations/{thread_id}/export.parquet", cls=link_cls) if pq else None,
+            cls="mt-1 flex gap-3",
+        ),
+        cls="flex flex-col",
+    )
+
+
+def ResultPage(thread_id: str, columns: List[str], rows: List[Any], offset: int, has_more: bool) -> Div:
+    """Render one page of rows as a table, followed by the next "show more" button if needed."""
+    return Div(
+        Table(
+            Thead(Tr(Th("#"), *[Th(column) for column in columns])),
+            Tbody(
+                *[
+                    Tr(Td(str(offset + i + 1)), *[Td(format_value(column, value)) for column, value in zip(columns, row)])
+                    for i, row in enumerate(rows)
+                ]
+            ),
+            cls="table table-xs bg-message-assistant border border-green-200 rounded-xl",
+        ),
+        ShowMoreButton(thread_id, offset + len(rows)) if has_more else None,
+        cls="mt-2 flex flex-col",
+    )
+
+
+@app.get("/conversations/{thread_id}/more")  # type: ignore[misc]
+async def show_more(thread_id: str, offset: int | None = None):
+    """Return the next page of the thread's last query, straight from the database (no LLM call).
+
+    The SQL executed by the previous turn is read from the thread state and rewritten with LIMIT/OFFSET.
+    """
+    try:
+        values = (await langgraph_client.threads.get_state(thread_id))["values"]
+        sql_query = values.get("sql_query", "") if isinstance(values, dict) else ""
+    except Exception:
+        sql_query = ""
+
+    if not is_pageable(sql_query):
+        return Div("Não há mais resultados para esta resposta.", cls="mt-2 text-xs text-gray-500")
+
+    page_sql, offset, page_size = next_page(sql_query, offset)
+    try:
+        columns, rows = await asyncio.to_thread(get_db().fetch, page_sql)
+    except Exception as e:
+        print("❌ Erro ao buscar a próxima página:", str(e))
+        return Div("Não foi possível carregar mais resultados.", cls="mt-2 text-xs text-red-500")
+
+    if not rows:
+        return Div("Não há mais resultados para esta resposta.", cls="mt-2 text-xs text-gray-500")
+
+    return ResultPage(thread_id, columns, rows[:page_size], offset, has_more=len(rows) > page_size)
+
+
+async def get_exportable_sql(thread_id: str) -> str:
+    """Return the thread's last SQL without its trailing LIMIT/OFFSET, or "" when it cannot be exported."""
+    try:
+        values = (await langgraph_client.threads.get_state(thread_id))["values"]
+        sql_query = values.get("sql_query", "") if isinstance(values, dict) else ""
+    except Exception:
+        return ""
+    return export_query(sql_query) if sql_query and is_read_only(sql_query) else ""
+
+
+@app.get("/conversations/{thread_id}/export.csv")  # type: ignore[misc]
+async def export_csv(thread_id: str, request: Request):
+    """Stream the full result of the thread's last query as CSV (gzip-compressed when the client accepts it).
+
+    Rows are read through a server-side cursor, so memory stays constant regardless of the result size.
+    """
+    sql_query = await get_exportable_sql(thread_id)
+    if not sql_query:
+        return Response("No query to export for this thread.", status_code=404)
+
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": f'attachment; filename="{thread_id}.csv"'}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    # Starlette iterates synchronous generators in a thread pool, so the DB cursor never blocks the event loop
+    return StreamingResponse(
+        csv_chunks(get_db(), sql_query, EXPORT_CHUNK_SIZE, gzip=use_gzip),
+        media_type="text/csv; charset=utf-8",
+        headers=headers,
+    )
+
+
+@app.get("/conversations/{thread_id}/export.parquet")  # type: ignore[misc]
+async def export_parquet(thread_id: str):
+    """Export the full result of the thread's last query as Parquet, written batch by batch to a temp file."""
+    if pq is None:
+        return Response("Parquet export requires pyarrow.", status_code=501)
+
+    sql_query = await get_exportable_sql(thread_id)
+    if not sql_query:
+        return Response("No query to export for this thread.", status_code=404)
+
+    return StreamingResponse(
+        parquet_chunks(get_db(), sql_query, EXPORT_CHUNK_SIZE),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{thread_id}.parquet"'},
+    )
+
+
+@app.post("/batch")  # type: ignore[misc]
+async def batch(request: Request):
+    """Answer a list of questions, streaming one JSON line per question as it finishes.
+
+    Body: `{"questions": [...], "concurrency": 8}`. The last line is `{"stats": ...}` with throughput and
+    latency for the whole batch. Questions run in this process through the compiled graph, sharing its
+    schema cache and a per-batch SQL result cache; closing the connection cancels the remaining questions.
+    """
+    try:
+        body = await request.json()
+        questions = [str(q).strip() for q in body.get("questions", []) if str(q).strip()]
+        concurrency = max(1, min(int(body.get("concurrency", BATCH_CONCURRENCY)), BATCH_CONCURRENCY))
+    except (ValueError, TypeError, AttributeError):
+        return JSONResponse({"error": "Expected a JSON body with a 'questions' list."}, status_code=400)
+
+    if not questions:
+        return JSONResponse({"error": "No questions given."}, status_code=400)
+    if len(questions) > MAX_BATCH_SIZE:
+        return JSONResponse({"error": f"At most {MAX_BATCH_SIZE} questions per batch."}, status_code=413)
+
+    async def lines():
+        async for result in run_batch(questions, concurrency):
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics")  # type: ignore[misc]
+async def metrics():
+    """Operational counters: work reclaimed by cancellations and LLM gateway statistics."""
+    from llm import gateway
+
+    return JSONResponse(
+        {
+            "cancellation": cancellation_metrics.snapshot(),
+            "llm": {
+                "latency": gateway.latency.snapshot(),
+                "prompt_cache": gateway.cache_stats.summary(),
+                "hedges_fired": gateway.hedges_fired,
+                "hedges_won": gateway.hedges_won,
+            },
+        }
     )
@@ -0,0 +1,185 @@
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from mirror import MIRRORED_TABLES, is_read_only
+
+# Percentual de blocos lidos no modo aproximado (`TABLESAMPLE SYSTEM`)
+APPROXIMATE_SAMPLE_PERCENT = float(os.getenv("APPROXIMATE_SAMPLE_PERCENT", "10"))
+
+# Amostras com menos linhas que isso são descartadas e a query roda de forma exata
+APPROXIMATE_MIN_SAMPLE_ROWS = int(os.getenv("APPROXIMATE_MIN_SAMPLE_ROWS", "1000"))
+
+# Tabelas grandes o bastante para compensar a amostragem
+APPROXIMATE_TABLES = tuple(MIRRORED_TABLES)
+
+# Coluna auxiliar com o número de linhas amostradas por grupo (removida do resultado)
+SAMPLE_COLUMN = "__linhas_amostradas"
+
+# Quantil da normal para o intervalo de 95%
+_Z_95 = 1.96
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SCALED = re.compile(r"\b(COUNT|SUM)\s*\(", re.IGNORECASE)
+_FILTER = re.compile(r"\s*FILTER\s*\(", re.IGNORECASE)
+_FROM = re.compile(
+    r'\bFROM\s+(?P<table>(?:"?\w+"?\.)?"?(?P<name>\w+)"?)(?:\s+(?:AS\s+)?(?P<alias>"?\w+"?))?', re.IGNORECASE
+)
+
+# 🔹 Agregações que não podem ser estimadas por amostra (extremos, distintos, percentis) e construções
+# em que a escala mudaria o resultado (HAVING com limiares, janelas sobre totais, subqueries e joins)
+_INELIGIBLE = re.compile(
+    r"\b(MIN|MAX|STDDEV\w*|VARIANCE|VAR_\w+|PERCENTILE_\w+|MODE|STRING_AGG|ARRAY_AGG|JSON\w*_AGG|BOOL_\w+|EVERY)\s*\("
+    r"|\b(DISTINCT|HAVING|OVER|JOIN|UNION|INTERSECT|EXCEPT|TABLESAMPLE|WITH)\b",
+    re.IGNORECASE,
+)
+_RESERVED = {"where", "group", "order", "limit", "offset", "fetch", "for", "window"}
+_CLAUSE = re.compile(r"\b(?:" + "|".join(sorted(_RESERVED)) + r")\b", re.IGNORECASE)
+
+
+def approximate_percent() -> Optional[float]:
+    """
+    Percentual de amostragem pedido para a execução em andamento (`configurable.approximate`), ou `None`.
+    `true` usa `APPROXIMATE_SAMPLE_PERCENT`; um número define o percentual.
+    """
+    try:
+        from langgraph.config import get_config
+
+        value = get_config().get("configurable", {}).get("approximate")
+    except (ImportError, RuntimeError):
+        return None
+
+    if not value:
+        return None
+    percent = APPROXIMATE_SAMPLE_PERCENT if value is True else float(value)
+    return percent if 0 < percent < 100 else None
+
+
+def _mask_literals(sql: str) -> str:
+    """Substitui o conteúdo das strings literais por espaços, preservando as posições."""
+    return _LITERAL.sub(lambda m: "'" + " " * (len(m.group()) - 2) + "'", sql)
+
+
+def _depth(sql: str, position: int) -> int:
+    """Nível de parênteses em `position`."""
+    return sql.count("(", 0, position) - sql.count(")", 0, position)
+
+
+def _closing_paren(sql: str, start: int) -> int:
+    """Posição logo após o parêntese que fecha o aberto em `start - 1`."""
+    depth = 1
+    for i in range(start, len(sql)):
+        if sql[i] == "(":
+            depth += 1
+        elif sql[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    raise ValueError("parênteses desbalanceados")
+
+
+def _bare_item(sql: str, start: int, end: int) -> bool:
+    """Se `sql[start:end]` é um item inteiro da lista do SELECT, sem alias nem outra expressão em volta."""
+    before = sql[:start].rstrip()
+    after = sql[end:].lstrip()
+    return (before.endswith(",") or re.search(r"\bSELECT$", before, re.IGNORECASE) is not None) and (
+        after.startswith(",") or re.match(r"FROM\b", after, re.IGNORECASE) is not None
+    )
+
+
+class ApproximateQuery:
+    """
+    Reescrita de uma agregação sobre uma única tabela grande para ler só `percent`% dos blocos.
+    `COUNT` e `SUM` são multiplicados por `100 / percent` (médias e razões não mudam) e cada grupo ganha
+    a contagem de linhas amostradas, usada na margem de erro (só calculada quando todas as agregações são `COUNT`).
+    """
+
+    def __init__(self, sql: str, percent: float, count_only: bool = False):
+        self.sql = sql
+        self.percent = percent
+        self.count_only = count_only
+
+    def finish(self, columns: List[str], rows: List[tuple]) -> Optional[Tuple[List[str], List[tuple], Dict[str, Any]]]:
+        """
+        Remove a coluna auxiliar e calcula a margem de erro relativa (95%) do pior grupo; a margem é `None`
+        quando há `SUM`/`AVG`, cujo erro depende da variância dos valores e não só do tamanho da amostra.
+        Retorna `None` se a amostra for pequena demais para uma estimativa útil.
+        """
+        index = columns.index(SAMPLE_COLUMN)
+        counts = [row[index] or 0 for row in rows]
+        if sum(counts) < APPROXIMATE_MIN_SAMPLE_ROWS:
+            return None
+
+        # 🔹 Erro de uma proporção amostrada com `n` linhas; supõe linhas independentes (com amostragem por
+        # blocos, dados fisicamente agrupados podem ter erro real maior)
+        margin = None
+        if self.count_only:
+            fraction = self.percent / 100
+            margin = round(max(_Z_95 * math.sqrt((1 - fraction) / n) if n else 1.0 for n in counts), 4)
+
+        columns = columns[:index] + columns[index + 1 :]
+        rows = [tuple(row[:index]) + tuple(row[index + 1 :]) for row in rows]
+        return columns, rows, {"sample_percent": self.percent, "sample_rows": sum(counts), "margin": margin}
+
+
+def approximate_query(query: str, percent: float) -> Optional[ApproximateQuery]:
+    """
+    Reescreve a query com `TABLESAMPLE SYSTEM (percent)` quando ela é elegível: um único SELECT de agregação
+    (`COUNT`/`SUM`/`AVG`) sobre uma das `APPROXIMATE_TABLES`, sem joins, subqueries, DISTINCT, HAVING ou janelas.
+    Retorna `None` para as demais queries (que seguem exatas).
+    """
+    statement = query.strip().rstrip(";")
+    masked = _mask_literals(statement)
+    if not is_read_only(statement) or not re.match(r"\s*SELECT\b", masked, re.IGNORECASE):
+        return None
+    if _INELIGIBLE.search(masked) or len(re.findall(r"\bSELECT\b", masked, re.IGNORECASE)) != 1:
+        return None
+
+    # 🔹 Apenas o FROM do nível externo (ignora `EXTRACT(YEAR FROM ...)`)
+    sources = [m for m in _FROM.finditer(masked) if _depth(masked, m.start()) == 0]
+    if len(sources) != 1 or sources[0].group("name").lower() not in APPROXIMATE_TABLES:
+        return None
+    source = sources[0]
+
+    # 🔹 Junção por vírgula (`FROM orders_ia, users`): uma vírgula no nível externo antes do WHERE/GROUP BY/...
+    # juntaria a amostra com outra tabela, e `\bJOIN\b` não a pega
+    tail = masked[source.end() :]
+    clause_start = next((m.start() for m in _CLAUSE.finditer(tail) if _depth(tail, m.start()) == 0), len(tail))
+    if any(char == "," and _depth(tail, i) == 0 for i, char in enumerate(tail[:clause_start])):
+        return None
+
+    aggregates = list(_SCALED.finditer(masked))
+    has_avg = bool(re.search(r"\bAVG\s*\(", masked, re.IGNORECASE))
+    if not aggregates and not has_avg:
+        return None
+    count_only = not has_avg and all(match.group(1).upper() == "COUNT" for match in aggregates)
+    select_end = len(statement[: source.start()].rstrip())
+
+    factor = f"(100.0 / {percent:g})"
+    edits = []  # (início, fim, texto novo), aplicados de trás para frente
+    try:
+        for match in aggregates:
+            end = _closing_paren(masked, match.end())
+            if filter_clause := _FILTER.match(masked, end):
+                end = _closing_paren(masked, filter_clause.end())
+            text = f"({statement[match.start() : end]} * {factor})"
+            # 🔹 Sem alias, a expressão escalada viraria `?column?`: mantém o nome dado pelo Postgres (`count`/`sum`)
+            in_select = match.start() < select_end and _depth(masked, match.start()) == 0
+            if in_select and _bare_item(masked, match.start(), end):
+                text += f" AS {match.group(1).lower()}"
+            edits.append((match.start(), end, text))
+    except ValueError:
+        return None
+
+    # 🔹 A coluna auxiliar entra no fim da lista do SELECT: `ORDER BY 2`/`GROUP BY 1` continuam válidos
+    edits.append((select_end, source.start(), f', COUNT(*) AS "{SAMPLE_COLUMN}"\n'))
+
+    alias = source.group("alias")
+    table_end = source.end("alias") if alias and alias.strip('"').lower() not in _RESERVED else source.end("table")
+    edits.append((table_end, table_end, f" TABLESAMPLE SYSTEM ({percent:g})"))
+
+    sql = statement
+    for start, stop, text in sorted(edits, reverse=True):
+        sql = sql[:start] + text + sql[stop:]
+    return ApproximateQuery(sql, percent, count_only)
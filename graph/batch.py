@@ -0,0 +1,248 @@
+"""
+Execução em lote de perguntas (relatórios do time de BI).
+
+Uso:
+    python batch.py perguntas.txt                  # uma pergunta por linha
+    python batch.py questions.json -c 16           # formato de `questions.json` ou lista JSON de strings
+    python batch.py perguntas.txt -o respostas.jsonl
+    python batch.py perguntas.txt --approximate 5   # agregações estimadas sobre 5% dos dados (ver `approximate.py`)
+
+Cada resultado é impresso (ou gravado) em JSON assim que fica pronto; as estatísticas do lote vêm no final.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from cancellation import cancel_run
+from langchain_core.messages import HumanMessage
+
+# Perguntas do lote executadas ao mesmo tempo
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Limite de perguntas por lote (protege a rota HTTP de listas acidentalmente enormes)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+
+# Strings literais e identificadores entre aspas: diferenças de caixa e espaços neles mudam o resultado
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+class ResultCache:
+    """
+    Resultados de SQL compartilhados pelas perguntas de um lote: listas de BI costumam repetir a mesma
+    consulta com redações diferentes. Consultas idênticas em andamento são executadas uma única vez.
+    """
+
+    def __init__(self):
+        self._results: Dict[str, Tuple[List[str], List[tuple]]] = {}
+        self._pending: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query: str) -> str:
+        """Normaliza caixa e espaços apenas fora das partes entre aspas (`'SP'` e `'sp'` são queries diferentes)."""
+        parts = _QUOTED.split(query.strip().rstrip(";"))
+        return "".join(part if i % 2 else re.sub(r"\s+", " ", part).lower() for i, part in enumerate(parts))
+
+    def fetch(self, query: str, fetch: Callable[[str], Tuple[List[str], List[tuple]]]):
+        key = self.key(query)
+        while True:
+            with self._lock:
+                if key in self._results:
+                    self.hits += 1
+                    return self._results[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            pending.wait()  # 🔹 Outra pergunta já está executando a mesma query; erros não ficam em cache
+
+        try:
+            result = fetch(query)
+            with self._lock:
+                self._results[key] = result
+            return result
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+
+
+result_cache: ContextVar[Optional[ResultCache]] = ContextVar("result_cache", default=None)
+
+
+def current_result_cache() -> Optional[ResultCache]:
+    """Cache de resultados do lote em andamento (ou `None` fora de um lote)."""
+    return result_cache.get()
+
+
+class BatchStats:
+    """Contadores e latências do lote, para o resumo final."""
+
+    def __init__(self, total: int, concurrency: int, cache: ResultCache):
+        self.total = total
+        self.concurrency = concurrency
+        self.cache = cache
+        self.started_at = time.perf_counter()
+        self.latencies: List[float] = []
+        self.status: Dict[str, int] = {}
+
+    def record(self, status: str, elapsed: float):
+        self.status[status] = self.status.get(status, 0) + 1
+        self.latencies.append(elapsed)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started_at
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3) if latencies else None
+
+        return {
+            "total": self.total,
+            "completed": len(latencies),
+            "status": self.status,
+            "concurrency": self.concurrency,
+            "elapsed_seconds": round(elapsed, 3),
+            "questions_per_minute": round(len(latencies) / elapsed * 60, 1) if elapsed else None,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "result_cache": {"hits": self.cache.hits, "misses": self.cache.misses},
+        }
+
+
+def batch_graph():
+    """
+    Grafo servido (`runtime.served_graph`) com um checkpointer em memória próprio do lote: perguntas que o agente
+    não considera prontas param no `interrupt` e voltam como pedido de esclarecimento.
+    """
+    from langgraph.checkpoint.memory import MemorySaver
+    from runtime import served_graph
+
+    return served_graph().copy(update={"checkpointer": MemorySaver()})
+
+
+async def answer_question(
+    graph, index: int, question: str, cache: ResultCache, configurable: Dict[str, Any] = None
+) -> Dict[str, Any]:
+    """Executa uma pergunta em uma thread própria e resume a saída do grafo (com a SQL e os dados do gráfico)."""
+    result_cache.set(cache)  # 🔹 Cada task tem o próprio contexto; os nós do grafo o herdam
+    started = time.perf_counter()
+    result = {"index": index, "question": question}
+    # 🔹 O `run_id` liga a execução ao registro de cancelamento (ver `cancellation.py`)
+    run_id = str(uuid.uuid4())
+    try:
+        thread_id = str(uuid.uuid4())
+        config = {"configurable": {**(configurable or {}), "thread_id": thread_id, "run_id": run_id}}
+        output = await graph.ainvoke({"messages": [HumanMessage(content=question)], "uuid": thread_id}, config)
+        if output.get("final_answer"):
+            values = (await graph.aget_state(config)).values
+            result |= {
+                "status": "answered",
+                "answer": output["final_answer"],
+                "visualization": output.get("visualization"),
+                "visualization_reason": output.get("visualization_reason"),
+                "sql_query": values.get("sql_query"),
+                "columns": values.get("query_columns", []),
+                "rows": values.get("query_rows", []),
+            }
+        else:
+            messages = output.get("messages") or []
+            result |= {"status": "needs_clarification", "answer": messages[-1].content if messages else ""}
+    except asyncio.CancelledError:
+        # 🔹 Cancelar a task não alcança os nós, que rodam em threads: o token interrompe LLM e queries em voo
+        cancel_run(run_id)
+        raise
+    except Exception as e:
+        result |= {"status": "failed", "error": str(e)}
+    result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(
+    questions: List[str], concurrency: int = BATCH_CONCURRENCY, graph=None, configurable: Dict[str, Any] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Executa as perguntas com no máximo `concurrency` ao mesmo tempo e gera cada resultado assim que ele fica
+    pronto (fora da ordem original; use `index`). O último item gerado é `{"stats": ...}`.
+    Se o consumidor parar de ler (cliente desconectou), as perguntas restantes são canceladas.
+    `configurable` é repassado a todas as execuções.
+    """
+    graph = graph or batch_graph()
+    cache = ResultCache()
+    stats = BatchStats(len(questions), concurrency, cache)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(index: int, question: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await answer_question(graph, index, question, cache, configurable)
+
+    tasks = [asyncio.create_task(bounded(index, question)) for index, question in enumerate(questions)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            result = await finished
+            stats.record(result["status"], result["elapsed_seconds"])
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    yield {"stats": stats.summary()}
+
+
+def load_questions(path: str) -> List[str]:
+    """Lê perguntas de um `.txt` (uma por linha), de uma lista JSON ou do formato de `questions.json`."""
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+
+    if not path.endswith(".json"):
+        return [line.strip() for line in content.splitlines() if line.strip()]
+
+    data = json.loads(content)
+    items = data["test_questions"] if isinstance(data, dict) else data
+    return [item["question"] if isinstance(item, dict) else str(item) for item in items]
+
+
+async def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Responde uma lista de perguntas com o agente.")
+    parser.add_argument("questions", help="arquivo .txt (uma pergunta por linha) ou .json")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("-o", "--output", help="grava os resultados em JSON Lines em vez de imprimir")
+    parser.add_argument(
+        "--approximate", nargs="?", const=True, type=float, metavar="PERCENT", help="modo aproximado (amostra em %%)"
+    )
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    print(f"🚀 Lote de {len(questions)} perguntas (concorrência {args.concurrency})", file=sys.stderr)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        configurable = {"approximate": args.approximate} if args.approximate else None
+        async for result in run_batch(questions, args.concurrency, configurable=configurable):
+            output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+            if "stats" in result:
+                stats = result["stats"]
+                print(
+                    f"✅ {stats['completed']}/{stats['total']} em {stats['elapsed_seconds']:.1f}s "
+                    f"({stats['questions_per_minute']} perguntas/min, p50 {stats['latency_p50']}s)",
+                    file=sys.stderr,
+                )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
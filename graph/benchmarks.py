@@ -0,0 +1,380 @@
+"""
+Benchmarks do agente.
+
+Uso:
+    python benchmarks.py            # executa os benchmarks que não dependem do LLM nem do banco
+    python benchmarks.py sse        # apenas o benchmark indicado
+    python benchmarks.py checkpoint # tamanho e tempo de serialização dos checkpoints por passo
+    python benchmarks.py delta      # checkpointer SQLite com e sem delta/zstd em uma thread de 50 turnos
+    python benchmarks.py embedded   # modo embarcado × LangGraph API (requer o servidor em LANGGRAPH_API_URL)
+    python benchmarks.py approximate  # modo aproximado × exato em uma tabela sintética (requer o PostgreSQL do .env)
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+from blobstore import BlobStore
+from checkpointer import SqliteCheckpointer
+from sse import DeltaTracker, RunStream
+
+# 📌 Mensagens de uma resposta típica do agente, na ordem em que os nós as produzem
+STATUS_STEPS = [
+    "✅ Entendi sua pergunta! Vou processá-la.",
+    "🔍 Obtendo informações das tabelas relevantes...",
+    "SELECT namesku, SUM(quantity) AS total_quantity FROM orders_items_ia GROUP BY namesku ORDER BY 2 DESC LIMIT 5",
+    "⏳ Executando a query no banco de dados...",
+    "✅ Consulta SQL executada com sucesso.",
+    "✅ Processando os resultados da consulta...",
+]
+FINAL_ANSWER = (
+    "Os 5 produtos mais vendidos no período foram: 1. Camiseta Básica (15.230 unidades), 2. Calça Jeans "
+    "(9.812 unidades), 3. Tênis Casual (7.455 unidades), 4. Boné Esportivo (6.020 unidades) e 5. Meia Cano "
+    "Alto (5.998 unidades). A Camiseta Básica concentra quase um terço do volume do top 5."
+)
+
+
+def simulated_run(history_turns: int = 5, token_streaming: bool = False):
+    """
+    Gera os eventos de `join_stream` de uma execução: um estado completo (`values`) por passo do grafo.
+    Passos que não adicionam mensagens (prefetch, visualização) repetem a última mensagem.
+    Com `token_streaming`, a resposta final também chega como mensagens parciais acumuladas.
+    """
+    messages = []
+    for turn in range(history_turns):
+        messages.append({"type": "human", "content": f"Pergunta anterior {turn}", "id": str(uuid.uuid4())})
+        messages.append({"type": "ai", "content": FINAL_ANSWER, "id": str(uuid.uuid4())})
+    messages.append({"type": "human", "content": "Quais os 5 produtos mais vendidos?", "id": str(uuid.uuid4())})
+
+    yield "values", {"messages": list(messages)}
+    for i, step in enumerate(STATUS_STEPS):
+        messages.append({"type": "ai", "content": step, "id": str(uuid.uuid4())})
+        yield "values", {"messages": list(messages)}
+        if i == 1:
+            yield "values", {"messages": list(messages)}  # 🔹 prefetch_schemas termina no mesmo passo
+
+    answer_id = str(uuid.uuid4())
+    if token_streaming:
+        words = FINAL_ANSWER.split(" ")
+        for n in range(1, len(words) + 1):
+            yield "messages/partial", [{"type": "AIMessageChunk", "content": " ".join(words[:n]), "id": answer_id}]
+
+    messages.append({"type": "ai", "content": FINAL_ANSWER, "id": answer_id})
+    yield "values", {"messages": list(messages)}
+    yield "values", {"messages": list(messages)}  # 🔹 choose_visualization não adiciona mensagens
+
+
+def legacy_frames(chunks):
+    """Comportamento anterior de `message_generator`: reenvia a última mensagem completa a cada evento."""
+    for event, data in chunks:
+        if event.startswith("messages"):
+            for msg in data:
+                content = msg.get("content", "")
+                if content and content.strip():
+                    yield f"event: message\ndata: {content}\n\n"
+        elif event == "values":
+            last_msg = data["messages"][-1]
+            if last_msg.get("type") != "ai":
+                continue
+            content = last_msg.get("content", "").strip()
+            if content:
+                yield f"event: message\ndata: {content}\n\n"
+    yield "event: close\ndata:\n\n"
+
+
+async def delta_frames(chunks):
+    """Novo comportamento: eventos incrementais com id, servidos pelo buffer da execução."""
+
+    async def source():
+        tracker = DeltaTracker()
+        for event, data in chunks:
+            events = tracker.feed_partial(data) if event.startswith("messages") else tracker.feed_values(data)
+            for item in events:
+                yield item
+            await asyncio.sleep(0)
+
+    stream = RunStream().start(source())
+    return [frame async for frame in stream.subscribe()]
+
+
+def bench_sse(clients: int = 200):
+    """Bytes enviados por resposta (antes × depois) e teste de carga com `clients` conexões simultâneas."""
+    print("📡 SSE: bytes enviados por resposta")
+    for token_streaming in (False, True):
+        chunks = list(simulated_run(token_streaming=token_streaming))
+        before = sum(len(frame.encode()) for frame in legacy_frames(chunks))
+        after = sum(len(frame.encode()) for frame in asyncio.run(delta_frames(chunks)))
+        label = "com streaming de tokens" if token_streaming else "apenas estados (values)"
+        print(f"   {label:<26} antes: {before:>7} B   depois: {after:>6} B   redução: {1 - after / before:.0%}")
+
+    async def load_test():
+        chunks = list(simulated_run(token_streaming=True))
+        started = time.perf_counter()
+        results = await asyncio.gather(*[delta_frames(chunks) for _ in range(clients)])
+        elapsed = time.perf_counter() - started
+        sent = sum(len(frame.encode()) for frames in results for frame in frames)
+        return elapsed, sent
+
+    elapsed, sent = asyncio.run(load_test())
+    legacy_sent = clients * sum(len(f.encode()) for f in legacy_frames(list(simulated_run(token_streaming=True))))
+    print(
+        f"   carga: {clients} respostas simultâneas em {elapsed * 1000:.0f} ms — "
+        f"{sent / 1024:.0f} KiB enviados (antes: {legacy_sent / 1024:.0f} KiB)"
+    )
+
+
+def check_resume():
+    """Confere que um cliente que reconecta com `Last-Event-ID` recebe apenas os eventos restantes."""
+
+    async def run():
+        chunks = list(simulated_run())
+        frames = await delta_frames(chunks)
+        last_id = int(frames[2].split("\n")[0].removeprefix("id: "))
+
+        stream = RunStream()
+        for frame in frames:
+            lines = frame.strip().split("\n")
+            stream.publish(lines[1].removeprefix("event: "), lines[2].removeprefix("data: "))
+        stream.finish()
+        resumed = [frame async for frame in stream.subscribe(last_id)]
+        return len(frames), len(resumed)
+
+    total, resumed = asyncio.run(run())
+    print(f"   retomada após o 3º evento: {resumed} de {total} eventos reenviados")
+
+
+def simulated_schema(table: str, columns: int = 40, samples: int = 3) -> str:
+    """DDL no formato de `sql_db_schema` (CREATE TABLE + linhas de exemplo), com o tamanho das tabelas reais."""
+    names = [f"coluna_{table}_{i}" for i in range(columns)]
+    ddl = f"CREATE TABLE {table} (\n" + ",\n".join(f"\t{name} VARCHAR(255)" for name in names) + "\n)"
+    rows = "\n".join("\t".join(f"valor exemplo {r}-{i}" for i in range(columns)) for r in range(samples))
+    return f"{ddl}\n\n/*\n{samples} rows from {table} table:\n" + "\t".join(names) + f"\n{rows}\n*/"
+
+
+def simulated_steps(store=None, rows: int = 50):
+    """Estados do grafo após cada nó de uma pergunta; com `store`, os campos grandes viram referências."""
+    put = store.put if store else (lambda value: value)
+    schemas = {table: put(simulated_schema(table)) for table in ("orders_ia", "orders_items_ia")}
+    result = str([(f"produto {i}", i * 1000, 123.45 * i) for i in range(rows)])
+    messages = [{"type": "human", "content": "Quais os produtos mais vendidos?"}]
+
+    state = {"messages": messages, "user_query": "Quais os produtos mais vendidos?", "is_relevant": True}
+    steps = [("interact_with_user", dict(state))]
+    state |= {"table_schemas": schemas, "column_stats": {}}
+    steps.append(("analyze_tables", dict(state)))
+    state |= {"sql_query": STATUS_STEPS[2], "messages": messages + [{"type": "ai", "content": STATUS_STEPS[2]}]}
+    steps.append(("generate_sql", dict(state)))
+    state |= {"query_response": put(result), "query_error": None}
+    steps.append(("execute_sql", dict(state)))
+    state |= {"final_answer": FINAL_ANSWER, "messages": state["messages"] + [{"type": "ai", "content": FINAL_ANSWER}]}
+    steps.append(("generate_answer", dict(state)))
+    return steps
+
+
+def bench_checkpoint(repeat: int = 200):
+    """Bytes e tempo de serialização do estado completo em cada passo, com os campos grandes no estado × no armazém de blobs."""
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    serde = JsonPlusSerializer()
+    store = BlobStore(tempfile.mkdtemp())
+    print("💾 Checkpoints: bytes e tempo de serialização por passo")
+    totals = {}
+    for (node, inline), (_, by_ref) in zip(simulated_steps(), simulated_steps(store)):
+        row = []
+        for label, state in (("antes", inline), ("depois", by_ref)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                size = len(serde.dumps_typed(state)[1])
+            elapsed = (time.perf_counter() - started) / repeat
+            totals[label] = totals.get(label, 0) + size
+            row.append(f"{label}: {size:>6} B {elapsed * 1e6:>5.0f} µs")
+        print(f"   {node:<20} " + "   ".join(row))
+    print(f"   total por pergunta   antes: {totals['antes']} B   depois: {totals['depois']} B")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        store.get(by_ref["table_schemas"]["orders_ia"])
+    print(f"   leitura de um esquema via mmap: {(time.perf_counter() - started) / repeat * 1e6:.0f} µs")
+
+
+def agent_like_graph(checkpointer):
+    """Grafo com o mesmo número de passos por turno do agente, acrescentando as mensagens de status e a resposta."""
+    from langchain_core.messages import AIMessage
+    from langgraph.graph import END, START, StateGraph
+    from state import InputState
+
+    workflow = StateGraph(InputState)
+    nodes = ["interact_with_user", "analyze_tables", "generate_sql", "execute_sql", "generate_answer"]
+    for node, content in zip(nodes, STATUS_STEPS[:4] + [FINAL_ANSWER]):
+        workflow.add_node(node, lambda state, content=content: {"messages": [AIMessage(content=content)]})
+    workflow.add_edge(START, nodes[0])
+    for source, target in zip(nodes, nodes[1:]):
+        workflow.add_edge(source, target)
+    workflow.add_edge(nodes[-1], END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def bench_delta(turns: int = 50):
+    """Bytes gravados, CPU de serialização e latência de restauração em uma thread longa, antes × depois."""
+    print(f"🗜️ Checkpointer SQLite: thread de {turns} turnos")
+    modes = {"antes (lista completa)": {"delta_chain": 0, "compress": False}, "depois (delta + zstd)": {}}
+    for label, options in modes.items():
+        path = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+        saver = SqliteCheckpointer(path, retention=0, compaction_interval=0, **options)
+
+        put, spent = saver.put, [0.0]
+
+        def timed_put(*args):
+            started = time.process_time()
+            try:
+                return put(*args)
+            finally:
+                spent[0] += time.process_time() - started
+
+        saver.put = timed_put
+        graph = agent_like_graph(saver)
+        config = {"configurable": {"thread_id": "benchmark"}}
+        for turn in range(turns):
+            graph.invoke({"messages": [{"type": "human", "content": f"Pergunta {turn}: {FINAL_ANSWER[:80]}"}]}, config)
+
+        written = sum(
+            saver.conn.execute(f"SELECT COALESCE(SUM(LENGTH(blob)), 0) FROM {table}").fetchone()[0]
+            for table in ("checkpoint_blobs", "checkpoint_writes")
+        ) + saver.conn.execute("SELECT SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints").fetchone()[0]
+        saver.close()
+
+        # 🔹 Restauração a frio: conexão nova, sem caches em memória
+        restored = SqliteCheckpointer(path, retention=0, compaction_interval=0, **options)
+        started = time.perf_counter()
+        messages = restored.get_tuple(config).checkpoint["channel_values"]["messages"]
+        restore = time.perf_counter() - started
+        restored.close()
+
+        print(
+            f"   {label:<22} gravados: {written / 1024:>7.0f} KiB   CPU em put: {spent[0] * 1000:>5.0f} ms   "
+            f"restauração: {restore * 1000:>5.1f} ms ({len(messages)} mensagens)"
+        )
+
+
+async def time_client(client, questions):
+    """Para cada pergunta: tempo até o primeiro evento do stream e tempo total da execução (em segundos)."""
+    first_event, total = [], []
+    for question in questions:
+        thread_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        await client.threads.create(thread_id=thread_id, if_exists="do_nothing", metadata={"user_id": "benchmark"})
+        run = await client.runs.create(
+            thread_id=thread_id, assistant_id="agent", input={"messages": [{"type": "human", "content": question}]}
+        )
+        first = None
+        async for _ in client.runs.join_stream(thread_id, run["run_id"]):
+            first = first or time.perf_counter() - started
+        await client.threads.get_state(thread_id)
+        first_event.append(first or 0.0)
+        total.append(time.perf_counter() - started)
+    return first_event, total
+
+
+def bench_embedded(limit: int = 5):
+    """Compara a latência do `app.py` falando com a LangGraph API por HTTP e executando o grafo no processo."""
+    from embedded import get_embedded_client
+    from langgraph_sdk import get_client
+
+    with open(os.path.join(os.path.dirname(__file__), "questions.json"), encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)["test_questions"]][:limit]
+
+    modes = {
+        "LangGraph API (HTTP)": get_client(url=os.getenv("LANGGRAPH_API_URL", "http://localhost:2024")),
+        "embarcado (astream)": get_embedded_client(),
+    }
+
+    print(f"🏁 Execução embarcada × LangGraph API ({len(questions)} perguntas)")
+    for label, client in modes.items():
+        first_event, total = asyncio.run(time_client(client, questions))
+        print(
+            f"   {label:<22} 1º evento: {statistics.median(first_event) * 1000:>6.0f} ms   "
+            f"total: {statistics.median(total) * 1000:>7.0f} ms (medianas)"
+        )
+
+
+# 📌 Agregações exploratórias típicas, avaliadas de forma exata e por amostragem
+APPROXIMATE_QUERIES = {
+    "frete grátis (%)": "SELECT AVG(CASE WHEN freeshipping THEN 1.0 ELSE 0 END) AS share FROM orders_ia",
+    "pedidos por estado": "SELECT state, COUNT(*) AS pedidos FROM orders_ia GROUP BY state ORDER BY 2 DESC",
+    "faturamento 2024": "SELECT SUM(value) AS faturamento FROM orders_ia WHERE creationdate >= '2024-01-01'",
+}
+
+
+def bench_approximate(rows: int = 20_000_000, percents=(1, 5, 10, 25), repeat: int = 3):
+    """
+    Tempo das agregações exploratórias exatas × `TABLESAMPLE SYSTEM` em vários percentuais, sobre uma tabela
+    temporária `orders_ia` sintética (na sessão do benchmark, ela tem precedência sobre a tabela real).
+    Mostra também o erro relativo observado no primeiro grupo e a margem de erro informada.
+    """
+    from approximate import approximate_query
+    from database import PostgresDB
+    from sqlalchemy import text
+
+    db = PostgresDB()
+    print(f"🎲 Modo aproximado: {rows:,} pedidos sintéticos".replace(",", "."))
+    with db.engine.connect() as conn:
+        conn.execute(
+            text(
+                """
+                CREATE TEMP TABLE orders_ia AS
+                SELECT i AS orderid,
+                       TIMESTAMP '2020-01-01' + (i::float / :rows) * INTERVAL '5 years' AS creationdate,
+                       (ARRAY['SP','RJ','MG','RS','PR','BA','SC','PE'])[1 + (hashint4(i) & 7)] AS state,
+                       round((abs(hashint4(i + 1)) % 100000) / 100.0, 2) AS value,
+                       abs(hashint4(i + 2)) % 10 < 3 AS freeshipping
+                FROM generate_series(1, :rows) AS i
+                """
+            ),
+            {"rows": rows},
+        )
+        conn.execute(text("ANALYZE orders_ia"))
+
+        def timed(sql):
+            durations = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = conn.execute(text(sql))
+                columns, data = list(result.keys()), [tuple(row) for row in result.fetchall()]
+                durations.append(time.perf_counter() - started)
+            return statistics.median(durations), columns, data
+
+        for label, query in APPROXIMATE_QUERIES.items():
+            exact_time, _, exact = timed(query)
+            print(f"   {label:<20} exato: {exact_time * 1000:>7.0f} ms")
+            for percent in percents:
+                approximate = approximate_query(query, percent)
+                elapsed, columns, data = timed(approximate.sql)
+                finished = approximate.finish(columns, data)
+                if finished is None:
+                    print(f"      {percent:>3}%  amostra pequena demais")
+                    continue
+                _, estimate, info = finished
+                exact_by_group = {tuple(row[:-1]): row[-1] for row in exact}
+                value, expected = float(estimate[0][-1]), float(exact_by_group[tuple(estimate[0][:-1])])
+                error = abs(value - expected) / abs(expected) if expected else 0.0
+                print(
+                    f"      {percent:>3}%  {elapsed * 1000:>7.0f} ms ({exact_time / elapsed:>5.1f}×)   "
+                    f"erro observado: {error * 100:>5.2f}%   margem informada: "
+                    + (f"±{info['margin'] * 100:.2f}%" if info["margin"] is not None else "—")
+                )
+
+
+BENCHMARKS = {"sse": lambda: (bench_sse(), check_resume()), "checkpoint": bench_checkpoint, "delta": bench_delta}
+
+# 🔹 Benchmarks que exigem LLM, banco e/ou servidor no ar: só rodam quando pedidos explicitamente
+EXTERNAL_BENCHMARKS = {"embedded": bench_embedded, "approximate": bench_approximate}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        (BENCHMARKS | EXTERNAL_BENCHMARKS)[name]()
@@ -0,0 +1,133 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Diretório dos blobs (compartilhado por todas as threads e execuções do processo)
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", ".langgraph_blobs")
+
+# Valores menores que isso continuam no estado: a referência não compensaria a leitura extra
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "1024"))
+
+# Blobs sem uso (nem regravados) há mais que isso são apagados pela varredura (0 = manter todos)
+BLOB_MAX_AGE_SECONDS = float(os.getenv("BLOB_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+# Intervalo mínimo entre varreduras (disparadas em segundo plano pelo `put`)
+BLOB_SWEEP_INTERVAL = float(os.getenv("BLOB_SWEEP_INTERVAL", "3600"))
+
+REF_PREFIX = "blob:sha256:"
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+class BlobStore:
+    """
+    Armazém de conteúdo endereçado pelo SHA-256, em disco. O estado do grafo guarda apenas a referência
+    (`blob:sha256:<hash>`), então campos grandes não são serializados de novo em cada checkpoint e conteúdos
+    idênticos (como o DDL das tabelas) ocupam um único arquivo para todas as threads.
+
+    Os blobs só são lidos na execução que os gravou; cada `put` renova a data de modificação do arquivo e,
+    no máximo uma vez por `BLOB_SWEEP_INTERVAL`, dispara a varredura que apaga os que não são gravados de novo
+    há mais de `max_age` segundos (em qualquer modo de deploy, com ou sem o checkpointer local).
+    """
+
+    def __init__(
+        self, root: str = BLOB_STORE_DIR, min_bytes: int = BLOB_MIN_BYTES, max_age: float = BLOB_MAX_AGE_SECONDS
+    ):
+        self.root = root
+        self.min_bytes = min_bytes
+        self.max_age = max_age
+        self._last_sweep: Optional[float] = None
+        self._sweep_lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, value: str) -> str:
+        """Guarda o texto (se ainda não existir) e retorna a referência; textos pequenos voltam sem mudança."""
+        if not isinstance(value, str) or is_ref(value):
+            return value
+        data = value.encode("utf-8")
+        if not data or len(data) < self.min_bytes:
+            return value
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            # 🔹 Conteúdo já guardado: só renova a data de modificação, que a varredura usa como último uso
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 🔹 Escrita atômica: leitores nunca veem um blob pela metade
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+        self.sweep_if_due()
+        return REF_PREFIX + digest
+
+    def get(self, value: Optional[str]) -> Optional[str]:
+        """Resolve a referência lendo o arquivo via mmap; valores que não são referências voltam sem mudança."""
+        if not is_ref(value):
+            return value
+
+        with open(self._path(value[len(REF_PREFIX) :]), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:].decode("utf-8")
+
+    def sweep(self, max_age: float = None) -> int:
+        """Apaga os blobs (e temporários de escritas interrompidas) sem uso há mais de `max_age` segundos."""
+        max_age = self.max_age if max_age is None else max_age
+        if max_age <= 0:
+            return 0
+
+        cutoff = time.time() - max_age
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def sweep_if_due(self, interval: float = BLOB_SWEEP_INTERVAL) -> bool:
+        """
+        Inicia `sweep` em uma thread daemon se ainda não houve varredura no processo ou se a última foi há mais
+        de `interval` segundos; retorna se iniciou. Chamado a cada `put`, que não espera a varredura.
+        """
+        with self._sweep_lock:
+            now = time.monotonic()
+            if self._last_sweep is not None and now - self._last_sweep < interval:
+                return False
+            self._last_sweep = now
+
+        threading.Thread(target=self._logged_sweep, daemon=True).start()
+        return True
+
+    def _logged_sweep(self):
+        try:
+            removed = self.sweep()
+        except OSError as e:
+            print("❌ Erro na varredura de blobs:", str(e))
+            return
+        if removed:
+            print(f"🧹 Varredura de blobs: {removed} removidos")
+
+    def put_dict(self, values: Dict[str, str]) -> Dict[str, str]:
+        return {key: self.put(value) for key, value in (values or {}).items()}
+
+    def get_dict(self, values: Dict[str, str]) -> Dict[str, str]:
+        return {key: self.get(value) for key, value in (values or {}).items()}
+
+
+blobs = BlobStore()
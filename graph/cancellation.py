@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Tempo que um token sem uso continua registrado (execuções encerradas nunca são canceladas depois disso)
+TOKEN_TTL_SECONDS = 3600
+
+
+class RunCancelled(Exception):
+    """A execução do grafo foi cancelada (usuário fechou a aba ou enviou uma nova mensagem)."""
+
+
+class CancellationToken:
+    """Sinal de cancelamento de uma execução, com callbacks para interromper o trabalho em andamento."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.created_at = time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise RunCancelled()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Registra `callback` para quando a execução for cancelada; retorna a função que o remove."""
+        with self._lock:
+            if not self.cancelled:
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+
+        callback()
+        return lambda: None
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print("⚠️ Erro ao interromper trabalho cancelado:", str(e))
+
+
+class CancellationRegistry:
+    """Tokens por `run_id`, criados por quem chegar primeiro (o nó em execução ou o pedido de cancelamento)."""
+
+    def __init__(self, ttl: float = TOKEN_TTL_SECONDS):
+        self.ttl = ttl
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._lock = threading.Lock()
+
+    def token(self, run_id: str) -> CancellationToken:
+        with self._lock:
+            self._expire()
+            if run_id not in self._tokens:
+                self._tokens[run_id] = CancellationToken()
+            return self._tokens[run_id]
+
+    def cancel(self, run_id: str):
+        self.token(run_id).cancel()
+
+    def _expire(self):
+        now = time.monotonic()
+        for run_id, token in list(self._tokens.items()):
+            if now - token.created_at > self.ttl:
+                del self._tokens[run_id]
+
+
+class CancellationMetrics:
+    """
+    Trabalho interrompido por cancelamentos, por tipo (`llm`, `db`). O tempo recuperado é estimado pela
+    mediana de duração das chamadas concluídas menos o tempo que a chamada cancelada já tinha consumido.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, Dict[str, float]] = {}
+
+    def record(self, kind: str, elapsed: float, expected: Optional[float]):
+        with self._lock:
+            stats = self._kinds.setdefault(kind, {"cancelled": 0, "elapsed_seconds": 0.0, "reclaimed_seconds": 0.0})
+            stats["cancelled"] += 1
+            stats["elapsed_seconds"] += elapsed
+            stats["reclaimed_seconds"] += max(0.0, (expected or 0.0) - elapsed)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {kind: dict(stats) for kind, stats in self._kinds.items()}
+
+
+registry = CancellationRegistry()
+metrics = CancellationMetrics()
+
+
+def current_run_id() -> Optional[str]:
+    """`run_id` da execução do grafo em andamento nesta thread (ou `None` fora de um nó)."""
+    try:
+        from langgraph.config import get_config
+
+        config = get_config()
+    except (ImportError, RuntimeError):
+        return None
+
+    run_id = config.get("configurable", {}).get("run_id") or config.get("metadata", {}).get("run_id")
+    return str(run_id) if run_id else None
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token de cancelamento da execução em andamento, se houver."""
+    run_id = current_run_id()
+    return registry.token(run_id) if run_id else None
+
+
+def cancel_run(run_id: str):
+    """Cancela a execução: chamadas ao LLM em voo são abortadas e queries em execução recebem `pg_cancel_backend`."""
+    registry.cancel(run_id)
@@ -0,0 +1,519 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.types import TASKS
+
+import zstandard
+
+# Checkpoints mantidos por thread (e namespace); os mais antigos são removidos na compactação (0 = manter todos)
+CHECKPOINT_RETENTION = int(os.getenv("CHECKPOINT_RETENTION", "20"))
+
+# Intervalo entre compactações em segundo plano
+COMPACTION_INTERVAL = float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL", "60"))
+
+# Deltas seguidos antes de gravar de novo a lista completa (limita o custo da reconstrução; 0 = sem deltas)
+CHECKPOINT_DELTA_CHAIN = int(os.getenv("CHECKPOINT_DELTA_CHAIN", "20"))
+
+# Valores serializados menores que isso não são comprimidos (o zstd não ganha nada em poucos bytes)
+COMPRESS_MIN_BYTES = 128
+
+# Threads cujo último valor de cada lista fica em memória para detectar o que foi acrescentado
+DELTA_CACHE_SIZE = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    base_version TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+"""
+
+
+_MISSING = object()
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer durável em SQLite para o grafo do agente.
+
+    Cada checkpoint guarda apenas as versões dos canais; os valores ficam em `checkpoint_blobs`, uma linha por
+    (canal, versão). Um passo do grafo grava só os canais que mudaram (O(delta)), e a leitura carrega apenas a
+    thread pedida, pelos índices das chaves primárias. Uma thread em segundo plano mantém os últimos
+    `retention` checkpoints de cada thread e remove os valores que nenhum checkpoint restante referencia.
+
+    Listas que só crescem (como `messages`) são gravadas como delta: apenas os itens acrescentados desde a
+    versão anterior, com `base_version` apontando para ela; a cada `delta_chain` deltas a lista completa é
+    gravada de novo. Os valores são comprimidos com zstd.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention: int = None,
+        compaction_interval: float = None,
+        delta_chain: int = None,
+        compress: bool = True,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.retention = CHECKPOINT_RETENTION if retention is None else retention
+        self.compaction_interval = COMPACTION_INTERVAL if compaction_interval is None else compaction_interval
+        self.delta_chain = CHECKPOINT_DELTA_CHAIN if delta_chain is None else delta_chain
+        self.compress = compress
+        self._compressor = zstandard.ZstdCompressor()
+        self._decompressor = zstandard.ZstdDecompressor()
+
+        # 🔹 (thread, ns, canal) → (versão, lista gravada, deltas desde a última lista completa)
+        self._last_lists: OrderedDict = OrderedDict()
+        # 🔹 Valores reconstruídos recentemente: bases de deltas não são decodificadas de novo a cada leitura
+        self._decoded: OrderedDict = OrderedDict()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")  # 🔹 Só tem efeito em bancos novos
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+
+        self._dirty: set = set()
+        self._stop = threading.Event()
+        if self.compaction_interval > 0 and self.retention > 0:
+            threading.Thread(target=self._compaction_loop, daemon=True).start()
+
+    # 📌 Leitura
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            value = self._load_value(thread_id, checkpoint_ns, channel, str(version))
+            if value is not _MISSING:
+                values[channel] = value
+        return values
+
+    def _load_value(self, thread_id: str, checkpoint_ns: str, channel: str, version: str) -> Any:
+        """Decodifica o valor do canal; deltas são aplicados sobre a base, reconstruída da mesma forma."""
+        key = (thread_id, checkpoint_ns, channel, version)
+        if key in self._decoded:
+            self._decoded.move_to_end(key)
+            value = self._decoded[key]
+            return list(value) if isinstance(value, list) else value
+
+        row = self.conn.execute(
+            "SELECT type, blob, base_version FROM checkpoint_blobs "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+            key,
+        ).fetchone()
+        if not row or row[0] == "empty":
+            return _MISSING
+
+        type_, blob, base_version = row
+        if type_.startswith("delta:"):
+            base = self._load_value(thread_id, checkpoint_ns, channel, base_version)
+            value = (base if base is not _MISSING else []) + self._decode(type_.removeprefix("delta:"), blob)
+            self._remember(self._decoded, key, value)
+            return list(value)
+
+        value = self._decode(type_, blob)
+        if isinstance(value, list):
+            self._remember(self._decoded, key, value)
+            return list(value)
+        return value
+
+    def _decode(self, type_: str, blob: Optional[bytes]) -> Any:
+        if type_.startswith("zstd:"):
+            return self.serde.loads_typed((type_.removeprefix("zstd:"), self._decompressor.decompress(blob)))
+        return self.serde.loads_typed((type_, blob))
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: tuple, value: Any):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > DELTA_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> List[Tuple[str, str, Any]]:
+        rows = self.conn.execute(
+            "SELECT task_id, channel, type, blob FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, blob))) for task_id, channel, type_, blob in rows]
+
+    def _load_sends(self, thread_id: str, checkpoint_ns: str, parent_checkpoint_id: Optional[str]) -> list:
+        if not parent_checkpoint_id:
+            return []
+        rows = self.conn.execute(
+            "SELECT type, blob FROM checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS),
+        ).fetchall()
+        return [self.serde.loads_typed((type_, blob)) for type_, blob in rows]
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+
+        def config_for(cid: str) -> RunnableConfig:
+            return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": cid}}
+
+        return CheckpointTuple(
+            config=config_for(checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+                "pending_sends": self._load_sends(thread_id, checkpoint_ns, parent_checkpoint_id),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=config_for(parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+
+        with self.lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._to_tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        conditions, params = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            with self.lock:
+                item = self._to_tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and not all(item.metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    # 📌 Escrita
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+
+        stored = {k: v for k, v in checkpoint.items() if k not in ("channel_values", "pending_sends")}
+        values = checkpoint["channel_values"]
+
+        # 🔹 Apenas os canais que mudaram neste passo são gravados
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version), *self._dump_value(thread_id, checkpoint_ns, values, channel, str(version)))
+            for channel, version in new_versions.items()
+        ]
+        type_, checkpoint_b = self.serde.dumps_typed(stored)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO checkpoint_blobs VALUES (?, ?, ?, ?, ?, ?, ?)", blobs)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id, type_, checkpoint_b, metadata_type, metadata_b),
+            )
+            self._dirty.add((thread_id, checkpoint_ns))
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def _dump_value(
+        self, thread_id: str, checkpoint_ns: str, values: Dict[str, Any], channel: str, version: str
+    ) -> Tuple[str, Optional[bytes], Optional[str]]:
+        """Retorna `(tipo, blob, versão base)`; a versão base só existe quando o valor é gravado como delta."""
+        if channel not in values:
+            return "empty", None, None
+
+        value = values[channel]
+        if not isinstance(value, list) or not self.delta_chain:
+            return *self._encode(value), None
+
+        key = (thread_id, checkpoint_ns, channel)
+        previous = self._last_lists.get(key)
+        self._remember(self._last_lists, key, (version, list(value), 0))
+        if previous is None:
+            return *self._encode(value), None
+
+        base_version, base, depth = previous
+        # 🔹 Só vira delta se a lista anterior continuar intacta no início da nova (sem remoções ou substituições)
+        if depth >= self.delta_chain or base_version == version or len(value) < len(base) or value[: len(base)] != base:
+            return *self._encode(value), None
+
+        self._last_lists[key] = (version, list(value), depth + 1)
+        type_, blob = self._encode(value[len(base) :])
+        return "delta:" + type_, blob, base_version
+
+    def _encode(self, value: Any) -> Tuple[str, bytes]:
+        type_, blob = self.serde.dumps_typed(value)
+        if self.compress and blob and len(blob) >= COMPRESS_MIN_BYTES:
+            return "zstd:" + type_, self._compressor.compress(blob)
+        return type_, blob
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        # 🔹 Escritas especiais (erro, interrupção...) substituem as anteriores; as normais não são regravadas
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self.lock, self.conn:
+            self.conn.executemany(f"{verb} INTO checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    # 📌 Versões e API assíncrona
+
+    def get_next_version(self, current: Optional[Any], channel) -> str:
+        """Versões com sufixo aleatório: execuções a partir de um checkpoint antigo não sobrescrevem valores gravados."""
+        current_v = 0 if current is None else int(str(current).split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    # 📌 Registro de threads (cliente embarcado)
+
+    def put_thread(self, thread: Dict[str, Any]) -> None:
+        """Registra a thread (id, criação e metadados) para `threads.search`; threads já registradas não mudam."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO threads VALUES (?, ?, ?)",
+                (thread["thread_id"], thread["created_at"], json.dumps(thread["metadata"])),
+            )
+
+    def list_threads(self) -> List[Dict[str, Any]]:
+        """Threads registradas, na ordem de criação."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, created_at, metadata FROM threads ORDER BY created_at"
+            ).fetchall()
+        return [
+            {"thread_id": thread_id, "created_at": created_at, "metadata": json.loads(metadata)}
+            for thread_id, created_at, metadata in rows
+        ]
+
+    # 📌 Retenção e compactação
+
+    def compact(self, thread_id: str, checkpoint_ns: str = "") -> int:
+        """
+        Mantém os últimos `retention` checkpoints da thread e remove escritas e valores que só os
+        checkpoints descartados usavam. Retorna o número de checkpoints removidos.
+        """
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT checkpoint_id, type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC",
+                (thread_id, checkpoint_ns),
+            ).fetchall()
+            if len(rows) <= self.retention:
+                return 0
+
+            kept, dropped = rows[: self.retention], [row[0] for row in rows[self.retention :]]
+            oldest_kept = kept[-1][0]
+
+            self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept),
+            )
+            self.conn.execute(
+                "DELETE FROM checkpoint_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                (thread_id, checkpoint_ns, oldest_kept),
+            )
+
+            # 🔹 Versões ainda referenciadas pelos checkpoints mantidos
+            referenced = {
+                (channel, str(version))
+                for _, type_, checkpoint_b in kept
+                for channel, version in self.serde.loads_typed((type_, checkpoint_b))["channel_versions"].items()
+            }
+            stored = self.conn.execute(
+                "SELECT channel, version, base_version FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            ).fetchall()
+
+            # 🔹 Bases de deltas referenciados continuam necessárias, mesmo que nenhum checkpoint aponte para elas
+            bases = {(channel, version): base for channel, version, base in stored if base}
+            pending = list(referenced)
+            while pending:
+                channel, version = pending.pop()
+                base = bases.get((channel, version))
+                if base and (channel, base) not in referenced:
+                    referenced.add((channel, base))
+                    pending.append((channel, base))
+
+            self.conn.executemany(
+                "DELETE FROM checkpoint_blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                [(thread_id, checkpoint_ns, channel, version) for channel, version, _ in stored if (channel, version) not in referenced],
+            )
+
+        return len(dropped)
+
+    def compact_all(self) -> int:
+        """Compacta as threads que receberam checkpoints desde a última compactação e libera páginas livres."""
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+
+        removed = sum(self.compact(thread_id, checkpoint_ns) for thread_id, checkpoint_ns in dirty)
+        if removed:
+            with self.lock:
+                self.conn.execute("PRAGMA incremental_vacuum")
+            print(f"🧹 Compactação de checkpoints: {removed} removidos em {len(dirty)} threads")
+        return removed
+
+    def _compaction_loop(self):
+        while not self._stop.wait(self.compaction_interval):
+            try:
+                self.compact_all()
+            except Exception as e:
+                print("❌ Erro na compactação de checkpoints:", str(e))
+
+    def close(self):
+        self._stop.set()
+        with self.lock:
+            self.conn.close()
+
+
+def get_checkpointer():
+    """Checkpointer do modo embarcado: SQLite durável se `CHECKPOINT_DB` estiver definido, senão em memória."""
+    path = os.getenv("CHECKPOINT_DB")
+    if path:
+        return SqliteCheckpointer(path)
+
+    from langgraph.checkpoint.memory import MemorySaver
+
+    return MemorySaver()
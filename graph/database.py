@@ -1,8 +1,17 @@
 import os
+import time
+from contextlib import contextmanager
 
+from approximate import approximate_query
+from cancellation import RunCancelled, current_token, metrics
 from dotenv import load_dotenv
 from langchain_community.utilities import SQLDatabase
-from sqlalchemy import create_engine
+from llm_gateway import LatencyTracker
+from mirror import get_mirror
+from sqlalchemy import create_engine, text
+
+# Duração das consultas concluídas (base da estimativa de tempo recuperado ao cancelar uma query)
+query_latency = LatencyTracker()
 
 
 class PostgresDB:
@@ -22,6 +31,12 @@ class PostgresDB:
         # Cria a conexão ao banco de dados
         self.db = self._connect()
 
+        # Espelho analítico opcional (DuckDB) para consultas de agregação
+        self.mirror = get_mirror(
+            f"host={self.host} port={self.port} dbname={self.database} user={self.user} password={self.password}",
+            self.schema,
+        )
+
     def _connect(self):
         """Cria o engine do SQLAlchemy e instancia o SQLDatabase com suporte a schemas e engine_args."""
         connection_string = f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
@@ -34,15 +49,15 @@ class PostgresDB:
         }
 
         # Cria o engine do SQLAlchemy
-        engine = create_engine(connection_string, **engine_args)
+        self.engine = create_engine(connection_string, **engine_args)
 
         # Instancia o SQLDatabase com o schema informado
-        return SQLDatabase(engine=engine, schema=self.schema)
+        return SQLDatabase(engine=self.engine, schema=self.schema)
 
     def change_schema(self, new_schema: str):
         """Altera dinamicamente o schema do banco de dados sem precisar recriar a conexão."""
         self.schema = new_schema
-        self.db = SQLDatabase(engine=self.db.engine, schema=self.schema)
+        self.db = SQLDatabase(engine=self.engine, schema=self.schema)
         print(f"🔄 Schema alterado para '{self.schema}'")
 
     def get_tables(self):
@@ -53,6 +68,118 @@ class PostgresDB:
             print("❌ Erro ao buscar tabelas:", str(e))
             return []
 
+    @contextmanager
+    def connection(self):
+        """Abre uma conexão do pool já posicionada no schema atual."""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("SET search_path TO %s", (self.schema,))
+            yield conn
+
+    def explain_cost(self, query: str):
+        """
+        Valida a query com `EXPLAIN` (sem executá-la) e retorna o custo estimado pelo planner.
+        Retorna uma tupla `(custo, erro)`: o custo é `None` quando a query é inválida.
+        """
+        try:
+            with self.connection() as conn:
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query.strip().rstrip(';')}")).scalar()
+            return plan[0]["Plan"]["Total Cost"], None
+        except Exception as e:
+            return None, str(e)
+
+    def fetch(self, query: str):
+        """
+        Executa uma consulta e retorna `(colunas, linhas)`, levantando exceção em caso de erro.
+        Consultas analíticas de leitura sobre as tabelas espelhadas são roteadas para o DuckDB,
+        com fallback para o PostgreSQL se o espelho falhar.
+        """
+        if self.mirror and self.mirror.can_serve(query):
+            try:
+                return self.mirror.fetch(query)
+            except Exception as e:
+                print("⚠️ Espelho DuckDB falhou, usando o PostgreSQL:", str(e))
+
+        token = current_token()
+        with self.connection() as conn:
+            if token is None:
+                return self._execute(conn, query)
+
+            # 🔹 Se a execução do grafo for cancelada, a query em andamento é interrompida no servidor
+            token.raise_if_cancelled()
+            pid = conn.connection.dbapi_connection.get_backend_pid()
+            started = time.perf_counter()
+
+            def cancel_backend():
+                self.cancel_backend(pid)
+                metrics.record("db", time.perf_counter() - started, query_latency.percentile(("postgres",), 0.5))
+
+            unregister = token.on_cancel(cancel_backend)
+            try:
+                return self._execute(conn, query)
+            except Exception as e:
+                if token.cancelled:
+                    raise RunCancelled() from e
+                raise
+            finally:
+                unregister()
+
+    def fetch_approximate(self, query: str, percent: float):
+        """
+        Modo aproximado: executa agregações elegíveis sobre uma amostra de `percent`% dos blocos
+        (`TABLESAMPLE SYSTEM`), com os totais extrapolados. Retorna `(colunas, linhas, aproximação)`;
+        a aproximação é `None` quando a query roda de forma exata (não elegível, atendida pelo espelho
+        DuckDB ou amostra pequena demais).
+        """
+        approximate = approximate_query(query, percent)
+        if approximate is None or (self.mirror and self.mirror.can_serve(query)):
+            return (*self.fetch(query), None)
+
+        result = approximate.finish(*self.fetch(approximate.sql))
+        if result is None:
+            print("⚠️ Amostra pequena demais; executando a query exata")
+            return (*self.fetch(query), None)
+        return result
+
+    def _execute(self, conn, query: str):
+        started = time.perf_counter()
+        result = conn.execute(text(query))
+        if not result.returns_rows:
+            return [], []
+        columns, rows = list(result.keys()), [tuple(row) for row in result.fetchall()]
+        query_latency.record(("postgres",), time.perf_counter() - started)
+        return columns, rows
+
+    def cancel_backend(self, pid: int):
+        """Cancela a query em execução no backend `pid` (usando outra conexão do pool)."""
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+        print(f"🛑 Query cancelada no PostgreSQL (backend {pid})")
+
+    def stream(self, query: str, chunk_size: int = 1000, describe: bool = False):
+        """
+        Executa a consulta com cursor do lado do servidor e gera os resultados em blocos, com memória constante.
+        O primeiro item gerado é a lista de colunas; os seguintes são listas de até `chunk_size` linhas.
+        Com `describe=True`, o primeiro item traz `(coluna, oid_do_tipo)` da descrição do cursor.
+        """
+        with self.connection() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(text(query))
+            if describe:
+                yield [(column[0], column[1]) for column in result.cursor.description]
+            else:
+                yield list(result.keys())
+            for partition in result.partitions(chunk_size):
+                yield partition
+
+    def run_no_throw(self, query: str) -> str:
+        """Executa a consulta e retorna o resultado como string (ou a mensagem de erro), como o `SQLDatabase`."""
+        try:
+            _, rows = self.fetch(query)
+        except RunCancelled:
+            raise
+        except Exception as e:
+            return f"Error: {e}"
+        return str(rows) if rows else ""
+
     def run_query(self, query: str):
         """Executa uma consulta SQL e retorna o resultado."""
         try:
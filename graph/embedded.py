@@ -0,0 +1,188 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from cancellation import cancel_run
+from langchain_core.messages import BaseMessage, convert_to_messages
+
+# Execuções encerradas mantidas em memória para `join_stream` tardios
+MAX_FINISHED_RUNS = 256
+
+
+class StreamPart(NamedTuple):
+    """Mesmo formato dos eventos de `langgraph_sdk` (`chunk.event`, `chunk.data`)."""
+
+    event: str
+    data: Any
+
+
+def to_json_values(values: Any) -> Any:
+    """Converte mensagens do estado em dicts, como o servidor da LangGraph API as entrega ao cliente."""
+    if isinstance(values, BaseMessage):
+        return values.model_dump()
+    if isinstance(values, dict):
+        return {key: to_json_values(value) for key, value in values.items()}
+    if isinstance(values, (list, tuple)):
+        return [to_json_values(value) for value in values]
+    return values
+
+
+class EmbeddedRun:
+    """Uma execução do grafo no próprio processo; os eventos ficam guardados para quem fizer `join_stream`."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.events: List[StreamPart] = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def publish(self, part: StreamPart):
+        self.events.append(part)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[StreamPart]:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class EmbeddedThreads:
+    """
+    Subconjunto de `client.threads` usado pelo `app.py`, apoiado no checkpointer do grafo.
+    Com o checkpointer durável (`SqliteCheckpointer`), o registro das threads também é gravado nele e
+    recarregado na inicialização, então a barra lateral continua listando as conversas após um restart.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        # 🔹 `MemorySaver` não tem registro: as threads, assim como os checkpoints, duram só o processo
+        self._registry = graph.checkpointer if hasattr(graph.checkpointer, "put_thread") else None
+        self._threads: Dict[str, Dict[str, Any]] = {}
+        if self._registry:
+            self._threads = {thread["thread_id"]: thread for thread in self._registry.list_threads()}
+
+    async def create(self, thread_id: str = None, if_exists: str = "raise", metadata: Dict[str, Any] = None):
+        thread_id = thread_id or str(uuid.uuid4())
+        if thread_id in self._threads:
+            if if_exists != "do_nothing":
+                raise ValueError(f"Thread {thread_id} already exists")
+            return self._threads[thread_id]
+
+        thread = {
+            "thread_id": thread_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "metadata": metadata or {},
+        }
+        self._threads[thread_id] = thread
+        if self._registry:
+            await asyncio.to_thread(self._registry.put_thread, thread)
+        return thread
+
+    async def get_state(self, thread_id: str):
+        snapshot = await self.graph.aget_state({"configurable": {"thread_id": thread_id}})
+        return {"values": to_json_values(snapshot.values), "next": list(snapshot.next)}
+
+    async def search(self, metadata: Dict[str, Any] = None, limit: int = 10, offset: int = 0):
+        matches = [
+            thread
+            for thread in self._threads.values()
+            if all(thread["metadata"].get(key) == value for key, value in (metadata or {}).items())
+        ]
+        matches.sort(key=lambda thread: thread["created_at"], reverse=True)
+        return matches[offset : offset + limit]
+
+
+class EmbeddedRuns:
+    """Subconjunto de `client.runs`: executa o grafo com `astream` no event loop do próprio app."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._runs: Dict[str, EmbeddedRun] = {}
+        self._active: Dict[str, str] = {}
+
+    async def create(
+        self,
+        thread_id: str,
+        assistant_id: str,
+        input: Dict[str, Any],
+        stream_mode="values",
+        multitask_strategy: Optional[str] = None,
+        **kwargs,
+    ):
+        previous = self._runs.get(self._active.get(thread_id, ""))
+        if previous is not None and not previous.done and multitask_strategy == "interrupt":
+            await self.cancel(thread_id, previous.run_id)
+
+        self._prune()
+        run = EmbeddedRun(str(uuid.uuid4()))
+        self._runs[run.run_id] = run
+        self._active[thread_id] = run.run_id
+        # 🔹 O run_id em `configurable` identifica a execução para o cancelamento (como no servidor da LangGraph API)
+        config = {"configurable": {"thread_id": thread_id, "run_id": run.run_id}, "run_id": run.run_id}
+
+        graph_input = dict(input)
+        if "messages" in graph_input:
+            graph_input["messages"] = convert_to_messages(graph_input["messages"])
+
+        async def execute():
+            try:
+                async for chunk in self.graph.astream(graph_input, config, stream_mode=stream_mode):
+                    run.publish(StreamPart("values", to_json_values(chunk)))
+            except asyncio.CancelledError:
+                run.publish(StreamPart("error", {"message": "Run cancelled"}))
+            except Exception as e:
+                print("❌ Erro na execução embarcada do grafo:", str(e))
+                run.publish(StreamPart("error", {"message": str(e)}))
+            finally:
+                run.done = True
+                run.publish(StreamPart("end", None))
+
+        run.task = asyncio.create_task(execute())
+        return {"run_id": run.run_id, "thread_id": thread_id, "status": "pending"}
+
+    async def cancel(self, thread_id: str, run_id: str, **kwargs):
+        """Cancela a task da execução e sinaliza o token, interrompendo LLM e queries em andamento."""
+        run = self._runs.get(run_id)
+        if run is None or run.done:
+            return
+        await asyncio.to_thread(cancel_run, run_id)
+        run.task.cancel()
+
+    def _prune(self):
+        finished = [run_id for run_id, run in self._runs.items() if run.done]
+        for run_id in finished[: max(0, len(finished) - MAX_FINISHED_RUNS)]:
+            del self._runs[run_id]
+
+    async def join_stream(self, thread_id: str, run_id: str) -> AsyncIterator[StreamPart]:
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        async for part in run.follow():
+            yield part
+
+
+class EmbeddedClient:
+    """
+    Cliente com a mesma interface do `langgraph_sdk.get_client()` (apenas o que o `app.py` usa),
+    que executa o grafo compilado no próprio processo, sem o salto HTTP até o servidor da LangGraph API.
+    """
+
+    def __init__(self, graph):
+        self.threads = EmbeddedThreads(graph)
+        self.runs = EmbeddedRuns(graph)
+
+
+def get_embedded_client() -> EmbeddedClient:
+    """Usa o grafo compilado de `workflow.graph` com o checkpointer local (ver `get_checkpointer`) e retorna o cliente embarcado."""
+    from checkpointer import get_checkpointer
+    from workflow import graph
+
+    return EmbeddedClient(graph.copy(update={"checkpointer": get_checkpointer()}))
@@ -0,0 +1,120 @@
+import csv
+import io
+import os
+import tempfile
+import zlib
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+from pagination import split_paging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 🔹 Dependência opcional: sem pyarrow, apenas a exportação CSV fica disponível
+    pa = pq = None
+
+# Linhas buscadas por vez no cursor do servidor (a memória usada não depende do tamanho do resultado)
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# Tamanho dos blocos lidos do arquivo Parquet temporário ao enviar a resposta
+FILE_CHUNK_BYTES = 1024 * 1024
+
+
+# Tipos do PostgreSQL (OID da descrição do cursor) → Arrow; os demais são exportados como texto
+_PG_ARROW_TYPES = {
+    16: lambda: pa.bool_(),
+    20: lambda: pa.int64(),
+    21: lambda: pa.int64(),
+    23: lambda: pa.int64(),
+    700: lambda: pa.float64(),
+    701: lambda: pa.float64(),
+    1700: lambda: pa.float64(),  # 🔹 numeric
+    1082: lambda: pa.date32(),
+    1114: lambda: pa.timestamp("us"),
+    1184: lambda: pa.timestamp("us", tz="UTC"),
+}
+
+
+def export_query(sql: str) -> str:
+    """
+    Query usada na exportação: a SQL da resposta sem o LIMIT/OFFSET final (o prompt de SQL limita as
+    respostas a poucos registros, mas a exportação é do resultado completo).
+    """
+    return split_paging(sql)[0]
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Comprime os blocos em formato gzip de forma incremental (um único membro gzip válido)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 🔹 wbits=31 → cabeçalho e rodapé gzip
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def csv_chunks(db, query: str, chunk_size: int = EXPORT_CHUNK_SIZE, gzip: bool = False) -> Iterator[bytes]:
+    """
+    Reexecuta a query com cursor do lado do servidor e gera o CSV em blocos (cabeçalho + um bloco por lote).
+    Com `gzip=True`, os blocos já saem comprimidos.
+    """
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        batches = db.stream(query, chunk_size)
+
+        writer.writerow(next(batches))
+        for batch in batches:
+            writer.writerows(batch)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    return gzip_chunks(generate()) if gzip else generate()
+
+
+def _arrow_type(type_code):
+    return _PG_ARROW_TYPES.get(type_code, lambda: pa.string())()
+
+
+def _arrow_column(values: list, type_):
+    # 🔹 Decimal vira float: o tipo decimal do Arrow exige precisão fixa, que o resultado não informa
+    if pa.types.is_string(type_):
+        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    else:
+        values = [float(v) if isinstance(v, Decimal) else v for v in values]
+    return pa.array(values, type=type_)
+
+
+def parquet_chunks(db, query: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Grava o resultado em um Parquet temporário, um row group por lote do cursor, e envia o arquivo em blocos.
+    Apenas um lote fica em memória por vez; o arquivo é removido ao final.
+    """
+    if pq is None:
+        raise RuntimeError("A exportação Parquet requer o pacote pyarrow.")
+
+    with tempfile.NamedTemporaryFile(suffix=".parquet") as tmp:
+        batches = db.stream(query, chunk_size, describe=True)
+        # 🔹 O schema vem da descrição do cursor, não do primeiro lote: uma coluna só com NULLs nele
+        # teria tipo `null` e os lotes seguintes não poderiam ser convertidos
+        schema = pa.schema([(name, _arrow_type(type_code)) for name, type_code in next(batches)])
+
+        with pq.ParquetWriter(tmp.name, schema) as writer:
+            for batch in batches:
+                columns = list(zip(*batch))
+                writer.write_table(
+                    pa.Table.from_arrays(
+                        [_arrow_column(list(values), field.type) for values, field in zip(columns, schema)],
+                        schema=schema,
+                    )
+                )
+
+        with open(tmp.name, "rb") as f:
+            while chunk := f.read(FILE_CHUNK_BYTES):
+                yield chunk
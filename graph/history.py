@@ -0,0 +1,64 @@
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+# Quantidade de mensagens renderizadas por vez no histórico da conversa
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "30"))
+
+# Threads antigas não têm a marcação `internal`: reconhecemos as mensagens de progresso e a SQL gerada pelo conteúdo
+_STATUS_PREFIXES = ("⏳", "🔍", "🔎", "✅", "❌")
+_SQL_MESSAGE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+# Prompts do agente gravados como mensagens `human` (esquema, pedidos de correção da SQL, resultado da query)
+_PROMPT_PREFIXES = (
+    "Você é um especialista em postgresql",
+    "Sua query retornou com esse erro",
+    "### **📌 Pergunta do usuário**",
+    "🔹 **Pergunta do usuário**",
+)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _is_tagged(msg: Dict[str, Any]) -> bool:
+    return bool((msg.get("additional_kwargs") or {}).get("internal"))
+
+
+def is_internal_message(msg: Dict[str, Any], legacy: bool = True) -> bool:
+    """
+    Indica se a mensagem é interna ao agente (progresso, SQL, prompts) e não deve aparecer no histórico.
+    `legacy` indica uma thread sem a marcação `internal`, em que progresso e SQL só são reconhecidos pelo conteúdo.
+    """
+    if msg.get("type") not in ("human", "ai"):
+        return True
+    if _is_tagged(msg):
+        return True
+
+    content = _text(msg.get("content")).strip()
+    if not content:
+        return True
+    if msg["type"] == "human":
+        return content.startswith(_PROMPT_PREFIXES)
+    # 🔹 Em threads marcadas, uma resposta que começa com "✅" ou "WITH" é do usuário: só as antigas usam o conteúdo
+    return legacy and (content.startswith(_STATUS_PREFIXES) or bool(_SQL_MESSAGE.match(content)))
+
+
+def visible_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filtra as mensagens internas, mantendo a ordem da conversa."""
+    legacy = not any(_is_tagged(msg) for msg in messages)
+    return [msg for msg in messages if not is_internal_message(msg, legacy)]
+
+
+def history_page(
+    messages: List[Dict[str, Any]], before: int = None, limit: int = HISTORY_PAGE_SIZE
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Retorna a página de mensagens visíveis que termina antes da posição `before` (o final, se omitido),
+    junto com a posição da primeira mensagem da página. Posição 0 indica que não há mensagens mais antigas.
+    """
+    end = len(messages) if before is None else max(0, min(before, len(messages)))
+    start = max(0, end - limit)
+    return messages[start:end], start
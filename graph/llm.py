@@ -2,6 +2,7 @@ import os
 
 from dotenv import load_dotenv
 from langchain_openai import AzureChatOpenAI
+from llm_gateway import LLMGateway
 
 load_dotenv()  # Carrega variáveis de ambiente
 
@@ -22,4 +23,29 @@ model = AzureChatOpenAI(
     azure_deployment=AZURE_OPENAI_DEPLOYMENT_NAME,
     openai_api_version=AZURE_OPENAI_API_VERSION,
     openai_api_key=AZURE_OPENAI_API_KEY,
+    max_retries=0,  # 🔹 Os 429 são tratados pelo gateway, que respeita o Retry-After
+)
+
+# Deployment secundária (opcional) usada para hedge de chamadas lentas da primária
+AZURE_OPENAI_SECONDARY_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_SECONDARY_DEPLOYMENT_NAME")
+
+secondary_model = None
+if AZURE_OPENAI_SECONDARY_DEPLOYMENT_NAME:
+    secondary_model = AzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_SECONDARY_ENDPOINT", AZURE_OPENAI_ENDPOINT),
+        azure_deployment=AZURE_OPENAI_SECONDARY_DEPLOYMENT_NAME,
+        openai_api_version=AZURE_OPENAI_API_VERSION,
+        openai_api_key=os.getenv("AZURE_OPENAI_SECONDARY_API_KEY", AZURE_OPENAI_API_KEY),
+        max_retries=0,
+    )
+
+# Gateway compartilhado: limites de RPM/TPM da deployment (opcionais), lanes de prioridade e coalescing
+gateway = LLMGateway(
+    model,
+    rpm=float(os.getenv("AZURE_OPENAI_RPM", "0")) or None,
+    tpm=float(os.getenv("AZURE_OPENAI_TPM", "0")) or None,
+    max_retries=int(os.getenv("AZURE_OPENAI_MAX_RETRIES", "3")),
+    secondary=secondary_model,
+    hedge=os.getenv("AZURE_OPENAI_HEDGE", "false").lower() == "true",
+    hedge_percentile=float(os.getenv("AZURE_OPENAI_HEDGE_PERCENTILE", "0.9")),
 )
@@ -0,0 +1,503 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from cancellation import CancellationToken, RunCancelled, current_token, metrics
+
+# Prioridade de cada lane (menor = atendida primeiro quando o limite de taxa está saturado)
+LANE_PRIORITIES = {
+    "answer": 0,
+    "interaction": 1,
+    "sql": 1,
+    "default": 2,
+    "visualization": 3,
+}
+
+# Estimativa grosseira de caracteres por token (evita depender do download de encodings do tiktoken)
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """Token bucket com reposição contínua a partir de uma taxa por minuto."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        # 🔹 A Azure avalia os limites em janelas de 10s, então o burst padrão é 1/6 da cota por minuto
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos até haver `amount` tokens disponíveis (0 se já houver)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self, seconds: float):
+        """Zera o bucket e o mantém vazio por `seconds` (usado quando o servidor responde 429)."""
+        self.tokens = -seconds * self.rate
+        # 🔹 A reposição recomeça agora: o tempo desde a última reposição (a própria chamada que levou o 429)
+        # não pode ser creditado, senão o Retry-After seria encurtado
+        self.updated_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Limita requisições e tokens estimados por minuto, atendendo os pedidos em espera por prioridade
+    de lane e, dentro da mesma lane, por ordem de chegada.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+        self._cond = threading.Condition()
+        self._waiting: List[tuple] = []
+        self._seq = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.requests or self.tokens)
+
+    def _wait_time(self, tokens: int) -> float:
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def acquire(self, tokens: int, priority: int = LANE_PRIORITIES["default"]):
+        """Bloqueia até a requisição caber nos limites e ser a de maior prioridade na fila."""
+        if not self.enabled:
+            return
+
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        wait = self._wait_time(tokens)
+                        if wait <= 0:
+                            if self.requests:
+                                self.requests.consume(1)
+                            if self.tokens:
+                                self.tokens.consume(tokens)
+                            return
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def penalize(self, retry_after: float):
+        """Bloqueia novas requisições por `retry_after` segundos após um 429 do servidor."""
+        with self._cond:
+            for bucket in (self.requests, self.tokens):
+                if bucket:
+                    bucket.drain(retry_after)
+            self._cond.notify_all()
+
+
+class SingleFlight:
+    """Garante que chamadas idênticas simultâneas compartilhem uma única execução."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+def _as_messages(model_input: Any) -> list:
+    """Normaliza a entrada do modelo (string, lista de mensagens ou PromptValue) em `(tipo, conteúdo)`."""
+    if isinstance(model_input, str):
+        return [("human", model_input)]
+    if hasattr(model_input, "to_messages"):
+        model_input = model_input.to_messages()
+    return [(getattr(m, "type", "human"), getattr(m, "content", m)) for m in model_input]
+
+
+def estimate_tokens(model_input: Any, completion_tokens: int = 0) -> int:
+    """Estima os tokens de prompt (pelo tamanho do texto) somados à reserva para a resposta."""
+    chars = sum(
+        len(content) if isinstance(content, str) else len(json.dumps(content, default=str))
+        for _, content in _as_messages(model_input)
+    )
+    return chars // CHARS_PER_TOKEN + completion_tokens
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Retorna o `Retry-After` de um erro 429 do cliente OpenAI, ou `None` se não for um 429."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status != 429 and type(error).__name__ != "RateLimitError":
+        return None
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class LatencyTracker:
+    """Mantém uma janela deslizante de latências por chave (deployment, lane) e calcula percentis."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: tuple, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: tuple, q: float) -> Optional[float]:
+        """Retorna o percentil `q` (0–1) da chave, ou `None` se ainda não houver amostras suficientes."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Resumo p50/p90/p99 por chave, para logs e métricas."""
+        with self._lock:
+            keys = list(self._samples)
+        summary = {}
+        for key in keys:
+            with self._lock:
+                samples = sorted(self._samples[key])
+            summary["/".join(key)] = {
+                "count": len(samples),
+                **{f"p{int(q * 100)}": samples[min(len(samples) - 1, int(q * len(samples)))] for q in (0.5, 0.9, 0.99)},
+            }
+        return summary
+
+
+def cached_prompt_tokens(response: Any) -> tuple:
+    """
+    Extrai `(tokens_de_prompt, tokens_em_cache)` de uma resposta do modelo.
+    Usa `usage_metadata` do LangChain e, como fallback, o `token_usage` bruto da API.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage:
+        return usage.get("input_tokens", 0), (usage.get("input_token_details") or {}).get("cache_read", 0)
+
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    details = token_usage.get("prompt_tokens_details") or {}
+    return token_usage.get("prompt_tokens", 0), details.get("cached_tokens", 0)
+
+
+class PromptCacheStats:
+    """Acumula, por lane, tokens de prompt, tokens servidos do cache do provedor e latência com/sem cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lanes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, lane: str, response: Any, seconds: float):
+        prompt_tokens, cached_tokens = cached_prompt_tokens(response)
+        if not prompt_tokens:
+            return
+
+        with self._lock:
+            stats = self._lanes.setdefault(
+                lane,
+                {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "hits": 0, "hit_seconds": 0.0, "miss_seconds": 0.0},
+            )
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                stats["hits"] += 1
+                stats["hit_seconds"] += seconds
+            else:
+                stats["miss_seconds"] += seconds
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Taxa de acerto (chamadas e tokens) e latência média com e sem cache, por lane."""
+        with self._lock:
+            lanes = {lane: dict(stats) for lane, stats in self._lanes.items()}
+
+        summary = {}
+        for lane, stats in lanes.items():
+            misses = stats["calls"] - stats["hits"]
+            summary[lane] = {
+                "calls": stats["calls"],
+                "hit_rate": stats["hits"] / stats["calls"],
+                "cached_token_ratio": stats["cached_tokens"] / stats["prompt_tokens"],
+                "avg_seconds_hit": stats["hit_seconds"] / stats["hits"] if stats["hits"] else None,
+                "avg_seconds_miss": stats["miss_seconds"] / misses if misses else None,
+            }
+        return summary
+
+
+class LLMGateway:
+    """
+    Ponto único de acesso ao modelo: aplica limites de RPM/TPM por lane de prioridade,
+    trata 429 respeitando o `Retry-After` e coalesce prompts idênticos em voo.
+
+    Com uma deployment secundária e `hedge=True`, chamadas que passam do p90 de latência da lane
+    na deployment primária são duplicadas na secundária: a primeira resposta vence e a outra é cancelada.
+    """
+
+    def __init__(
+        self,
+        model,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = 3,
+        completion_tokens: int = 500,
+        secondary=None,
+        hedge: bool = False,
+        hedge_percentile: float = 0.9,
+    ):
+        self.model = model
+        self.limiter = RateLimiter(rpm, tpm)
+        self.single_flight = SingleFlight()
+        self.max_retries = max_retries
+        self.completion_tokens = completion_tokens
+
+        self.secondary = secondary
+        self.hedge = hedge and secondary is not None
+        self.hedge_percentile = hedge_percentile
+        self.latency = LatencyTracker()
+        self.cache_stats = PromptCacheStats()
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+        self._structured: Dict[tuple, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Loop assíncrono dedicado do gateway. As chamadas com hedge precisam de `ainvoke` para poderem ser
+        canceladas, e os clientes HTTP assíncronos devem ficar sempre no mesmo loop.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        return self._loop
+
+    async def _timed_ainvoke(self, name: str, model, model_input: Any, lane: str, kwargs: dict) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await model.ainvoke(model_input, **kwargs)
+        except asyncio.CancelledError:
+            # 🔹 Chamadas canceladas (hedge perdedor, execução abortada) entram com o tempo até o cancelamento,
+            # um limite inferior: sem elas, o percentil ignoraria justamente as caudas longas
+            self.latency.record((name, lane), time.perf_counter() - started)
+            raise
+        self.latency.record((name, lane), time.perf_counter() - started)
+        return result
+
+    def _bound(self, model, schema: Optional[type]):
+        """Retorna o modelo (ou sua versão com saída estruturada para `schema`, mantendo a resposta bruta)."""
+        if schema is None:
+            return model
+        key = (id(model), schema)
+        if key not in self._structured:
+            self._structured[key] = model.with_structured_output(schema, include_raw=True)
+        return self._structured[key]
+
+    async def _hedged(self, model_input: Any, lane: str, kwargs: dict, schema: Optional[type]) -> Any:
+        primary = asyncio.create_task(
+            self._timed_ainvoke("primary", self._bound(self.model, schema), model_input, lane, kwargs)
+        )
+        tasks = [primary]
+
+        try:
+            delay = self.latency.percentile(("primary", lane), self.hedge_percentile)
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.hedges_fired += 1
+            secondary = asyncio.create_task(
+                self._timed_ainvoke("secondary", self._bound(self.secondary, schema), model_input, lane, kwargs)
+            )
+            tasks.append(secondary)
+            pending = {primary, secondary}
+            first_error = None
+
+            # 🔹 A primeira resposta bem-sucedida vence; a chamada perdedora é cancelada
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.hedges_won += 1
+                        return task.result()
+                    first_error = first_error or task.exception()
+
+            raise first_error
+        finally:
+            # 🔹 Perdedores do hedge e chamadas de execuções canceladas não continuam em voo
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _invoke_once(
+        self, model_input: Any, lane: str, kwargs: dict, schema: Optional[type], token: Optional[CancellationToken]
+    ) -> Any:
+        if not self.hedge and token is None:
+            started = time.perf_counter()
+            result = self._bound(self.model, schema).invoke(model_input, **kwargs)
+            self.latency.record(("primary", lane), time.perf_counter() - started)
+            return result
+
+        # 🔹 No loop assíncrono a chamada pode ser abortada (hedge perdedor ou execução cancelada)
+        if self.hedge:
+            coroutine = self._hedged(model_input, lane, kwargs, schema)
+        else:
+            coroutine = self._timed_ainvoke("primary", self._bound(self.model, schema), model_input, lane, kwargs)
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._event_loop())
+        if token is None:
+            return future.result()
+
+        started = time.perf_counter()
+
+        def abort():
+            if future.cancel():
+                expected = self.latency.percentile(("primary", lane), 0.5)
+                metrics.record("llm", time.perf_counter() - started, expected)
+
+        unregister = token.on_cancel(abort)
+        try:
+            return future.result()
+        except CancelledError:
+            raise RunCancelled() from None
+        finally:
+            unregister()
+
+    def _key(self, model_input: Any, kwargs: dict, schema: Optional[type]) -> str:
+        schema_name = getattr(schema, "__name__", None)
+        payload = json.dumps([_as_messages(model_input), kwargs, schema_name], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _call(
+        self,
+        model_input: Any,
+        lane: str,
+        kwargs: dict,
+        schema: Optional[type] = None,
+        token: Optional[CancellationToken] = None,
+    ) -> Any:
+        priority = LANE_PRIORITIES.get(lane, LANE_PRIORITIES["default"])
+        tokens = estimate_tokens(model_input, self.completion_tokens)
+
+        for attempt in range(self.max_retries + 1):
+            if token is not None:
+                token.raise_if_cancelled()
+            self.limiter.acquire(tokens, priority)
+            try:
+                started = time.perf_counter()
+                result = self._invoke_once(model_input, lane, kwargs, schema, token)
+                if schema is None:
+                    self.cache_stats.record(lane, result, time.perf_counter() - started)
+                    return result
+
+                self.cache_stats.record(lane, result["raw"], time.perf_counter() - started)
+                if result.get("parsing_error"):
+                    raise result["parsing_error"]
+                return result["parsed"]
+            except RunCancelled:
+                raise
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                print(f"⏳ Limite da Azure atingido (lane '{lane}'), aguardando {retry_after:.1f}s")
+                if self.limiter.enabled:
+                    self.limiter.penalize(retry_after)
+                else:
+                    time.sleep(retry_after)
+
+    def invoke(
+        self, model_input: Any, lane: str = "default", coalesce: bool = True, schema: Optional[type] = None, **kwargs
+    ) -> Any:
+        """
+        Invoca o modelo respeitando os limites. Com `coalesce=True`, chamadas idênticas simultâneas
+        compartilham a mesma requisição ao provedor. Com `schema` (modelo Pydantic), usa saída
+        estruturada e retorna a instância já validada.
+        Dentro de uma execução do grafo, a chamada é abortada se a execução for cancelada (`RunCancelled`).
+        """
+        return self._invoke(model_input, lane, coalesce, schema, kwargs, current_token())
+
+    def _invoke(
+        self,
+        model_input: Any,
+        lane: str,
+        coalesce: bool,
+        schema: Optional[type],
+        kwargs: dict,
+        token: Optional[CancellationToken],
+    ) -> Any:
+        if not coalesce:
+            return self._call(model_input, lane, kwargs, schema, token)
+
+        key = self._key(model_input, kwargs, schema)
+        while True:
+            try:
+                return self.single_flight.do(key, lambda: self._call(model_input, lane, kwargs, schema, token))
+            except RunCancelled:
+                # 🔹 Seguidores compartilham a chamada (e o token) do líder: se quem foi cancelado foi o líder,
+                # e não esta execução, a chamada é refeita
+                if token is not None and token.cancelled:
+                    raise
+
+    def batch(self, inputs: list, lane: str = "default", coalesce: bool = True, **kwargs) -> list:
+        """Invoca o modelo para várias entradas em paralelo; erros são retornados no lugar da resposta."""
+        # 🔹 O contexto do grafo não chega às threads do pool: o token é capturado aqui
+        token = current_token()
+
+        def call(model_input):
+            try:
+                return self._invoke(model_input, lane, coalesce, None, kwargs, token)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, len(inputs))) as executor:
+            return list(executor.map(call, inputs))
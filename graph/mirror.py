@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sql_repair import in_from_function
+
+try:
+    import duckdb
+except ImportError:  # 🔹 Dependência opcional: sem DuckDB, todas as queries seguem para o PostgreSQL
+    duckdb = None
+
+# Tabelas espelhadas e a coluna usada como watermark da sincronização incremental
+MIRRORED_TABLES = {"orders_ia": "creationdate", "orders_items_ia": "creationdate"}
+
+_WRITE_KEYWORDS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|DROP|ALTER|CREATE|TRUNCATE|GRANT|REVOKE|COPY|CALL|VACUUM|SET)\b", re.IGNORECASE
+)
+_ANALYTICAL = re.compile(r"\bGROUP\s+BY\b|\b(SUM|COUNT|AVG|MIN|MAX|STDDEV|PERCENTILE_CONT)\s*\(", re.IGNORECASE)
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+((?:"?\w+"?\.)?"?\w+"?)', re.IGNORECASE)
+_TO_CHAR = re.compile(r"\bTO_CHAR\s*\(\s*(?P<expr>[^,()]+(?:\([^()]*\))?)\s*,\s*'(?P<fmt>[^']*)'\s*\)", re.IGNORECASE)
+
+# Equivalência entre os padrões de TO_CHAR (PostgreSQL) e strftime (DuckDB)
+_TO_CHAR_FORMATS = [("YYYY", "%Y"), ("HH24", "%H"), ("MM", "%m"), ("DD", "%d"), ("MI", "%M"), ("SS", "%S")]
+
+
+def is_read_only(query: str) -> bool:
+    """Indica se a query é uma única consulta de leitura (SELECT/WITH sem comandos de escrita)."""
+    statement = query.strip().rstrip(";")
+    return (
+        bool(re.match(r"(SELECT|WITH)\b", statement, re.IGNORECASE))
+        and ";" not in statement
+        and not _WRITE_KEYWORDS.search(statement)
+    )
+
+
+class AnalyticsMirror:
+    """
+    Espelho colunar local (DuckDB) de `orders_ia`/`orders_items_ia`, sincronizado de forma incremental
+    a partir do PostgreSQL pelo watermark de `creationdate`. Atende apenas consultas analíticas de leitura.
+    """
+
+    def __init__(self, path: str, pg_dsn: str, pg_schema: str, tables: Dict[str, str] = None):
+        self.path = path
+        self.pg_dsn = pg_dsn
+        self.pg_schema = pg_schema
+        self.tables = tables or MIRRORED_TABLES
+        self.sync_interval = int(os.getenv("MIRROR_SYNC_INTERVAL", "300"))
+        self.max_lag = int(os.getenv("MIRROR_MAX_LAG_SECONDS", str(3 * self.sync_interval)))
+
+        self.conn = duckdb.connect(path)
+        self.last_sync: Optional[float] = None
+        self._sync_lock = threading.Lock()
+
+    def _attach(self, cursor):
+        cursor.execute("INSTALL postgres; LOAD postgres;")
+        attached = cursor.execute("SELECT count(*) FROM duckdb_databases() WHERE database_name = 'pg'").fetchone()[0]
+        if not attached:
+            # 🔹 A DSN vai como literal SQL: aspas simples (em senhas, por exemplo) precisam ser duplicadas
+            dsn = self.pg_dsn.replace("'", "''")
+            cursor.execute(f"ATTACH '{dsn}' AS pg (TYPE postgres, READ_ONLY)")
+
+    def sync(self):
+        """
+        Sincroniza as tabelas espelhadas. Na primeira vez copia tudo; depois reescreve apenas as linhas
+        com watermark maior ou igual ao último valor espelhado (cobre linhas que chegaram com o mesmo timestamp).
+        """
+        with self._sync_lock:
+            cursor = self.conn.cursor()
+            self._attach(cursor)
+
+            for table, watermark in self.tables.items():
+                source = f'pg."{self.pg_schema}"."{table}"'
+                cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}" AS SELECT * FROM {source} LIMIT 0')
+
+                last = cursor.execute(f'SELECT max("{watermark}") FROM "{table}"').fetchone()[0]
+                started = time.perf_counter()
+
+                cursor.execute("BEGIN TRANSACTION")
+                if last is None:
+                    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM {source}')
+                else:
+                    cursor.execute(f'DELETE FROM "{table}" WHERE "{watermark}" >= ?', [last])
+                    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM {source} WHERE "{watermark}" >= ?', [last])
+                cursor.execute("COMMIT")
+
+                print(f"🦆 Espelho '{table}' sincronizado em {time.perf_counter() - started:.2f}s (watermark: {last})")
+
+            self.last_sync = time.time()
+
+    def start(self):
+        """Sincroniza periodicamente em uma thread daemon."""
+
+        def loop():
+            while True:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print("❌ Erro ao sincronizar o espelho DuckDB:", str(e))
+                time.sleep(self.sync_interval)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def can_serve(self, query: str) -> bool:
+        """Só atende consultas analíticas de leitura sobre tabelas espelhadas, com o espelho atualizado."""
+        if self.last_sync is None or time.time() - self.last_sync > self.max_lag:
+            return False
+        if not is_read_only(query) or not _ANALYTICAL.search(query):
+            return False
+
+        # 🔹 `EXTRACT(MONTH FROM creationdate)` não referencia uma tabela
+        referenced = {
+            match.group(1).replace('"', "").split(".")[-1]
+            for match in _TABLE_REF.finditer(query)
+            if not in_from_function(query, match.start())
+        }
+        return bool(referenced) and referenced <= set(self.tables)
+
+    def translate(self, query: str) -> str:
+        """Traduz as diferenças de dialeto PostgreSQL → DuckDB mais comuns nas queries geradas."""
+        # 🔹 As tabelas espelhadas ficam no schema padrão do DuckDB
+        for table in self.tables:
+            query = re.sub(rf'"?{re.escape(self.pg_schema)}"?\."?{table}"?', f'"{table}"', query)
+
+        def to_strftime(m: re.Match) -> str:
+            fmt = m.group("fmt")
+            for pg_token, duck_token in _TO_CHAR_FORMATS:
+                fmt = fmt.replace(pg_token, duck_token)
+            return f"strftime({m.group('expr').strip()}, '{fmt}')"
+
+        return _TO_CHAR.sub(to_strftime, query.strip().rstrip(";"))
+
+    def fetch(self, query: str) -> Tuple[List[str], List[tuple]]:
+        """Executa a query traduzida no DuckDB e retorna `(colunas, linhas)`."""
+        cursor = self.conn.cursor()
+        # 🔹 No PostgreSQL, `/` entre inteiros trunca (`7 / 2 = 3`); no DuckDB o padrão é a divisão real (`3.5`)
+        cursor.execute("SET integer_division = true")
+        result = cursor.execute(self.translate(query))
+        columns = [description[0] for description in result.description]
+        return columns, result.fetchall()
+
+
+_mirror: Optional[AnalyticsMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror(pg_dsn: str, pg_schema: str) -> Optional[AnalyticsMirror]:
+    """
+    Retorna o espelho compartilhado pelo processo, iniciando a sincronização na primeira chamada.
+    Retorna `None` se `DUCKDB_MIRROR_PATH` não estiver definido ou se o DuckDB não estiver instalado.
+    """
+    global _mirror
+
+    path = os.getenv("DUCKDB_MIRROR_PATH")
+    if not path or duckdb is None:
+        return None
+
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = AnalyticsMirror(path, pg_dsn, pg_schema)
+            _mirror.start()
+
+    return _mirror
@@ -0,0 +1,50 @@
+import os
+import re
+from typing import Optional, Tuple
+
+from mirror import is_read_only
+
+# Tamanho padrão da página do "mostrar mais" quando a query original não tinha LIMIT
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "5"))
+
+# LIMIT/OFFSET no final da query, em qualquer ordem (`LIMIT n OFFSET m`, `OFFSET m LIMIT n`, `LIMIT n`)
+_TRAILING_PAGING = re.compile(
+    r"\s+(?:LIMIT\s+(?P<limit>\d+)(?:\s+OFFSET\s+(?P<offset>\d+))?"
+    r"|OFFSET\s+(?P<offset2>\d+)(?:\s+ROWS?)?(?:\s+LIMIT\s+(?P<limit2>\d+))?)\s*$",
+    re.IGNORECASE,
+)
+
+
+def split_paging(sql: str) -> Tuple[str, Optional[int], int]:
+    """
+    Separa o LIMIT/OFFSET final da query.
+    Retorna `(query_base, limit, offset)`; `limit` é `None` quando a query não era paginada.
+    """
+    statement = sql.strip().rstrip(";").strip()
+    match = _TRAILING_PAGING.search(statement)
+    if not match:
+        return statement, None, 0
+
+    limit = match.group("limit") or match.group("limit2")
+    offset = match.group("offset") or match.group("offset2")
+    return statement[: match.start()], int(limit) if limit else None, int(offset or 0)
+
+
+def is_pageable(sql: str) -> bool:
+    """Só paginamos consultas de leitura que terminam com LIMIT (rankings do tipo top N)."""
+    return bool(sql) and is_read_only(sql) and split_paging(sql)[1] is not None
+
+
+def next_page(sql: str, offset: Optional[int] = None) -> Tuple[str, int, int]:
+    """
+    Reescreve a query para buscar a próxima página, mantendo o ORDER BY original.
+    Sem `offset`, começa logo após as linhas já exibidas pela resposta original.
+    Busca uma linha a mais que o tamanho da página para saber se ainda há outra página.
+    Retorna `(query, offset, tamanho_da_página)`.
+    """
+    base, limit, original_offset = split_paging(sql)
+    page_size = limit or PAGE_SIZE
+    if offset is None:
+        offset = original_offset + page_size
+
+    return f"{base} LIMIT {page_size + 1} OFFSET {offset}", offset, page_size
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+
+# Tipos em que MIN/MAX são informativos para o LLM (intervalo de datas disponível)
+DATE_TYPES = ("DATE", "TIMESTAMP")
+
+# Tipos em que COUNT(DISTINCT ...) não é suportado ou não faz sentido
+UNPROFILED_TYPES = ("JSON", "ARRAY", "BYTEA")
+
+
+class ColumnProfiler:
+    """
+    Calcula estatísticas por coluna (distintos, nulos, valores mais frequentes, intervalo de datas)
+    em segundo plano e as mantém em cache para serem injetadas no prompt de geração de SQL.
+    """
+
+    def __init__(self, db, tables: List[str], ttl: int = None):
+        self.db = db
+        self.tables = tables
+        self.ttl = ttl if ttl is not None else int(os.getenv("PROFILE_TTL_SECONDS", "21600"))
+        self.low_cardinality = int(os.getenv("PROFILE_LOW_CARDINALITY", "30"))
+        self.top_values = int(os.getenv("PROFILE_TOP_VALUES", "10"))
+
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()  # 🔹 Mantido pela thread de atualização em andamento
+        self._ready = threading.Event()  # 🔹 Sinalizado ao fim do primeiro profiling completo
+
+    def get_stats(self, table: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna as estatísticas em cache da tabela sem bloquear.
+        Se o cache estiver vazio ou expirado, dispara a atualização em segundo plano.
+        """
+        with self._lock:
+            entry = self._cache.get(table)
+
+        if entry is None or time.time() - entry["profiled_at"] > self.ttl:
+            self.refresh_async()
+
+        return entry
+
+    def refresh_async(self):
+        """Dispara o profiling de todas as tabelas em uma thread daemon (no máximo uma por vez)."""
+        # 🔹 Verificar e marcar numa única operação: duas perguntas simultâneas não disparam dois profilings
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing.release()
+            self._ready.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Aguarda o primeiro profiling em segundo plano terminar; retorna `False` se o tempo esgotar."""
+        return self._ready.wait(timeout)
+
+    def refresh(self, tables: List[str] = None):
+        """Calcula as estatísticas de forma síncrona e atualiza o cache."""
+        for table in tables or self.tables:
+            try:
+                stats = self.profile_table(table)
+            except Exception as e:
+                print(f"❌ Erro ao calcular estatísticas de '{table}':", str(e))
+                continue
+
+            with self._lock:
+                self._cache[table] = stats
+
+    def profile_table(self, table: str) -> Dict[str, Any]:
+        """Executa as consultas de profiling de uma tabela e retorna as estatísticas por coluna."""
+        engine = self.db.engine
+        schema = self.db.schema
+        qualified = f'"{schema}"."{table}"'
+
+        columns = [
+            {"name": col["name"], "type": str(col["type"]).upper()}
+            for col in inspect(engine).get_columns(table, schema=schema)
+            if not str(col["type"]).upper().startswith(UNPROFILED_TYPES)
+        ]
+
+        # 🔹 Uma única varredura calcula distintos, não nulos e min/max de todas as colunas
+        select_parts = ["COUNT(*) AS row_count"]
+        for i, col in enumerate(columns):
+            name = col["name"]
+            select_parts.append(f'COUNT(DISTINCT "{name}") AS d{i}')
+            select_parts.append(f'COUNT("{name}") AS nn{i}')
+            if col["type"].startswith(DATE_TYPES):
+                select_parts.append(f'MIN("{name}") AS mn{i}')
+                select_parts.append(f'MAX("{name}") AS mx{i}')
+
+        with engine.connect() as conn:
+            summary = conn.execute(text(f"SELECT {', '.join(select_parts)} FROM {qualified}")).mappings().one()
+            row_count = summary["row_count"] or 0
+
+            column_stats = {}
+            for i, col in enumerate(columns):
+                name = col["name"]
+                stats = {
+                    "type": col["type"],
+                    "distinct": summary[f"d{i}"],
+                    "null_ratio": round(1 - summary[f"nn{i}"] / row_count, 4) if row_count else 0.0,
+                }
+
+                if col["type"].startswith(DATE_TYPES):
+                    stats["min"] = str(summary[f"mn{i}"]) if summary[f"mn{i}"] is not None else None
+                    stats["max"] = str(summary[f"mx{i}"]) if summary[f"mx{i}"] is not None else None
+
+                # 🔹 Dicionário de valores apenas para colunas categóricas de baixa cardinalidade
+                elif 0 < stats["distinct"] <= self.low_cardinality:
+                    rows = conn.execute(
+                        text(
+                            f'SELECT "{name}", COUNT(*) FROM {qualified} WHERE "{name}" IS NOT NULL '
+                            f"GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT :limit"
+                        ),
+                        {"limit": self.top_values},
+                    ).all()
+                    stats["top_values"] = [str(value) for value, _ in rows]
+
+                column_stats[name] = stats
+
+        print(f"📊 Estatísticas calculadas para '{table}' ({len(column_stats)} colunas)")
+
+        return {"row_count": row_count, "columns": column_stats, "profiled_at": time.time()}
@@ -1,6 +1,8 @@
-from langchain.schema import SystemMessage
+from langchain.schema import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 
+from answer_renderer import approximation_note
+
 
 def get_visualization_prompt() -> ChatPromptTemplate:
     """Retorna o prompt para recomendação de visualização de dados em português."""
@@ -66,36 +68,79 @@ def interact_prompt() -> SystemMessage:
         - "Quais são os 5 produtos mais vendidos nos últimos 3 meses?"
 
 
-        ### **Formato de resposta final**
-        Quando tiver certeza de que a pergunta do usuário está bem formulada, retorne **exclusivamente** no seguinte formato JSON e nada alem do JSON:
+        ### **Formato da resposta**
+        Responda sempre preenchendo os campos estruturados:
+        - `is_relevant`: `true` apenas quando a pergunta estiver bem formulada e puder ser respondida com os dados de vendas.
+        - `user_query`: a pergunta normalizada, completa e autossuficiente (obrigatória quando `is_relevant` for `true`).
+        - `reply`: a mensagem para o usuário quando `is_relevant` for `false` (saudação, sugestão ou pedido de esclarecimento).
+        - `intent`: quando possível, a métrica, os agrupamentos, o período, os filtros e o limite pedidos.
+        """
+    )
 
-        {{
-            "is_relevant": boolean,
-            "user_query": string
-        }}
 
+def plan_prompt() -> SystemMessage:
+    """
+    Retorna as instruções do planejador que divide perguntas compostas em sub-perguntas independentes.
+    """
+    return SystemMessage(
+        content="""
+        Você planeja consultas a uma base de vendas de e-commerce (PostgreSQL).
+        Dada uma pergunta, decida se ela pode ser respondida por **uma única consulta SQL simples**.
+
+        - Se puder, retorne `sub_questions` vazio.
+        - Se a pergunta comparar grupos, períodos ou métricas diferentes (ex.: "mulheres vs homens",
+          "faturamento e número de pedidos"), divida-a em **2 a 4 perguntas independentes**, cada uma
+          respondível por uma consulta simples, sem depender do resultado das outras.
+        - Cada sub-pergunta deve ser completa e autossuficiente: repita o período, os filtros e os agrupamentos.
+        - Use os mesmos agrupamentos em todas as sub-perguntas, para que os resultados possam ser combinados.
         """
     )
 
 
-def get_classification_prompt(user_query: str) -> str:
+# Tipos cujos valores vão sem aspas no prompt
+NUMERIC_TYPES = ("SMALLINT", "INTEGER", "BIGINT", "NUMERIC", "DECIMAL", "REAL", "DOUBLE", "FLOAT")
+
+
+def _stats_literal(value: str, col_type: str) -> str:
+    """Escreve um dos `top_values` como literal SQL: `true`/`false`, números sem aspas e textos entre aspas simples."""
+    if col_type.startswith("BOOL"):
+        return value.lower()
+    if col_type.startswith(NUMERIC_TYPES):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def format_column_stats(table: str, stats: dict) -> str:
     """
-    Retorna o prompt para classificar se uma pergunta é relacionada a e-commerce.
+    Formata as estatísticas de colunas de uma tabela de forma compacta para o prompt de SQL.
+    Inclui apenas o que ajuda o LLM a acertar literais e filtros: valores possíveis, intervalos e nulos.
     """
-    return f"""
-    Você é um assistente especializado em e-commerce.
-    Verifique se a seguinte pergunta está relacionada a vendas, produtos ou faturamento.
-    Responda apenas com 'SIM' ou 'NÃO'.
+    lines = [f"{table} ({stats['row_count']} linhas):"]
 
-    Pergunta: "{user_query}"
-    """
+    for column, col_stats in stats["columns"].items():
+        line = f"- {column}: distintos={col_stats['distinct']}"
+
+        if col_stats["null_ratio"]:
+            line += f", nulos={col_stats['null_ratio']:.0%}"
+        if col_stats.get("min") is not None:
+            line += f", de {col_stats['min']} até {col_stats['max']}"
+        if col_stats.get("top_values"):
+            col_type = col_stats.get("type", "")
+            line += ", valores: " + " | ".join(_stats_literal(value, col_type) for value in col_stats["top_values"])
 
+        lines.append(line)
 
-def sql_prompt(schema_context: str, user_question: str) -> str:
+    return "\n".join(lines)
+
+
+def sql_system_prompt(schema_context: str, column_stats: str = "") -> SystemMessage:
     """
-    Retorna um prompt estruturado para gerar queries SQL seguras e otimizadas no PostgreSQL.
+    Retorna o prefixo estático do prompt de SQL (regras + esquema + estatísticas) como SystemMessage.
+    O conteúdo depende apenas do esquema, então é byte a byte idêntico entre perguntas e aproveita
+    o cache de prefixo do provedor; a pergunta vai sempre depois, em `sql_question_prompt`.
     """
-    prompt = f"""
+    return SystemMessage(
+        content=f"""
     Você é um especialista em postgresql com alta atenção aos detalhes.
 
     Dada uma pergunta de entrada, gere uma **consulta SQL sintaticamente correta** para o banco de dados PostgreSQL.
@@ -127,36 +172,32 @@ def sql_prompt(schema_context: str, user_question: str) -> str:
 
     ⚠️ **Se houver qualquer erro ou problema na query SQL, corrija e reescreva antes de executar.**  
     ⚠️ **Se a query estiver correta, apenas gere e retorne a query final.**  
+    ⚠️ **Apenas gere a query SQL final. NÃO inclua explicações ou comentários adicionais no output.**
 
     ### **📌 Esquema do banco de dados**
     {schema_context}
 
-    ### **📌 Pergunta do usuário**
-    "{user_question}"
-
-    ⚠️ **Apenas gere a query SQL final. NÃO inclua explicações ou comentários adicionais no output.**
+    ### **📌 Estatísticas das colunas**
+    Use exatamente os valores listados abaixo ao filtrar colunas categóricas (grafia, maiúsculas e acentos).
+    {column_stats or "Indisponíveis."}
     """
-    return prompt
+    )
+
 
+def sql_question_prompt(user_question: str) -> HumanMessage:
+    """Retorna o sufixo variável do prompt de SQL: apenas a pergunta do usuário."""
+    return HumanMessage(content=f'### **📌 Pergunta do usuário**\n"{user_question}"')
 
-def format_answer_prompt(user_question: str, sql_query: str, query_result: str) -> str:
+
+def answer_system_prompt() -> SystemMessage:
     """
-    Gera um prompt estruturado para o LLM responder ao usuário com base nos resultados da query SQL.
-    Inclui formatação aprimorada dos dados para melhor legibilidade.
+    Retorna as instruções estáticas de formatação da resposta final (prefixo cacheável pelo provedor).
     """
-    return f"""
+    return SystemMessage(
+        content="""
     Você é um assistente especializado em análise de dados e SQL.
     Sua tarefa é responder à pergunta do usuário **de maneira clara e objetiva**, usando os resultados de uma consulta SQL.
 
-    🔹 **Pergunta do usuário**:
-    "{user_question}"
-
-    🔹 **Query SQL executada**:
-    {sql_query}
-
-    🔹 **Resultado da Query**:
-    {query_result}
-
     ✅ **Baseando-se apenas nesses dados, forneça uma resposta clara e bem formatada.**
     ✅ **Formatos recomendados**:
        - **Números grandes** → Use separadores de milhar (`1.000.000,00` em vez de `1000000.00`).
@@ -166,3 +207,29 @@ def format_answer_prompt(user_question: str, sql_query: str, query_result: str)
     ❌ **Não faça suposições. Se os dados não forem suficientes, informe isso ao usuário.**
     ❌ **Não repita a query SQL na resposta. Apenas forneça a informação processada.**
     """
+    )
+
+
+def format_answer_prompt(
+    user_question: str, sql_query: str, query_result: str, approximation: dict = None
+) -> HumanMessage:
+    """
+    Gera a parte variável do prompt de resposta: pergunta, query executada e resultado.
+    No modo aproximado, inclui o aviso da amostragem, que deve constar na resposta.
+    """
+    content = f"""
+    🔹 **Pergunta do usuário**:
+    "{user_question}"
+
+    🔹 **Query SQL executada**:
+    {sql_query}
+
+    🔹 **Resultado da Query**:
+    {query_result}
+    """
+    if approximation:
+        content += f"""
+    ⚠️ **Resultado aproximado**: {approximation_note(approximation)}
+    Apresente os números como estimativas ("cerca de", "aproximadamente") e inclua esse aviso no final da resposta.
+    """
+    return HumanMessage(content=content)
@@ -0,0 +1,38 @@
+import threading
+from typing import Optional
+
+# 🔹 O servidor da LangGraph API carrega `workflow.py` pelo caminho do arquivo, com outro nome de módulo:
+# um `from workflow import ...` no `app.py` criaria um segundo agente (caches, profiler e pool próprios).
+# Este módulo é importado pelo mesmo nome dos dois lados, então o agente e o grafo servido são únicos no processo.
+_agent = None
+_graph = None
+_lock = threading.Lock()
+
+
+def get_agent():
+    """Agente compartilhado pelo processo (caches de esquema, profiler de colunas e pool de conexões)."""
+    global _agent
+
+    with _lock:
+        if _agent is None:
+            from agent import EcommerceAgent
+
+            _agent = EcommerceAgent()
+    return _agent
+
+
+def register_graph(graph) -> None:
+    """Registra o grafo compilado por `workflow.py`; o primeiro carregado (o do servidor) é o servido."""
+    global _graph
+
+    with _lock:
+        if _graph is None:
+            _graph = graph
+
+
+def served_graph() -> Optional[object]:
+    """Grafo servido pelo processo; carrega `workflow` (que se registra) se nenhum foi carregado ainda."""
+    if _graph is None:
+        import workflow  # noqa: F401
+
+    return _graph
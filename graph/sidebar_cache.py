@@ -0,0 +1,32 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class ThreadListCache:
+    """
+    Cache por usuário das páginas da barra lateral (resultados de `threads.search`), com TTL.
+    A entrada do usuário é invalidada quando ele cria uma thread, para que ela apareça na hora.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._pages: Dict[str, Dict[int, Tuple[float, list]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, cursor: int) -> Optional[List[dict]]:
+        """Página a partir da posição `cursor`, ou `None` se não estiver em cache ou tiver expirado."""
+        with self._lock:
+            entry = self._pages.get(user_id, {}).get(cursor)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def put(self, user_id: str, cursor: int, threads: List[dict]) -> None:
+        with self._lock:
+            self._pages.setdefault(user_id, {})[cursor] = (time.monotonic(), threads)
+
+    def invalidate(self, user_id: str) -> None:
+        """Descarta todas as páginas do usuário (chamado na criação de uma thread)."""
+        with self._lock:
+            self._pages.pop(user_id, None)
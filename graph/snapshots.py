@@ -0,0 +1,376 @@
+"""
+Respostas pré-calculadas para as perguntas recorrentes (KPIs do dia).
+
+Uso:
+    python snapshots.py            # recalcula todas as perguntas agora (para rodar via cron)
+    python snapshots.py --watch    # agenda pelos horários de SNAPSHOT_SCHEDULE e pela chegada de dados novos
+
+Com `SNAPSHOT_DB` definido, o grafo responde direto do snapshot quando a pergunta recebida coincide
+(após normalização) com uma pergunta pré-calculada ainda válida, sem chamar o LLM nem o banco.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from mirror import MIRRORED_TABLES
+
+# Banco SQLite dos snapshots (sem ele, o recurso fica desligado)
+SNAPSHOT_DB = os.getenv("SNAPSHOT_DB")
+
+# Idade máxima de um snapshot servido, mesmo sem dados novos
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "86400"))
+
+# Horários diários de recálculo, ex.: "06:00,12:00" (vazio = apenas quando chegam dados novos)
+SNAPSHOT_SCHEDULE = os.getenv("SNAPSHOT_SCHEDULE", "")
+
+# Intervalo de verificação de dados novos nas tabelas (watermark das tabelas espelhadas; 0 = não verifica)
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "300"))
+
+# Validade da posse do agendador: com vários workers/processos, só o dono da posse recalcula os snapshots
+SNAPSHOT_LEASE_SECONDS = float(os.getenv("SNAPSHOT_LEASE_SECONDS", "900"))
+
+# Arquivo com as perguntas pré-calculadas (mesmo formato de `questions.json`)
+SNAPSHOT_QUESTIONS = os.getenv("SNAPSHOT_QUESTIONS", os.path.join(os.path.dirname(__file__), "questions.json"))
+
+
+def normalize_question(question: str) -> str:
+    """Chave de comparação: sem acentos, caixa, pontuação ou espaços repetidos."""
+    text = unicodedata.normalize("NFKD", question or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+class SnapshotStore:
+    """
+    Snapshots das respostas (texto final, visualização, SQL e dados do gráfico) por pergunta normalizada.
+    Um snapshot vale enquanto tiver menos de `max_age` segundos e tiver sido calculado sobre a versão atual
+    dos dados (registrada pelo agendador quando detecta dados novos).
+    """
+
+    def __init__(self, path: str, max_age: float = SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS snapshots (
+                question_key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                data_version TEXT,
+                created_at REAL NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshot_meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS question_log (
+                question_key TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                sql_query TEXT,
+                asked INTEGER NOT NULL DEFAULT 0,
+                last_asked REAL
+            );
+            CREATE TABLE IF NOT EXISTS scheduler_lease (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        self.lock = threading.Lock()
+
+    @property
+    def data_version(self) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM snapshot_meta WHERE key = 'data_version'").fetchone()
+        return row[0] if row else None
+
+    @data_version.setter
+    def data_version(self, version: str):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO snapshot_meta VALUES ('data_version', ?)", (version,))
+
+    def acquire_lease(self, owner: str, ttl: float) -> bool:
+        """
+        Toma (ou renova) a posse do agendador por `ttl` segundos. O upsert é um único comando, então
+        processos diferentes apontando para o mesmo banco nunca ficam com a posse ao mesmo tempo.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO scheduler_lease VALUES (1, ?, ?) ON CONFLICT (id) DO UPDATE "
+                "SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE scheduler_lease.owner = excluded.owner OR scheduler_lease.expires_at < ?",
+                (owner, now + ttl, now),
+            )
+            row = self.conn.execute("SELECT owner FROM scheduler_lease WHERE id = 1").fetchone()
+        return row is not None and row[0] == owner
+
+    def save(self, question: str, result: Dict[str, Any], data_version: Optional[str]):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)",
+                (normalize_question(question), question, data_version, time.time(), json.dumps(result, default=str)),
+            )
+
+    def record_question(self, question: str, sql_query: str):
+        """Conta a pergunta respondida e guarda a última SQL usada (base do aquecimento dos caches)."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO question_log VALUES (?, ?, ?, 1, ?) ON CONFLICT (question_key) DO UPDATE "
+                "SET question = excluded.question, sql_query = excluded.sql_query, asked = asked + 1, last_asked = excluded.last_asked",
+                (normalize_question(question), question, sql_query, time.time()),
+            )
+
+    def top_questions(self, limit: int) -> List[tuple]:
+        """`(pergunta, sql)` das perguntas mais feitas."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT question, sql_query FROM question_log ORDER BY asked DESC, last_asked DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def last_refresh(self) -> Optional[datetime]:
+        with self.lock:
+            row = self.conn.execute("SELECT max(created_at) FROM snapshots").fetchone()
+        return datetime.fromtimestamp(row[0]) if row and row[0] else None
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """Snapshot válido para a pergunta, ou `None`."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data_version, created_at, result FROM snapshots WHERE question_key = ?",
+                (normalize_question(question),),
+            ).fetchone()
+            current = self.conn.execute("SELECT value FROM snapshot_meta WHERE key = 'data_version'").fetchone()
+
+        if row is None:
+            return None
+        data_version, created_at, result = row
+        if time.time() - created_at > self.max_age or (current and current[0] != data_version):
+            return None
+        return json.loads(result)
+
+
+_store: Optional[SnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> Optional[SnapshotStore]:
+    """Store compartilhado pelo processo, ou `None` se `SNAPSHOT_DB` não estiver definido."""
+    global _store
+
+    if not SNAPSHOT_DB:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore(SNAPSHOT_DB)
+    return _store
+
+
+def snapshots_bypassed() -> bool:
+    """Indica se a execução em andamento está recalculando os snapshots (e portanto não deve lê-los)."""
+    try:
+        from langgraph.config import get_config
+
+        return bool(get_config().get("configurable", {}).get("refresh_snapshots"))
+    except (ImportError, RuntimeError):
+        return False
+
+
+def lookup_snapshot(question: str) -> Optional[Dict[str, Any]]:
+    store = get_snapshot_store()
+    if store is None or snapshots_bypassed():
+        return None
+    return store.lookup(question)
+
+
+def record_question(question: str, sql_query: str):
+    store = get_snapshot_store()
+    if store is not None and not snapshots_bypassed():  # 🔹 Os recálculos agendados não contam como perguntas
+        store.record_question(question, sql_query)
+
+
+def load_snapshot_questions(path: str = SNAPSHOT_QUESTIONS) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [item["question"] for item in json.load(f)["test_questions"]]
+
+
+def parse_schedule(schedule: str) -> List[tuple]:
+    """`"06:00,12:30"` → `[(6, 0), (12, 30)]`."""
+    times = []
+    for item in schedule.split(","):
+        if item.strip():
+            hour, minute = item.strip().split(":")
+            times.append((int(hour), int(minute)))
+    return sorted(times)
+
+
+def last_scheduled(times: List[tuple], now: datetime) -> Optional[datetime]:
+    """Horário agendado mais recente até `now` (hoje ou ontem)."""
+    candidates = [
+        (now - timedelta(days=days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        for days in (0, 1)
+        for hour, minute in times
+    ]
+    past = [moment for moment in candidates if moment <= now]
+    return max(past) if past else None
+
+
+class SnapshotScheduler:
+    """
+    Recalcula os snapshots nos horários de `schedule` e sempre que a versão dos dados muda
+    (maior watermark das tabelas espelhadas). As perguntas rodam pelo grafo em lote (ver `batch.py`).
+    """
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        questions: List[str],
+        db=None,
+        schedule: str = SNAPSHOT_SCHEDULE,
+        poll_seconds: float = SNAPSHOT_POLL_SECONDS,
+        graph=None,
+        lease_seconds: float = SNAPSHOT_LEASE_SECONDS,
+    ):
+        self.store = store
+        self.questions = questions
+        self.db = db
+        self.times = parse_schedule(schedule)
+        self.poll_seconds = poll_seconds
+        self.graph = graph
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._thread: Optional[threading.Thread] = None
+        # 🔹 Após um restart, snapshots ainda válidos não são recalculados antes do próximo horário
+        self.last_run: Optional[datetime] = store.last_refresh()
+
+    def current_data_version(self) -> str:
+        """
+        Maior watermark de cada tabela espelhada; muda quando chegam pedidos novos. Lida direto no PostgreSQL:
+        `db.fetch` mandaria o `max(...)` ao espelho DuckDB, que pode estar atrasado.
+        """
+        if self.db is None:
+            from database import PostgresDB
+
+            self.db = PostgresDB()
+        parts = []
+        with self.db.connection() as conn:
+            for table, watermark in MIRRORED_TABLES.items():
+                value = conn.exec_driver_sql(f'SELECT max("{watermark}") FROM "{table}"').scalar()
+                parts.append(f"{table}={value}")
+        return ";".join(parts)
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Executa todas as perguntas e grava os snapshots das que foram respondidas; retorna as estatísticas."""
+        from batch import run_batch
+
+        data_version = self.current_data_version() if self.poll_seconds else None
+        stats = {}
+        async for result in run_batch(self.questions, graph=self.graph, configurable={"refresh_snapshots": True}):
+            if "stats" in result:
+                stats = result["stats"]
+            elif result["status"] == "answered":
+                self.store.save(result["question"], result, data_version)
+
+        if data_version:
+            self.store.data_version = data_version
+        self.last_run = datetime.now()
+        print(f"📸 Snapshots recalculados: {stats.get('status', {}).get('answered', 0)}/{len(self.questions)}")
+        return stats
+
+    def due(self, now: datetime) -> bool:
+        """Há um horário agendado que passou desde o último recálculo (ou nunca houve um)."""
+        if self.last_run is None:
+            return True
+        scheduled = last_scheduled(self.times, now)
+        return scheduled is not None and scheduled > self.last_run
+
+    def check(self, now: datetime = None) -> bool:
+        """Recalcula se estiver no horário ou se os dados mudaram; retorna se recalculou."""
+        now = now or datetime.now()
+        if not self.store.acquire_lease(self.owner, self.lease_seconds):
+            return False  # 🔹 Outro processo (worker do servidor ou CLI) é o agendador ativo
+        if not self.due(now):
+            if not self.poll_seconds or self.current_data_version() == self.store.data_version:
+                return False
+        asyncio.run(self.refresh())
+        return True
+
+    def run_forever(self):
+        tick = min(60.0, self.poll_seconds) if self.poll_seconds else 60.0
+        last_poll = 0.0
+        while True:
+            try:
+                # 🔹 Horários são conferidos a cada minuto; a versão dos dados, a cada `poll_seconds`
+                if self.due(datetime.now()) or (self.poll_seconds and time.monotonic() - last_poll >= self.poll_seconds):
+                    last_poll = time.monotonic()
+                    self.check()
+            except Exception as e:
+                print("❌ Erro ao recalcular os snapshots:", str(e))
+            time.sleep(tick)
+
+    def start(self):
+        """Agenda em uma thread daemon (com event loop próprio para o lote); chamadas repetidas não criam outra."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, daemon=True)
+            self._thread.start()
+
+
+_scheduler: Optional[SnapshotScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_snapshot_scheduler(graph=None) -> Optional[SnapshotScheduler]:
+    """Agendador único do processo, ou `None` se `SNAPSHOT_DB` não estiver definido."""
+    global _scheduler
+
+    store = get_snapshot_store()
+    if store is None:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            if graph is not None:
+                from langgraph.checkpoint.memory import MemorySaver
+
+                graph = graph.copy(update={"checkpointer": MemorySaver()})
+            _scheduler = SnapshotScheduler(store, load_snapshot_questions(), graph=graph)
+    return _scheduler
+
+
+def start_snapshot_scheduler(graph) -> Optional[SnapshotScheduler]:
+    """
+    Inicia o agendador no processo do servidor quando `SNAPSHOT_DB` e um gatilho estão configurados
+    (chamado na inicialização do `app.py`, nunca ao importar o grafo).
+    """
+    if not (SNAPSHOT_SCHEDULE or SNAPSHOT_POLL_SECONDS):
+        return None
+    scheduler = get_snapshot_scheduler(graph)
+    if scheduler is not None:
+        scheduler.start()
+    return scheduler
+
+
+def main(argv: List[str]):
+    scheduler = get_snapshot_scheduler()
+    if scheduler is None:
+        sys.exit("Defina SNAPSHOT_DB para gravar os snapshots.")
+
+    if "--watch" in argv:
+        scheduler.run_forever()
+    else:
+        asyncio.run(scheduler.refresh())
+
+
+if __name__ == "__main__":
+    # 🔹 Pelo módulo importado: o store e o agendador são os mesmos que `batch`/`workflow` veem
+    import snapshots
+
+    snapshots.main(sys.argv[1:])
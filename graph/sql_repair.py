@@ -0,0 +1,212 @@
+import difflib
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Tipos textuais do PostgreSQL (como aparecem no DDL e nas mensagens de erro)
+TEXT_TYPES = ("VARCHAR", "CHARACTER VARYING", "CHARACTER", "CHAR", "TEXT")
+
+# Palavras que não podem ser confundidas com aliases de tabela após FROM/JOIN
+_RESERVED = {
+    "on", "where", "join", "inner", "left", "right", "full", "cross", "group", "order",
+    "limit", "offset", "having", "union", "using", "natural", "window", "tablesample",
+}
+
+_COMPARISON = re.compile(
+    r'(?P<lhs>(?:\w+\.)?"?\w+"?)\s*(?P<op><>|!=|<=|>=|=|<|>)\s*'
+    r'(?P<rhs>-?\d+(?:\.\d+)?\b|\btrue\b|\bfalse\b|(?:\w+\.)?"?[A-Za-z_]\w*"?)',
+    re.IGNORECASE,
+)
+_IN_LIST = re.compile(r'(?P<col>(?:\w+\.)?"?\w+"?)\s+(?P<kw>(?:NOT\s+)?IN)\s*\((?P<items>[^()]*)\)', re.IGNORECASE)
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(?:"?\w+"?\.)?"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+# Funções cujo argumento usa `FROM` sem ser uma referência de tabela (`EXTRACT(YEAR FROM creationdate)`)
+_FROM_FUNCTIONS = re.compile(r"\b(extract|substring|trim|overlay|position)$")
+
+
+def is_error_result(result: str) -> bool:
+    """Indica se o retorno de `run_no_throw` é uma mensagem de erro do banco."""
+    return result.startswith(("Error:", "ERROR:")) or "SQL state:" in result
+
+
+def parse_schema_columns(table_schemas: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """
+    Extrai `{tabela: {coluna: tipo}}` do DDL retornado por `sql_db_schema`.
+    Linhas de constraints e os exemplos de dados após o DDL são ignorados.
+    """
+    columns = {}
+
+    for table, schema in table_schemas.items():
+        match = re.search(r"CREATE TABLE\s+\S+\s*\((.*?)\n\)", schema or "", re.DOTALL)
+        if not match:
+            continue
+
+        columns[table] = {}
+        for line in match.group(1).splitlines():
+            col_match = re.match(r'\s*"?(\w+)"?\s+([A-Za-z][A-Za-z ]*)', line)
+            if col_match and col_match.group(1).upper() not in ("CONSTRAINT", "PRIMARY", "FOREIGN", "UNIQUE", "CHECK"):
+                columns[table][col_match.group(1)] = col_match.group(2).strip().upper()
+
+    return columns
+
+
+def _sub_outside_literals(sql: str, pattern: re.Pattern, repl: Callable) -> str:
+    """Aplica `pattern.sub` apenas fora de strings literais ('...')."""
+    parts = _LITERAL.split(sql)
+    return "".join(part if i % 2 else pattern.sub(repl, part) for i, part in enumerate(parts))
+
+
+def _enclosing_call(sql: str, position: int) -> str:
+    """Texto antes do parêntese aberto mais interno que contém `position` (minúsculo), ou `""` no nível externo."""
+    depth = 0
+    for i in range(position - 1, -1, -1):
+        if sql[i] == ")":
+            depth += 1
+        elif sql[i] == "(":
+            if depth == 0:
+                return sql[:i].rstrip().lower()
+            depth -= 1
+    return ""
+
+
+def in_from_function(sql: str, position: int) -> bool:
+    """Se o `FROM` em `position` é argumento de função (`EXTRACT(YEAR FROM creationdate)`), e não uma tabela."""
+    return bool(_FROM_FUNCTIONS.search(_enclosing_call(sql, position)))
+
+
+def _table_aliases(sql: str) -> List[Tuple[str, str]]:
+    """Retorna `(tabela, alias)` na ordem em que aparecem em FROM/JOIN."""
+    refs = []
+    for match in _TABLE_REF.finditer(sql):
+        if in_from_function(sql, match.start()):
+            continue
+        table, alias = match.groups()
+        if not alias or alias.lower() in _RESERVED:
+            alias = table
+        refs.append((table, alias))
+    return refs
+
+
+def _column_type(name: str, sql: str, columns: Dict[str, Dict[str, str]]) -> Optional[str]:
+    """Resolve o tipo de uma referência de coluna (qualificada ou não) usando os aliases da query."""
+    qualifier, _, column = name.replace('"', "").rpartition(".")
+    aliases = dict((alias, table) for table, alias in _table_aliases(sql))
+
+    tables = [aliases.get(qualifier, qualifier)] if qualifier else [table for table, _ in _table_aliases(sql)]
+    for table in tables:
+        if column in columns.get(table, {}):
+            return columns[table][column]
+    return None
+
+
+def _is_text(col_type: Optional[str]) -> bool:
+    return bool(col_type) and col_type.startswith(TEXT_TYPES)
+
+
+def _repair_undefined_column(sql: str, error: str, columns: Dict[str, Dict[str, str]]) -> Optional[str]:
+    """Corrige `column "x" does not exist` trocando pelo nome mais próximo existente no esquema."""
+    match = re.search(r'column "?(?:(\w+)\.)?"?(\w+)"? does not exist', error)
+    if not match:
+        return None
+
+    qualifier, wrong = match.groups()
+
+    # 🔹 O próprio PostgreSQL às vezes sugere a coluna correta no HINT
+    hint = re.search(r'Perhaps you meant to reference the column "(?:\w+\.)?(\w+)"', error)
+    if hint:
+        replacement = hint.group(1)
+    else:
+        aliases = dict((alias, table) for table, alias in _table_aliases(sql))
+        if qualifier:
+            candidates = list(columns.get(aliases.get(qualifier, qualifier), {}))
+        else:
+            candidates = [col for table, _ in _table_aliases(sql) for col in columns.get(table, {})]
+
+        matches = difflib.get_close_matches(wrong.lower(), candidates, n=1, cutoff=0.6)
+        if not matches:
+            return None
+        replacement = matches[0]
+
+    prefix = rf"{qualifier}\." if qualifier else r"(?<![\w.])"
+    pattern = re.compile(rf'(?P<prefix>{prefix})"?{re.escape(wrong)}"?(?![\w"])')
+    return _sub_outside_literals(sql, pattern, lambda m: m.group("prefix") + replacement)
+
+
+def _repair_operator_mismatch(sql: str, error: str, columns: Dict[str, Dict[str, str]]) -> Optional[str]:
+    """
+    Corrige `operator does not exist: character varying = integer` (e variações com boolean/numeric):
+    literais comparados a colunas textuais viram strings e colunas não textuais recebem `::text`.
+    """
+    if not re.search(r"operator does not exist: .*(character varying|text|character)", error):
+        return None
+
+    def fix_comparison(m: re.Match) -> str:
+        lhs, op, rhs = m.group("lhs"), m.group("op"), m.group("rhs")
+        lhs_type, rhs_type = _column_type(lhs, sql, columns), _column_type(rhs, sql, columns)
+
+        sides = ((True, lhs_type, rhs, rhs_type), (False, rhs_type, lhs, lhs_type))
+        for other_is_rhs, text_side, other, other_type in sides:
+            if not _is_text(text_side) or _is_text(other_type):
+                continue
+            if other_type:
+                fixed_other = f"{other}::text"
+            elif re.fullmatch(r"-?\d+(?:\.\d+)?|true|false", other, re.IGNORECASE):
+                fixed_other = f"'{other.lower()}'"
+            else:
+                continue
+            return f"{lhs} {op} {fixed_other}" if other_is_rhs else f"{fixed_other} {op} {rhs}"
+
+        return m.group(0)
+
+    def fix_in_list(m: re.Match) -> str:
+        items = [item.strip() for item in m.group("items").split(",")]
+        if not _is_text(_column_type(m.group("col"), sql, columns)):
+            return m.group(0)
+        if not all(re.fullmatch(r"-?\d+(?:\.\d+)?", item) for item in items):
+            return m.group(0)
+        quoted = ", ".join(f"'{item}'" for item in items)
+        return f"{m.group('col')} {m.group('kw')} ({quoted})"
+
+    fixed = _sub_outside_literals(sql, _IN_LIST, fix_in_list)
+    return _sub_outside_literals(fixed, _COMPARISON, fix_comparison)
+
+
+def _repair_ambiguous_column(sql: str, error: str, columns: Dict[str, Dict[str, str]]) -> Optional[str]:
+    """Corrige `column reference "x" is ambiguous` qualificando com a primeira tabela do FROM que a contém."""
+    match = re.search(r'column reference "(\w+)" is ambiguous', error)
+    if not match:
+        return None
+
+    column = match.group(1)
+    alias = next((alias for table, alias in _table_aliases(sql) if column in columns.get(table, {})), None)
+    if not alias:
+        return None
+
+    def qualify(m: re.Match) -> str:
+        preceding = m.string[: m.start()].rstrip().lower()
+        # 🔹 Não qualificamos definições de alias (`AS x`) nem colunas de `JOIN ... USING (x)`
+        if preceding.endswith(" as") or re.search(r"\busing$", _enclosing_call(m.string, m.start())):
+            return m.group(0)
+        return f"{alias}.{column}"
+
+    pattern = re.compile(rf'(?<![\w."])"?{re.escape(column)}"?(?![\w"(])')
+    return _sub_outside_literals(sql, pattern, qualify)
+
+
+REPAIRS = (_repair_undefined_column, _repair_operator_mismatch, _repair_ambiguous_column)
+
+
+def repair_sql(sql: str, error: str, table_schemas: Dict[str, str]) -> Optional[str]:
+    """
+    Tenta corrigir localmente a query a partir do erro do PostgreSQL, sem chamar o LLM.
+    Retorna a query corrigida ou `None` se o erro não pertencer a uma classe conhecida.
+    """
+    columns = parse_schema_columns(table_schemas)
+    if not columns:
+        return None
+
+    for repair in REPAIRS:
+        fixed = repair(sql, error, columns)
+        if fixed and fixed != sql:
+            return fixed
+
+    return None
@@ -0,0 +1,202 @@
+import asyncio
+import html
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Intervalo entre comentários de heartbeat enquanto o grafo não produz eventos (mantém proxies com a conexão aberta)
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Eventos guardados por execução para reenviar a clientes que reconectam com `Last-Event-ID`
+REPLAY_BUFFER_SIZE = int(os.getenv("SSE_REPLAY_BUFFER", "256"))
+
+# Tempo que o buffer de uma execução encerrada continua disponível para retomadas
+FINISHED_RUN_TTL = float(os.getenv("SSE_FINISHED_RUN_TTL", "300"))
+
+# Tempo sem nenhum cliente conectado (aba fechada) antes de cancelar a execução; cobre reconexões
+ABANDON_GRACE_SECONDS = float(os.getenv("SSE_ABANDON_GRACE_SECONDS", "10"))
+
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def format_event(event: str, data: str = "", event_id: Optional[int] = None) -> str:
+    """Formata um evento SSE; conteúdo com várias linhas vira várias linhas `data:`."""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines += [f"data: {line}" for line in data.split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+def message_text(msg: Dict[str, Any]) -> str:
+    """Extrai o texto de uma mensagem serializada (conteúdo em string ou em blocos)."""
+    content = msg.get("content", "")
+    if isinstance(content, list):
+        content = "".join(c["text"] for c in content if isinstance(c, dict) and c.get("text"))
+    return content or ""
+
+
+class DeltaTracker:
+    """
+    Converte os eventos do grafo (estados completos ou mensagens parciais) em eventos incrementais:
+    `message` quando uma nova mensagem passa a ser exibida e `delta` com apenas o texto novo da mensagem atual.
+    Mensagens já enviadas e sem mudanças não geram eventos.
+    """
+
+    def __init__(self):
+        self.sent: Dict[str, str] = {}
+        self.current: Optional[str] = None
+
+    def feed_message(self, msg: Dict[str, Any]) -> List[Tuple[str, str]]:
+        if msg.get("type") not in ("ai", "AIMessageChunk"):
+            return []
+        content = message_text(msg).strip()
+        if not content:
+            return []
+
+        key = msg.get("id") or content
+        previous = self.sent.get(key)
+        if previous == content:
+            return []
+
+        self.sent[key] = content
+        if key == self.current and previous and content.startswith(previous):
+            return [("delta", html.escape(content[len(previous) :]))]
+
+        self.current = key
+        return [("message", html.escape(content))]
+
+    def feed_values(self, values: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """Estado completo (`stream_mode="values"`): só a última mensagem interessa à interface."""
+        messages = values.get("messages") or []
+        return self.feed_message(messages[-1]) if messages else []
+
+    def feed_partial(self, messages: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        """Mensagens parciais (`stream_mode="messages"`): cada evento traz o conteúdo acumulado até aqui."""
+        return [event for msg in messages for event in self.feed_message(msg)]
+
+
+class RunStream:
+    """
+    Buffer de eventos de uma execução, alimentado uma única vez pela fonte e compartilhado pelos clientes.
+    Cada evento recebe um id sequencial; clientes que reconectam recebem apenas o que veio depois do seu
+    `Last-Event-ID`. A fonte continua sendo consumida mesmo se o cliente desconectar; se nenhum cliente
+    voltar em `grace` segundos, `on_abandoned` é chamado (para cancelar a execução).
+    """
+
+    def __init__(
+        self,
+        first_id: int = 1,
+        buffer_size: int = REPLAY_BUFFER_SIZE,
+        on_abandoned: Optional[Callable[[], Awaitable[None]]] = None,
+        grace: float = ABANDON_GRACE_SECONDS,
+    ):
+        self.on_abandoned = on_abandoned
+        self.grace = grace
+        self.subscribers = 0
+        self.events: deque = deque(maxlen=buffer_size)
+        self.next_id = first_id
+        self.snapshot = ""  # 🔹 Conteúdo exibido no momento (usado para ressincronizar quem perdeu eventos)
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def last_id(self) -> int:
+        return self.next_id - 1
+
+    def publish(self, event: str, data: str = ""):
+        if event == "message":
+            self.snapshot = data
+        elif event == "delta":
+            self.snapshot += data
+
+        self.events.append((self.next_id, event, data))
+        self.next_id += 1
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._wakeup.set()
+
+    def start(self, source: AsyncIterator[Tuple[str, str]]) -> "RunStream":
+        """Consome a fonte em uma task própria; o último evento publicado é sempre `close`."""
+
+        async def pump():
+            try:
+                async for event, data in source:
+                    self.publish(event, data)
+            except Exception as e:
+                print("❌ Erro ao acompanhar a execução:", str(e))
+            finally:
+                self.publish("close")
+                self.finish()
+
+        self.task = asyncio.create_task(pump())
+        return self
+
+    async def subscribe(self, last_event_id: int = 0, heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+        """Gera os eventos posteriores a `last_event_id` e depois acompanha os novos, com heartbeats."""
+        cursor = last_event_id
+        self.subscribers += 1
+        try:
+            # 🔹 O cliente perdeu eventos que já saíram do buffer: reenviamos o conteúdo completo atual
+            if self.events and cursor < self.events[0][0] - 1 and self.snapshot:
+                yield format_event("message", self.snapshot, self.events[0][0] - 1)
+
+            while True:
+                pending = [entry for entry in self.events if entry[0] > cursor]
+                for event_id, event, data in pending:
+                    yield format_event(event, data, event_id)
+                    cursor = event_id
+                if pending:
+                    continue
+                if self.done:
+                    return
+
+                wakeup = self._wakeup
+                try:
+                    await asyncio.wait_for(wakeup.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done and self.on_abandoned is not None:
+                asyncio.get_running_loop().create_task(self._cancel_if_abandoned())
+
+    async def _cancel_if_abandoned(self):
+        await asyncio.sleep(self.grace)
+        if not self.subscribers and not self.done:
+            await self.on_abandoned()
+
+
+class RunStreamRegistry:
+    """Execuções acompanhadas pelo processo, por `run_id`; buffers encerrados expiram após `FINISHED_RUN_TTL`."""
+
+    def __init__(self, ttl: float = FINISHED_RUN_TTL):
+        self.ttl = ttl
+        self._streams: Dict[str, RunStream] = {}
+
+    def get(self, run_id: str) -> Optional[RunStream]:
+        self._expire()
+        return self._streams.get(run_id)
+
+    def start(
+        self,
+        run_id: str,
+        source: AsyncIterator[Tuple[str, str]],
+        first_id: int = 1,
+        on_abandoned: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> RunStream:
+        stream = RunStream(first_id=first_id, on_abandoned=on_abandoned).start(source)
+        self._streams[run_id] = stream
+        return stream
+
+    def _expire(self):
+        now = time.monotonic()
+        for run_id, stream in list(self._streams.items()):
+            if stream.done and now - stream.finished_at > self.ttl:
+                del self._streams[run_id]
@@ -2,10 +2,11 @@
 from __future__ import annotations
 
 import operator
-from typing import Any, Dict, List, Sequence, TypedDict
+from typing import Any, Dict, List, Optional, Sequence, TypedDict
 
 from langchain_core.messages import AIMessage, HumanMessage
 from langgraph.graph import add_messages
+from pydantic import BaseModel, Field
 from typing_extensions import Annotated
 
 
@@ -16,6 +17,7 @@ class AgentState(TypedDict, total=False):  # total=False torna todas as chaves o
     is_valid_query: bool
     table_schemas: Dict[str, str]
     table_samples: Dict[str, List[Dict[str, Any]]]
+    column_stats: Dict[str, str]
 
 
 # 📌 Definição do estado de entrada
@@ -23,9 +25,20 @@ class InputState(TypedDict):
     messages: Annotated[Sequence[HumanMessage], add_messages]
     user_query: str
     is_relevant: bool
-    table_schemas: Dict[str, str]
+    query_intent: Dict[str, Any]
+    sub_questions: List[str]
+    table_schemas: Dict[str, str]  # 🔹 Referências do armazém de blobs (ver `blobstore.py`), não o DDL em si
+    column_stats: Dict[str, str]
     sql_query: str
-    query_response: List[Dict[str, Any]]
+    sql_validated: bool
+    sql_error: Optional[str]
+    query_error: Optional[str]
+    retry_generate_sql: bool
+    sql_attempts: int
+    query_response: List[Dict[str, Any]]  # 🔹 Resultados grandes também ficam como referência de blob
+    query_columns: List[str]
+    query_rows: List[List[Any]]
+    query_approximation: Optional[Dict[str, Any]]  # 🔹 Amostra usada no modo aproximado (ver `approximate.py`)
     uuid: str
     visualization: Annotated[str, operator.add]
 
@@ -36,3 +49,32 @@ class OutputState(TypedDict):
     final_answer: str
     visualization: Annotated[str, operator.add]
     visualization_reason: Annotated[str, operator.add]
+
+
+# 📌 Saída estruturada da interação com o usuário (uma única chamada por turno)
+class QueryIntent(BaseModel):
+    """Slots extraídos da pergunta do usuário."""
+
+    metric: Optional[str] = Field(None, description="Métrica pedida, ex.: faturamento, número de pedidos, ticket médio")
+    dimensions: List[str] = Field(default_factory=list, description="Agrupamentos pedidos, ex.: estado, categoria, sexo")
+    period: Optional[str] = Field(None, description="Período da análise, ex.: último mês, últimos 7 dias")
+    filters: List[str] = Field(default_factory=list, description="Filtros adicionais, ex.: apenas frete grátis")
+    limit: Optional[int] = Field(None, description="Quantidade de itens pedida em rankings (top N)")
+
+
+class InteractionResult(BaseModel):
+    """Decisão do turno: a pergunta está pronta para virar SQL ou o assistente responde ao usuário."""
+
+    is_relevant: bool = Field(description="True se a pergunta estiver pronta para ser respondida com os dados de e-commerce")
+    user_query: Optional[str] = Field(None, description="Pergunta normalizada e autossuficiente, quando is_relevant=True")
+    reply: str = Field("", description="Mensagem ao usuário quando is_relevant=False")
+    intent: Optional[QueryIntent] = Field(None, description="Slots extraídos da pergunta, quando possível")
+
+
+class QueryPlan(BaseModel):
+    """Divisão de uma pergunta composta em perguntas independentes, cada uma respondível por uma query simples."""
+
+    sub_questions: List[str] = Field(
+        default_factory=list,
+        description="Perguntas independentes e autossuficientes; vazio se a pergunta já for simples",
+    )
@@ -0,0 +1,72 @@
+import re
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+# Máximo de sub-perguntas executadas para uma mesma pergunta
+MAX_SUB_QUESTIONS = 4
+
+# Indícios de pergunta composta (comparações, várias métricas); perguntas simples nem chegam ao planejador
+_COMPOUND = re.compile(
+    r"\b(compar\w*|versus|vs\.?|em rela[çc][ãa]o a|contra|assim como|al[ée]m d[eoa]s?|e tamb[ée]m)\b|\s+x\s+",
+    re.IGNORECASE,
+)
+_METRIC_LIST = re.compile(r",|\se\s", re.IGNORECASE)
+
+
+def looks_compound(user_query: str, intent: Optional[Dict[str, Any]] = None) -> bool:
+    """Heurística barata: só perguntas com cara de comparação ou com várias métricas vão ao planejador (LLM)."""
+    if _COMPOUND.search(user_query or ""):
+        return True
+    metric = (intent or {}).get("metric") or ""
+    return bool(_METRIC_LIST.search(metric))
+
+
+def _is_numeric(result: Dict[str, Any], column: str) -> bool:
+    """Coluna de métrica: todos os valores (não nulos) são números."""
+    i = result["columns"].index(column)
+    values = [row[i] for row in result["rows"] if row[i] is not None]
+    return bool(values) and all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in values)
+
+
+def merge_results(results: List[Dict[str, Any]]) -> Tuple[List[str], List[list]]:
+    """
+    Junta os resultados das sub-perguntas em uma única tabela.
+    Se todos têm dimensões em comum (colunas não numéricas, ex.: `estado`), faz um outer join por elas e as demais colunas ganham o
+    número da sub-pergunta quando o nome se repete (`faturamento_1`, `faturamento_2`). Caso contrário,
+    empilha as linhas com uma coluna `sub_pergunta` indicando a origem.
+    """
+    common = [c for c in results[0]["columns"] if all(c in r["columns"] for r in results[1:])]
+    keys = [c for c in common if not all(_is_numeric(r, c) for r in results)]
+    metrics = [[c for c in r["columns"] if c not in keys] for r in results]
+
+    if len(results) > 1 and keys and all(metrics):
+        counts: Dict[str, int] = {}
+        for names in metrics:
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        labels = [[f"{name}_{i + 1}" if counts[name] > 1 else name for name in names] for i, names in enumerate(metrics)]
+
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for result, names, renamed in zip(results, metrics, labels):
+            for row in result["rows"]:
+                values = dict(zip(result["columns"], row))
+                key = tuple(values[k] for k in keys)
+                merged.setdefault(key, {}).update({label: values[name] for name, label in zip(names, renamed)})
+
+        columns = keys + [label for names in labels for label in names]
+        rows = [list(key) + [values.get(c) for c in columns[len(keys) :]] for key, values in merged.items()]
+        return columns, rows
+
+    columns = ["sub_pergunta"] + list(dict.fromkeys(c for r in results for c in r["columns"]))
+    rows = []
+    for i, result in enumerate(results):
+        for row in result["rows"]:
+            values = dict(zip(result["columns"], row))
+            rows.append([i + 1] + [values.get(c) for c in columns[1:]])
+    return columns, rows
+
+
+def describe_results(results: List[Dict[str, Any]], columns: List[str], rows: List[list]) -> str:
+    """Texto dos resultados para o prompt da resposta: cada sub-pergunta com suas linhas e a tabela combinada."""
+    sections = [f"[{i + 1}] {r['question']}\n{r['columns']}\n{r['rows']}" for i, r in enumerate(results)]
+    return "\n\n".join(sections + [f"Tabela combinada:\n{columns}\n{rows}"])
@@ -1,8 +1,44 @@
+import asyncio
+import gzip
+import json
+import operator
+import os
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Annotated, TypedDict
+from unittest import mock
 
-from agent.graph.state import AgentState
+from answer_renderer import format_brl, format_value, render_answer
+from approximate import SAMPLE_COLUMN, approximate_query
+from batch import ResultCache, run_batch
+from blobstore import REF_PREFIX, BlobStore, is_ref
+from cancellation import CancellationToken, RunCancelled
+from checkpointer import SqliteCheckpointer
 from database import PostgresDB
+from embedded import EmbeddedThreads
+from export import csv_chunks, export_query, parquet_chunks, pq
+from history import history_page, is_internal_message, visible_messages
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_openai import AzureChatOpenAI
+from langgraph.graph import END, START, MessagesState, StateGraph
+from llm_gateway import LANE_PRIORITIES, LatencyTracker, LLMGateway, RateLimiter
+from mirror import AnalyticsMirror
+from pagination import is_pageable, next_page, split_paging
+from profiler import ColumnProfiler
+from prompt import format_column_stats
+from sidebar_cache import ThreadListCache
+from snapshots import SnapshotScheduler, SnapshotStore, normalize_question
+from sql_repair import _table_aliases, repair_sql
+from sse import HEARTBEAT, DeltaTracker, RunStream
+from state import AgentState
+from subqueries import looks_compound, merge_results
 from tools import analyze_tables, classify_query, execute_sql, generate_answer, generate_sql
+from warmup import Warmup, load_warmup_config
 
 
 def default_state() -> AgentState:
@@ -223,6 +259,1097 @@ class TestFullAgentFlow(unittest.TestCase):
         self.assertTrue(len(self.state["final_answer"]) > 0, "A resposta final não pode estar vazia.")
 
 
+class TestGraphEntryPoints(unittest.TestCase):
+    """Os módulos carregados pelo `langgraph.json` e pela CLI precisam importar sem erros."""
+
+    def test_workflow_graph_loads(self):
+        import workflow
+
+        for node in ("interact_with_user", "generate_sql", "execute_sql", "generate_answer"):
+            self.assertIn(node, workflow.graph.nodes)
+
+    def test_app_startup_shares_the_served_agent_and_graph(self):
+        """O `app.py` aquece e agenda snapshots no mesmo agente e grafo que o servidor carregou."""
+        import runtime
+        import workflow
+
+        self.assertIs(runtime.get_agent(), workflow.manager.agent)
+        self.assertIs(runtime.served_graph(), workflow.graph)
+
+    def test_main_imports(self):
+        import main
+
+        self.assertTrue(callable(main.WorkflowManager))
+
+
+class TestColumnStats(unittest.TestCase):
+    """Testa o profiling em segundo plano e a formatação das estatísticas no prompt de SQL."""
+
+    def test_concurrent_requests_start_a_single_refresh(self):
+        profiler = ColumnProfiler(db=None, tables=["orders_ia"], ttl=60)
+        release, calls = threading.Event(), []
+        profiler.refresh = lambda: calls.append(1) or release.wait(5)
+
+        starters = [threading.Thread(target=profiler.get_stats, args=("orders_ia",)) for _ in range(8)]
+        for thread in starters:
+            thread.start()
+        for thread in starters:
+            thread.join()
+        release.set()
+
+        self.assertTrue(profiler.wait(5))
+        self.assertEqual(len(calls), 1)
+
+    def test_top_values_are_written_as_sql_literals(self):
+        stats = {
+            "row_count": 100,
+            "columns": {
+                "freeshipping": {"type": "BOOLEAN", "distinct": 2, "null_ratio": 0.0, "top_values": ["True", "False"]},
+                "status": {"type": "VARCHAR(20)", "distinct": 2, "null_ratio": 0.0, "top_values": ["invoiced", "d'or"]},
+                "channel": {"type": "INTEGER", "distinct": 1, "null_ratio": 0.5, "top_values": ["3"]},
+            },
+        }
+        self.assertEqual(
+            format_column_stats("orders_ia", stats).splitlines()[1:],
+            [
+                "- freeshipping: distintos=2, valores: true | false",
+                "- status: distintos=2, valores: 'invoiced' | 'd''or'",
+                "- channel: distintos=1, nulos=50%, valores: 3",
+            ],
+        )
+
+
+class StubAzureHandler(BaseHTTPRequestHandler):
+    """Simula o endpoint de chat completions da Azure, contando as requisições recebidas."""
+
+    requests_received = 0
+    rate_limited_responses = 0  # Quantas das próximas requisições devem receber 429
+    rate_limited_latency = 0.0  # Tempo até o servidor responder o 429
+    latency = 0.2
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            StubAzureHandler.requests_received += 1
+            rate_limited = StubAzureHandler.rate_limited_responses > 0
+            if rate_limited:
+                StubAzureHandler.rate_limited_responses -= 1
+
+        if rate_limited:
+            time.sleep(self.rate_limited_latency)
+            self._send(429, {"error": {"code": "429", "message": "Rate limit"}}, {"Retry-After": "1"})
+            return
+
+        time.sleep(self.latency)
+        content = "echo: " + body["messages"][-1]["content"]
+        self._send(
+            200,
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            },
+        )
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLLMGateway(unittest.TestCase):
+    """Testa o gateway de LLM contra um servidor local que simula a Azure OpenAI."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubAzureHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.model = AzureChatOpenAI(
+            azure_endpoint=f"http://127.0.0.1:{cls.server.server_port}",
+            azure_deployment="stub",
+            openai_api_version="2024-06-01",
+            openai_api_key="stub",
+            max_retries=0,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StubAzureHandler.requests_received = 0
+        StubAzureHandler.rate_limited_responses = 0
+        StubAzureHandler.rate_limited_latency = 0.0
+
+    def _invoke_concurrently(self, gateway: LLMGateway, prompts: list, lane: str = "default") -> list:
+        results = [None] * len(prompts)
+
+        def call(i):
+            results[i] = gateway.invoke(prompts[i], lane=lane).content
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(prompts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_prompts_are_coalesced(self):
+        """Prompts idênticos em voo ao mesmo tempo compartilham uma única chamada ao servidor."""
+        results = self._invoke_concurrently(LLMGateway(self.model), ["Qual o faturamento?"] * 8)
+
+        self.assertEqual(StubAzureHandler.requests_received, 1)
+        self.assertEqual(set(results), {"echo: Qual o faturamento?"})
+
+    def test_distinct_prompts_are_not_coalesced(self):
+        """Prompts diferentes geram chamadas independentes."""
+        self._invoke_concurrently(LLMGateway(self.model), [f"Pergunta {i}" for i in range(4)])
+
+        self.assertEqual(StubAzureHandler.requests_received, 4)
+
+    def test_request_rate_is_limited(self):
+        """Com 60 RPM (burst de 10 requisições), a 13ª requisição precisa esperar a reposição do bucket."""
+        gateway = LLMGateway(self.model, rpm=60)
+
+        started = time.monotonic()
+        self._invoke_concurrently(gateway, [f"Pergunta {i}" for i in range(13)])
+
+        self.assertEqual(StubAzureHandler.requests_received, 13)
+        self.assertGreaterEqual(time.monotonic() - started, 2.5)
+
+    def test_rate_limited_response_is_retried_after_delay(self):
+        """Um 429 do servidor bloqueia o limitador pelo Retry-After e a chamada é repetida."""
+        StubAzureHandler.rate_limited_responses = 1
+        gateway = LLMGateway(self.model, rpm=600)
+
+        started = time.monotonic()
+        result = gateway.invoke("Qual o ticket médio?").content
+
+        self.assertEqual(result, "echo: Qual o ticket médio?")
+        self.assertEqual(StubAzureHandler.requests_received, 2)
+        self.assertGreaterEqual(time.monotonic() - started, 1.0)
+
+    def test_slow_rate_limited_response_still_waits_the_full_retry_after(self):
+        """A espera começa quando o 429 chega: a latência da chamada recusada não desconta do Retry-After."""
+        StubAzureHandler.rate_limited_responses = 1
+        StubAzureHandler.rate_limited_latency = 0.8
+        gateway = LLMGateway(self.model, rpm=600)
+
+        started = time.monotonic()
+        gateway.invoke("Qual o ticket médio?")
+
+        # 🔹 0,8s até o 429 + 1s de Retry-After + a resposta da nova tentativa
+        self.assertGreaterEqual(time.monotonic() - started, 0.8 + 1.0 + StubAzureHandler.latency)
+
+
+class TestRateLimiterPriorities(unittest.TestCase):
+    """Testa a ordem de atendimento das lanes quando o limite está saturado."""
+
+    def test_penalty_lasts_the_full_retry_after(self):
+        limiter = RateLimiter(rpm=600)
+        limiter.acquire(1)
+        time.sleep(0.5)  # 🔹 Duração da chamada que recebeu o 429
+        limiter.penalize(1.0)
+
+        started = time.monotonic()
+        limiter.acquire(1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.95)
+
+    def test_answer_lane_is_served_before_visualization(self):
+        limiter = RateLimiter(rpm=60)
+        limiter.requests.tokens = 0  # 🔹 Esgota o bucket para forçar a fila de espera
+        served = []
+
+        def acquire(lane):
+            limiter.acquire(1, LANE_PRIORITIES[lane])
+            served.append(lane)
+
+        visualization = threading.Thread(target=acquire, args=("visualization",))
+        visualization.start()
+        time.sleep(0.1)
+        answer = threading.Thread(target=acquire, args=("answer",))
+        answer.start()
+
+        visualization.join()
+        answer.join()
+
+        self.assertEqual(served, ["answer", "visualization"])
+
+
+class SimulatedDeployment:
+    """Deployment falsa com latência configurável por chamada, que registra cancelamentos."""
+
+    def __init__(self, name: str, latencies: list):
+        self.name = name
+        self.latencies = list(latencies)
+        self.cancelled = 0
+
+    async def ainvoke(self, model_input, **kwargs):
+        latency = self.latencies.pop(0) if self.latencies else 0.02
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.name
+
+
+class TestHedgedRequests(unittest.TestCase):
+    """Testa o hedge entre deployments com latências simuladas."""
+
+    def setUp(self):
+        # 🔹 20 chamadas rápidas para aquecer o p90 da primária, seguidas de uma chamada de cauda longa
+        self.primary = SimulatedDeployment("primary", [0.02] * 20 + [2.0])
+        self.secondary = SimulatedDeployment("secondary", [0.02])
+        self.gateway = LLMGateway(self.primary, secondary=self.secondary, hedge=True)
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        """Uma chamada acima do p90 é duplicada na secundária, que vence; a primária é cancelada."""
+        for i in range(20):
+            self.assertEqual(self.gateway.invoke(f"aquecimento {i}", lane="sql"), "primary")
+
+        started = time.monotonic()
+        result = self.gateway.invoke("pergunta lenta", lane="sql")
+        elapsed = time.monotonic() - started
+        time.sleep(0.05)  # 🔹 Dá tempo ao loop do gateway de processar o cancelamento
+
+        self.assertEqual(result, "secondary")
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.primary.cancelled, 1)
+        self.assertEqual(self.gateway.hedges_fired, 1)
+        self.assertEqual(self.gateway.hedges_won, 1)
+        # 🔹 A primária cancelada entra na janela com o tempo até o cancelamento (limite inferior)
+        self.assertEqual(self.gateway.latency.snapshot()["primary/sql"]["count"], 21)
+
+    def test_no_hedge_before_latency_is_known(self):
+        """Sem amostras suficientes para o p90, a chamada espera a primária sem duplicar."""
+        primary = SimulatedDeployment("primary", [0.3])
+        gateway = LLMGateway(primary, secondary=SimulatedDeployment("secondary", []), hedge=True)
+
+        self.assertEqual(gateway.invoke("primeira pergunta", lane="sql"), "primary")
+        self.assertEqual(gateway.hedges_fired, 0)
+
+    def test_latency_is_tracked_per_deployment_and_lane(self):
+        tracker = LatencyTracker(min_samples=5)
+        for seconds in (0.1, 0.2, 0.3, 0.4, 1.0):
+            tracker.record(("primary", "answer"), seconds)
+
+        self.assertEqual(tracker.percentile(("primary", "answer"), 0.9), 1.0)
+        self.assertIsNone(tracker.percentile(("secondary", "answer"), 0.9))
+        self.assertEqual(tracker.snapshot()["primary/answer"]["count"], 5)
+
+
+class TestAnswerRenderer(unittest.TestCase):
+    """Testa a formatação determinística das respostas (sem LLM)."""
+
+    def test_scalar_currency(self):
+        answer = render_answer("Qual o faturamento total?", ["total_revenue"], [[1234567.891]])
+        self.assertEqual(answer, "Total revenue: R$ 1.234.567,89")
+
+    def test_top_n_ranking(self):
+        answer = render_answer(
+            "Top 2 produtos mais vendidos", ["idprod", "total_quantity"], [[1234, 15230], [99, 120]]
+        )
+        self.assertEqual(answer, "1. 1234 — Total quantity: 15.230\n2. 99 — Total quantity: 120")
+
+    def test_narrative_question_falls_back_to_llm(self):
+        self.assertIsNone(render_answer("Por que o faturamento caiu?", ["total_revenue"], [[10.0]]))
+        self.assertIsNone(render_answer("Vendas por dia", ["dia", "total"], [[i, i] for i in range(30)]))
+
+    def test_negative_currency(self):
+        self.assertEqual(format_brl(-5.5), "-R$ 5,50")
+
+    def test_integer_currency_metric_and_aggregate_label(self):
+        self.assertEqual(render_answer("Qual o faturamento de março?", ["sum"], [[1200]]), "Soma: R$ 1.200,00")
+        self.assertEqual(render_answer("Qual o faturamento de março?", ["count"], [[1200]]), "Quantidade: 1.200")
+        self.assertEqual(render_answer("Quantos clientes compraram?", ["count"], [[1200]]), "Quantidade: 1.200")
+
+    def test_percent_scaling_depends_on_column(self):
+        self.assertEqual(format_value("percentual_cancelados", 0.5), "0,5%")
+        self.assertEqual(format_value("pct_frete", 12.5), "12,5%")
+        self.assertEqual(format_value("taxa_cancelamento", 0.125), "12,5%")
+
+
+class TestPagination(unittest.TestCase):
+    """Testa a reescrita da última query para o "mostrar mais"."""
+
+    TOP_5 = "SELECT namesku, SUM(quantity) AS total FROM orders_items_ia GROUP BY namesku ORDER BY total DESC LIMIT 5;"
+
+    def test_next_page_starts_after_original_rows(self):
+        sql, offset, page_size = next_page(self.TOP_5)
+        self.assertEqual((offset, page_size), (5, 5))
+        self.assertTrue(sql.endswith("ORDER BY total DESC LIMIT 6 OFFSET 5"))
+
+    def test_explicit_offset_and_existing_offset(self):
+        self.assertEqual(split_paging("SELECT 1 FROM t ORDER BY 1 LIMIT 10 OFFSET 20"), ("SELECT 1 FROM t ORDER BY 1", 10, 20))
+        self.assertTrue(next_page(self.TOP_5, 15)[0].endswith("LIMIT 6 OFFSET 15"))
+
+    def test_only_limited_read_queries_are_pageable(self):
+        self.assertTrue(is_pageable(self.TOP_5))
+        self.assertFalse(is_pageable("SELECT SUM(totalvalue) FROM orders_ia"))
+        self.assertFalse(is_pageable("SELECT * FROM (SELECT * FROM orders_ia LIMIT 5) t"))
+        self.assertFalse(is_pageable("DELETE FROM orders_ia WHERE id IN (SELECT id FROM orders_ia LIMIT 5)"))
+
+
+class FakeStreamingDB:
+    """Simula `PostgresDB.stream`: colunas primeiro (com os OIDs dos tipos em `describe`), depois lotes de linhas."""
+
+    def __init__(self, columns, rows, type_codes=None):
+        self.columns, self.rows = columns, rows
+        self.type_codes = type_codes or [25] * len(columns)
+
+    def stream(self, query, chunk_size, describe=False):
+        yield list(zip(self.columns, self.type_codes)) if describe else self.columns
+        for i in range(0, len(self.rows), chunk_size):
+            yield self.rows[i : i + chunk_size]
+
+
+class TestExport(unittest.TestCase):
+    """Testa a exportação CSV e Parquet em blocos."""
+
+    def setUp(self):
+        self.db = FakeStreamingDB(["idprod", "namesku"], [(i, f"Produto, {i}") for i in range(2500)])
+
+    def test_csv_is_streamed_one_chunk_per_batch(self):
+        chunks = list(csv_chunks(self.db, "SELECT ...", chunk_size=1000))
+        lines = b"".join(chunks).decode().splitlines()
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(lines[0], "idprod,namesku")
+        self.assertEqual(lines[1], '0,"Produto, 0"')
+        self.assertEqual(len(lines), 2501)
+
+    def test_gzip_output_matches_plain_csv(self):
+        plain = b"".join(csv_chunks(self.db, "SELECT ...", chunk_size=1000))
+        compressed = b"".join(csv_chunks(self.db, "SELECT ...", chunk_size=1000, gzip=True))
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_empty_result_keeps_header(self):
+        empty = FakeStreamingDB(["total"], [])
+        self.assertEqual(b"".join(csv_chunks(empty, "SELECT ...")).decode().strip(), "total")
+
+    def test_export_drops_the_answer_row_limit(self):
+        query = "SELECT namesku, SUM(quantity) FROM orders_items_ia GROUP BY 1 ORDER BY 2 DESC LIMIT 5;"
+        self.assertEqual(export_query(query), query[: query.index(" LIMIT")])
+        self.assertEqual(export_query("SELECT * FROM orders_ia OFFSET 10 LIMIT 5"), "SELECT * FROM orders_ia")
+
+    @unittest.skipIf(pq is None, "pyarrow não instalado")
+    def test_parquet_schema_comes_from_cursor_types(self):
+        # 🔹 O primeiro lote tem `cupom` só com NULLs; os seguintes têm texto
+        rows = [(i, Decimal("10.50"), None if i < 1000 else f"CUPOM{i}") for i in range(2500)]
+        db = FakeStreamingDB(["orderid", "valor", "cupom"], rows, type_codes=[23, 1700, 1043])
+
+        with tempfile.NamedTemporaryFile(suffix=".parquet") as tmp:
+            tmp.write(b"".join(parquet_chunks(db, "SELECT ...", chunk_size=1000)))
+            tmp.flush()
+            table = pq.read_table(tmp.name)
+
+        self.assertEqual([str(field.type) for field in table.schema], ["int64", "double", "string"])
+        self.assertEqual(table.num_rows, 2500)
+        self.assertEqual(table.column("cupom")[2499].as_py(), "CUPOM2499")
+        self.assertEqual(table.column("valor")[0].as_py(), 10.5)
+
+    @unittest.skipIf(pq is None, "pyarrow não instalado")
+    def test_empty_parquet_keeps_columns(self):
+        db = FakeStreamingDB(["total"], [], type_codes=[1700])
+        with tempfile.NamedTemporaryFile(suffix=".parquet") as tmp:
+            tmp.write(b"".join(parquet_chunks(db, "SELECT ...")))
+            tmp.flush()
+            table = pq.read_table(tmp.name)
+
+        self.assertEqual((table.column_names, table.num_rows), (["total"], 0))
+
+
+class TestHistory(unittest.TestCase):
+    """Testa o filtro e a paginação do histórico exibido na interface."""
+
+    def test_internal_messages_are_hidden(self):
+        messages = [
+            {"type": "human", "content": "Qual o faturamento de março?"},
+            {"type": "ai", "content": "✅ Entendi sua pergunta!"},  # 🔹 Thread antiga, sem marcação
+            {"type": "ai", "content": "SELECT SUM(totalvalue) FROM orders_ia"},
+            {"type": "ai", "content": "⏳ Executando a query no banco de dados..."},
+            {"type": "tool", "content": "[(1,)]"},
+            {"type": "ai", "content": "Total revenue: R$ 1.234,00"},
+        ]
+        self.assertEqual([msg["content"] for msg in visible_messages(messages)], [messages[0]["content"], messages[-1]["content"]])
+        self.assertFalse(is_internal_message({"type": "ai", "content": "Selecione um período, por favor."}))
+
+    def test_tagged_threads_show_answers_that_look_like_progress(self):
+        messages = [
+            {"type": "human", "content": "Todos os pedidos de março foram entregues?"},
+            {"type": "ai", "content": "⏳ Executando a query no banco de dados...", "additional_kwargs": {"internal": True}},
+            {"type": "ai", "content": "SELECT COUNT(*) FROM orders_ia", "additional_kwargs": {"internal": True}},
+            {"type": "ai", "content": "✅ Sim, todos os 1.234 pedidos de março foram entregues."},
+        ]
+        self.assertEqual([msg["content"] for msg in visible_messages(messages)], [messages[0]["content"], messages[-1]["content"]])
+
+    def test_agent_prompts_stored_as_human_messages_are_hidden(self):
+        for content in (
+            "\n    Você é um especialista em postgresql com alta atenção aos detalhes.\n ...",
+            "Sua query retornou com esse erro: column \"x\" does not exist. Por favor, corrija.",
+            '### **📌 Pergunta do usuário**\n"Qual o faturamento?"',
+        ):
+            self.assertTrue(is_internal_message({"type": "human", "content": content}), content)
+        self.assertFalse(is_internal_message({"type": "human", "content": "SELECT os 5 produtos mais vendidos"}))
+
+    def test_pages_go_backwards(self):
+        messages = [{"type": "human", "content": str(i)} for i in range(25)]
+
+        page, start = history_page(messages, limit=10)
+        self.assertEqual((page[0]["content"], start), ("15", 15))
+
+        page, start = history_page(messages, before=5, limit=10)
+        self.assertEqual((len(page), start), (5, 0))
+
+
+class TestThreadListCache(unittest.TestCase):
+    """Testa o cache das páginas da barra lateral."""
+
+    def test_pages_are_cached_per_user_until_the_ttl(self):
+        cache = ThreadListCache(ttl=60)
+        cache.put("ana", 0, [{"thread_id": "a"}])
+
+        self.assertEqual(cache.get("ana", 0), [{"thread_id": "a"}])
+        self.assertIsNone(cache.get("ana", 20))
+        self.assertIsNone(cache.get("bia", 0))
+        with mock.patch("sidebar_cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("ana", 0))
+
+    def test_invalidate_drops_only_that_users_pages(self):
+        cache = ThreadListCache(ttl=60)
+        cache.put("ana", 0, [{"thread_id": "a"}])
+        cache.put("ana", 20, [{"thread_id": "b"}])
+        cache.put("bia", 0, [{"thread_id": "c"}])
+
+        cache.invalidate("ana")
+        self.assertEqual((cache.get("ana", 0), cache.get("ana", 20)), (None, None))
+        self.assertEqual(cache.get("bia", 0), [{"thread_id": "c"}])
+
+
+class TestDeltaSSE(unittest.TestCase):
+    """Testa os eventos incrementais e a retomada do streaming."""
+
+    def test_repeated_states_are_not_resent(self):
+        tracker = DeltaTracker()
+        state = {"messages": [{"type": "human", "content": "Oi"}, {"type": "ai", "content": "⏳ Executando", "id": "1"}]}
+
+        self.assertEqual(tracker.feed_values(state), [("message", "⏳ Executando")])
+        self.assertEqual(tracker.feed_values(state), [])
+
+    def test_growing_message_sends_only_the_suffix(self):
+        tracker = DeltaTracker()
+        tracker.feed_partial([{"type": "AIMessageChunk", "content": "O faturamento", "id": "a"}])
+        events = tracker.feed_partial([{"type": "AIMessageChunk", "content": "O faturamento foi <alto>", "id": "a"}])
+        self.assertEqual(events, [("delta", " foi &lt;alto&gt;")])
+
+    def test_resume_from_last_event_id(self):
+        async def run():
+            stream = RunStream()
+            for i in range(5):
+                stream.publish("message", f"m{i}")
+            stream.finish()
+            return [frame async for frame in stream.subscribe(last_event_id=3)]
+
+        frames = asyncio.run(run())
+        self.assertEqual(frames, ["id: 4\nevent: message\ndata: m3\n\n", "id: 5\nevent: message\ndata: m4\n\n"])
+
+    def test_heartbeat_while_idle(self):
+        async def run():
+            stream = RunStream()
+            subscriber = stream.subscribe(heartbeat=0.01)
+            first = await subscriber.__anext__()
+            stream.publish("message", "pronto")
+            second = await subscriber.__anext__()
+            await subscriber.aclose()
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, HEARTBEAT)
+        self.assertIn("data: pronto", second)
+
+
+class TestCancellation(unittest.TestCase):
+    """Testa a propagação do cancelamento até a chamada ao LLM em voo."""
+
+    def test_in_flight_call_is_aborted(self):
+        deployment = SimulatedDeployment("primary", [5.0])
+        gateway = LLMGateway(deployment)
+        token = CancellationToken()
+        threading.Timer(0.1, token.cancel).start()
+
+        started = time.monotonic()
+        with mock.patch("llm_gateway.current_token", return_value=token):
+            with self.assertRaises(RunCancelled):
+                gateway.invoke("pergunta longa", lane="answer")
+        time.sleep(0.05)  # 🔹 Dá tempo ao loop do gateway de processar o cancelamento
+
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(deployment.cancelled, 1)
+
+    def test_cancelled_leader_does_not_cancel_coalesced_follower(self):
+        deployment = SimulatedDeployment("primary", [5.0, 0.05])
+        gateway = LLMGateway(deployment)
+        tokens = {"a": CancellationToken(), "b": CancellationToken()}
+        results = {}
+
+        def run():
+            name = threading.current_thread().name
+            try:
+                results[name] = gateway.invoke("mesma pergunta", lane="answer")
+            except RunCancelled:
+                results[name] = "cancelada"
+
+        # 🔹 Cada thread é uma execução diferente, com o próprio token
+        with mock.patch("llm_gateway.current_token", side_effect=lambda: tokens[threading.current_thread().name]):
+            leader, follower = threading.Thread(target=run, name="a"), threading.Thread(target=run, name="b")
+            leader.start()
+            time.sleep(0.05)
+            follower.start()
+            time.sleep(0.05)
+            tokens["a"].cancel()
+            leader.join(2)
+            follower.join(2)
+
+        self.assertEqual(results, {"a": "cancelada", "b": "primary"})
+
+    def test_callbacks_run_once_and_late_registrations_run_immediately(self):
+        token, calls = CancellationToken(), []
+        unregister = token.on_cancel(lambda: calls.append("db"))
+        token.on_cancel(lambda: calls.append("llm"))
+        unregister()
+
+        token.cancel()
+        token.cancel()
+        token.on_cancel(lambda: calls.append("tarde"))
+        self.assertEqual(calls, ["llm", "tarde"])
+
+
+class CounterState(TypedDict):
+    steps: Annotated[list, operator.add]
+    table_schemas: str
+
+
+class TestSqliteCheckpointer(unittest.TestCase):
+    """Testa o checkpointer em SQLite com um grafo real de dois nós."""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+        self.saver = SqliteCheckpointer(self.path, retention=2, compaction_interval=0)
+        self.config = {"configurable": {"thread_id": "t1"}}
+
+    def tearDown(self):
+        self.saver.close()
+
+    def compile(self, saver):
+        workflow = StateGraph(CounterState)
+        workflow.add_node("first", lambda state: {"steps": ["first"]})
+        workflow.add_node("second", lambda state: {"steps": ["second"]})
+        workflow.add_edge(START, "first")
+        workflow.add_edge("first", "second")
+        workflow.add_edge("second", END)
+        return workflow.compile(checkpointer=saver)
+
+    def test_state_survives_reopen(self):
+        self.compile(self.saver).invoke({"steps": ["início"], "table_schemas": "DDL"}, self.config)
+        self.saver.close()
+
+        self.saver = SqliteCheckpointer(self.path, retention=2, compaction_interval=0)
+        values = self.compile(self.saver).get_state(self.config).values
+        self.assertEqual(values, {"steps": ["início", "first", "second"], "table_schemas": "DDL"})
+
+    def test_embedded_threads_survive_a_restart(self):
+        threads = EmbeddedThreads(self.compile(self.saver))
+        asyncio.run(threads.create(thread_id="t1", metadata={"user_id": "ana"}))
+        asyncio.run(threads.create(thread_id="t2", metadata={"user_id": "bia"}))
+        self.saver.close()
+
+        self.saver = SqliteCheckpointer(self.path, retention=2, compaction_interval=0)
+        threads = EmbeddedThreads(self.compile(self.saver))
+        found = asyncio.run(threads.search(metadata={"user_id": "ana"}))
+        self.assertEqual([(thread["thread_id"], thread["metadata"]) for thread in found], [("t1", {"user_id": "ana"})])
+
+    def test_unchanged_channels_are_not_rewritten(self):
+        self.compile(self.saver).invoke({"steps": [], "table_schemas": "DDL"}, self.config)
+        rows = self.saver.conn.execute("SELECT COUNT(*) FROM checkpoint_blobs WHERE channel = 'table_schemas'").fetchone()
+        self.assertEqual(rows[0], 1)
+
+    def test_retention_keeps_last_checkpoints(self):
+        graph = self.compile(self.saver)
+        for _ in range(3):
+            graph.invoke({"steps": ["x"], "table_schemas": "DDL"}, self.config)
+
+        self.assertGreater(self.saver.compact_all(), 0)
+        self.assertEqual(len(list(self.saver.list(self.config))), 2)
+        self.assertEqual(len(graph.get_state(self.config).values["steps"]), 9)
+
+    def test_appended_items_are_stored_as_delta(self):
+        graph = self.compile(self.saver)
+        for _ in range(3):
+            graph.invoke({"steps": ["x"], "table_schemas": "DDL"}, self.config)
+        self.saver.compact_all()
+
+        types = [row[0] for row in self.saver.conn.execute("SELECT type FROM checkpoint_blobs WHERE channel = 'steps'")]
+        self.assertTrue(any(type_.startswith("delta:") for type_ in types))
+
+        # 🔹 Leitura a frio, sem caches: as bases dos deltas mantidos sobreviveram à compactação
+        reopened = SqliteCheckpointer(self.path, retention=2, compaction_interval=0)
+        self.assertEqual(self.compile(reopened).get_state(self.config).values["steps"], ["x", "first", "second"] * 3)
+        reopened.close()
+
+    def test_replaced_message_is_stored_in_full(self):
+        workflow = StateGraph(MessagesState)
+        workflow.add_node("answer", lambda state: {"messages": [AIMessage(content=f"resposta {len(state['messages'])}", id="r")]})
+        workflow.add_edge(START, "answer")
+        workflow.add_edge("answer", END)
+        graph = workflow.compile(checkpointer=self.saver)
+        for question in ("p1", "p2"):
+            graph.invoke({"messages": [HumanMessage(content=question, id=question)]}, self.config)
+
+        reopened = SqliteCheckpointer(self.path, compaction_interval=0)
+        messages = reopened.get_tuple(self.config).checkpoint["channel_values"]["messages"]
+        self.assertEqual([m.content for m in messages], ["p1", "resposta 3", "p2"])
+        reopened.close()
+
+
+class TestBlobStore(unittest.TestCase):
+    """Testa o armazém de blobs usado para os campos grandes do estado."""
+
+    def setUp(self):
+        self.store = BlobStore(tempfile.mkdtemp(), min_bytes=16)
+
+    def test_round_trip_and_dedup(self):
+        schema = "CREATE TABLE orders_ia (id INTEGER, total NUMERIC)"
+        ref = self.store.put(schema)
+
+        self.assertTrue(is_ref(ref))
+        self.assertEqual(self.store.put(schema), ref)
+        self.assertEqual(self.store.get(ref), schema)
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(self.store.root)), 1)
+
+    def test_small_values_and_old_states_pass_through(self):
+        self.assertEqual(self.store.put("curto"), "curto")
+        self.assertEqual(self.store.get("DDL antigo guardado no estado"), "DDL antigo guardado no estado")
+        self.assertEqual(self.store.get_dict({"t": self.store.put("x" * 32)}), {"t": "x" * 32})
+
+    def test_sweep_removes_only_blobs_not_written_again(self):
+        old, reused = self.store.put("resultado antigo " * 4), self.store.put("DDL reaproveitado " * 4)
+        two_weeks_ago = time.time() - 14 * 24 * 3600
+        for ref in (old, reused):
+            path = self.store._path(ref[len(REF_PREFIX) :])
+            os.utime(path, (two_weeks_ago, two_weeks_ago))
+
+        self.assertEqual(self.store.put("DDL reaproveitado " * 4), reused)  # 🔹 Regravar renova o blob
+        self.assertEqual(self.store.sweep(max_age=7 * 24 * 3600), 1)
+        self.assertEqual(self.store.get(reused), "DDL reaproveitado " * 4)
+        self.assertFalse(os.path.exists(self.store._path(old[len(REF_PREFIX) :])))
+
+    def test_put_starts_at_most_one_background_sweep_per_interval(self):
+        with mock.patch.object(BlobStore, "sweep", return_value=0) as sweep:
+            store = BlobStore(tempfile.mkdtemp(), min_bytes=16)
+            store.put("primeiro resultado " * 4)
+            store.put("segundo resultado " * 4)
+            time.sleep(0.05)  # 🔹 A varredura roda em uma thread daemon
+
+        self.assertEqual(sweep.call_count, 1)
+        self.assertTrue(store.sweep_if_due(interval=0))
+
+
+class SlowGraph:
+    """Grafo falso: cada pergunta leva o tempo indicado nela e consulta o cache de resultados do lote."""
+
+    def __init__(self):
+        self.running = self.peak = 0
+
+    async def ainvoke(self, state, config):
+        from batch import current_result_cache
+
+        question = state["messages"][0].content
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(float(question))
+        self.running -= 1
+        columns, rows = current_result_cache().fetch("SELECT 1", lambda query: (["x"], [(1,)]))
+        return {"final_answer": f"{question}: {rows[0][0]}", "messages": []}
+
+    async def aget_state(self, config):
+        return mock.Mock(values={"sql_query": "SELECT 1", "query_columns": ["x"], "query_rows": [[1]]})
+
+
+class TestBatch(unittest.TestCase):
+    """Testa a execução em lote com concorrência limitada."""
+
+    def test_results_stream_as_they_finish(self):
+        graph = SlowGraph()
+
+        async def run():
+            return [item async for item in run_batch(["0.2", "0.01", "0.05", "0.01"], concurrency=2, graph=graph)]
+
+        results = asyncio.run(run())
+        stats = results.pop()["stats"]
+
+        self.assertEqual([r["index"] for r in results], [1, 2, 3, 0])
+        self.assertEqual(graph.peak, 2)
+        self.assertEqual(stats["status"], {"answered": 4})
+        self.assertEqual(stats["result_cache"], {"hits": 3, "misses": 1})
+
+    def test_closing_the_batch_cancels_in_flight_runs(self):
+        from cancellation import registry
+
+        graph, started = SlowGraph(), []
+        original = graph.ainvoke
+
+        async def ainvoke(state, config):
+            started.append(config["configurable"]["run_id"])
+            return await original(state, config)
+
+        graph.ainvoke = ainvoke
+
+        async def run():
+            batch = run_batch(["0.01", "5", "5"], concurrency=3, graph=graph)
+            await batch.__anext__()
+            await batch.aclose()  # 🔹 Cliente desconectou
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        self.assertEqual(len(started), 3)
+        self.assertEqual([registry.token(run_id).cancelled for run_id in started], [False, True, True])
+
+    def test_concurrent_identical_queries_run_once(self):
+        cache, calls = ResultCache(), []
+
+        def fetch(query):
+            calls.append(query)
+            time.sleep(0.05)
+            return ["x"], [(1,)]
+
+        threads = [threading.Thread(target=cache.fetch, args=("SELECT  1;", fetch)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_cache_key_keeps_quoted_text(self):
+        self.assertEqual(
+            ResultCache.key("SELECT  *\nFROM orders_ia WHERE state = 'SP';"),
+            ResultCache.key("select * from orders_ia where state = 'SP'"),
+        )
+        self.assertNotEqual(
+            ResultCache.key("SELECT * FROM orders_ia WHERE state = 'SP'"),
+            ResultCache.key("SELECT * FROM orders_ia WHERE state = 'sp'"),
+        )
+        self.assertNotEqual(ResultCache.key("SELECT 'a  b'"), ResultCache.key("SELECT 'a b'"))
+
+
+class TestSnapshots(unittest.TestCase):
+    """Testa a validade dos snapshots e o agendamento do recálculo."""
+
+    def setUp(self):
+        self.store = SnapshotStore(os.path.join(tempfile.mkdtemp(), "snapshots.db"), max_age=3600)
+
+    def test_matching_question_is_served_until_data_changes(self):
+        self.store.data_version = "v1"
+        self.store.save("Qual foi o faturamento total da loja no último mês?", {"answer": "R$ 10,00"}, "v1")
+
+        self.assertEqual(
+            normalize_question("Qual foi o FATURAMENTO total da loja no último mês?"),
+            "qual foi o faturamento total da loja no ultimo mes",
+        )
+        self.assertEqual(self.store.lookup("qual foi o faturamento total da loja no ultimo mes")["answer"], "R$ 10,00")
+        self.assertIsNone(self.store.lookup("Qual foi o faturamento de ontem?"))
+
+        self.store.data_version = "v2"
+        self.assertIsNone(self.store.lookup("Qual foi o faturamento total da loja no último mês?"))
+
+    def test_expired_snapshot_is_not_served(self):
+        self.store.max_age = 0
+        self.store.save("Top produtos", {"answer": "..."}, None)
+        time.sleep(0.01)
+        self.assertIsNone(self.store.lookup("Top produtos"))
+
+    def test_refresh_is_due_after_each_scheduled_time(self):
+        scheduler = SnapshotScheduler(self.store, [], schedule="06:00,12:00", poll_seconds=0)
+        scheduler.last_run = datetime(2025, 3, 10, 6, 30)
+
+        self.assertFalse(scheduler.due(datetime(2025, 3, 10, 11, 59)))
+        self.assertTrue(scheduler.due(datetime(2025, 3, 10, 12, 1)))
+        self.assertTrue(scheduler.due(datetime(2025, 3, 11, 6, 0)))
+
+    def test_only_the_lease_holder_refreshes(self):
+        first = SnapshotScheduler(self.store, [], poll_seconds=0)
+        second = SnapshotScheduler(self.store, [], poll_seconds=0)
+
+        self.assertTrue(self.store.acquire_lease(first.owner, 60))
+        self.assertFalse(second.check())  # 🔹 Nunca executou, mas outro processo detém a posse
+        self.assertTrue(self.store.acquire_lease(first.owner, -1))  # 🔹 Renova (já expirada)
+        self.assertTrue(self.store.acquire_lease(second.owner, 60))
+        self.assertFalse(self.store.acquire_lease(first.owner, 60))
+
+    def test_data_version_is_read_from_the_primary(self):
+        conn = mock.Mock()
+        conn.exec_driver_sql.return_value.scalar.return_value = "2025-03-10 12:00:00"
+        db = mock.Mock(fetch=mock.Mock(side_effect=AssertionError("roteado ao espelho")))
+        db.connection.return_value.__enter__ = mock.Mock(return_value=conn)
+        db.connection.return_value.__exit__ = mock.Mock(return_value=False)
+        scheduler = SnapshotScheduler(self.store, [], db=db, poll_seconds=0)
+
+        self.assertEqual(
+            scheduler.current_data_version(),
+            "orders_ia=2025-03-10 12:00:00;orders_items_ia=2025-03-10 12:00:00",
+        )
+
+
+class FakeWarmupAgent:
+    """Agente falso que registra as etapas de aquecimento executadas."""
+
+    def __init__(self):
+        self.calls = []
+        self.profiler = mock.Mock(wait=lambda timeout: self.calls.append("stats") or True)
+        self.db = mock.Mock(fetch=lambda query: self.calls.append(query))
+
+    def load_table_schemas(self):
+        self.calls.append("schemas")
+        return {}
+
+
+class TestWarmup(unittest.TestCase):
+    """Testa a configuração e as etapas do aquecimento do worker."""
+
+    def test_config_from_langgraph_json_and_env(self):
+        path = os.path.join(tempfile.mkdtemp(), "langgraph.json")
+        with open(path, "w") as f:
+            json.dump({"graphs": {}, "warmup": {"replay_questions": 3, "llm": False}}, f)
+
+        with mock.patch.dict(os.environ, {"WARMUP_CONNECTIONS": "2", "WARMUP_SCHEMAS": "false"}):
+            config = load_warmup_config(path)
+
+        self.assertEqual((config["replay_questions"], config["llm"]), (3, False))
+        self.assertEqual((config["connections"], config["schemas"]), (2, False))
+
+    def test_replays_top_questions(self):
+        store = SnapshotStore(os.path.join(tempfile.mkdtemp(), "snapshots.db"))
+        for _ in range(2):
+            store.record_question("Top produtos?", "SELECT namesku FROM orders_items_ia LIMIT 5")
+        store.record_question("Apague tudo", "DELETE FROM orders_ia")
+
+        agent = FakeWarmupAgent()
+        config = load_warmup_config("inexistente.json") | {"connections": 0, "llm": False}
+        with mock.patch("warmup.get_snapshot_store", return_value=store):
+            timings = Warmup(agent, config).run()
+
+        self.assertCountEqual(agent.calls, ["schemas", "stats", "SELECT namesku FROM orders_items_ia LIMIT 5"])
+        self.assertIn("replay", timings)
+
+
+class TestSubQueries(unittest.TestCase):
+    def test_only_compound_questions_are_planned(self):
+        self.assertTrue(looks_compound("Compare o faturamento de SP e RJ em 2024"))
+        self.assertTrue(looks_compound("Ticket médio de 2023 x 2024"))
+        self.assertTrue(looks_compound("Resumo por estado", {"metric": "faturamento, ticket médio"}))
+        self.assertFalse(looks_compound("Qual o faturamento total de 2024?", {"metric": "faturamento"}))
+
+    def test_merge_joins_on_common_columns(self):
+        results = [
+            {"question": "Faturamento por estado", "columns": ["estado", "faturamento"], "rows": [["SP", 10], ["RJ", 5]]},
+            {"question": "Pedidos por estado", "columns": ["estado", "pedidos"], "rows": [["SP", 3], ["MG", 1]]},
+        ]
+        columns, rows = merge_results(results)
+
+        self.assertEqual(columns, ["estado", "faturamento", "pedidos"])
+        self.assertEqual(rows, [["SP", 10, 3], ["RJ", 5, None], ["MG", None, 1]])
+
+    def test_merge_numbers_repeated_metrics(self):
+        results = [
+            {"question": "2023", "columns": ["estado", "faturamento"], "rows": [["SP", 10]]},
+            {"question": "2024", "columns": ["estado", "faturamento"], "rows": [["SP", 12]]},
+        ]
+        self.assertEqual(merge_results(results), (["estado", "faturamento_1", "faturamento_2"], [["SP", 10, 12]]))
+
+    def test_merge_stacks_unrelated_results(self):
+        results = [
+            {"question": "Faturamento total", "columns": ["faturamento"], "rows": [[100]]},
+            {"question": "Clientes", "columns": ["clientes"], "rows": [[7]]},
+        ]
+        columns, rows = merge_results(results)
+
+        self.assertEqual(columns, ["sub_pergunta", "faturamento", "clientes"])
+        self.assertEqual(rows, [[1, 100, None], [2, None, 7]])
+
+
+class TestApproximate(unittest.TestCase):
+    def test_rewrites_aggregates_over_a_sample(self):
+        query = (
+            "SELECT state, SUM(value) AS faturamento, COUNT(*) FILTER (WHERE freeshipping) AS gratis "
+            "FROM public.orders_ia o WHERE o.status = 'FROM invoiced' GROUP BY state ORDER BY 2 DESC;"
+        )
+        sql = approximate_query(query, 10).sql
+
+        self.assertIn("(SUM(value) * (100.0 / 10)) AS faturamento", sql)
+        self.assertIn("(COUNT(*) FILTER (WHERE freeshipping) * (100.0 / 10)) AS gratis", sql)
+        self.assertIn(f'COUNT(*) AS "{SAMPLE_COLUMN}"\nFROM public.orders_ia o TABLESAMPLE SYSTEM (10) WHERE', sql)
+        self.assertIn("'FROM invoiced'", sql)
+
+    def test_only_estimable_queries_are_rewritten(self):
+        query = "SELECT EXTRACT(YEAR FROM creationdate), AVG(value) FROM orders_ia GROUP BY 1"
+        self.assertIsNotNone(approximate_query(query, 5))
+        for query in (
+            "SELECT MAX(value) FROM orders_ia",
+            "SELECT COUNT(DISTINCT clientid) FROM orders_ia",
+            "SELECT state, COUNT(*) FROM orders_ia GROUP BY state HAVING COUNT(*) > 100",
+            "SELECT COUNT(*) FROM orders_ia o JOIN orders_items_ia i ON i.orderid = o.orderid",
+            "SELECT COUNT(*) FROM orders_ia, users",
+            "SELECT COUNT(*) FROM orders_ia o, orders_items_ia i WHERE i.orderid = o.orderid",
+            "SELECT * FROM orders_ia LIMIT 10",
+            "SELECT COUNT(*) FROM clientes",
+        ):
+            self.assertIsNone(approximate_query(query, 10), query)
+
+    def test_finish_strips_sample_rows_and_reports_margin(self):
+        approximate = approximate_query("SELECT state, COUNT(*) AS pedidos FROM orders_ia GROUP BY state", 10)
+        columns, rows, info = approximate.finish(
+            ["state", "pedidos", SAMPLE_COLUMN], [("SP", 40000.0, 4000), ("RJ", 10000.0, 1000)]
+        )
+
+        self.assertEqual((columns, rows), (["state", "pedidos"], [("SP", 40000.0), ("RJ", 10000.0)]))
+        self.assertEqual((info["sample_percent"], info["sample_rows"]), (10, 5000))
+        self.assertAlmostEqual(info["margin"], 1.96 * (0.9 / 1000) ** 0.5, places=4)
+        self.assertIsNone(approximate.finish(["state", "pedidos", SAMPLE_COLUMN], [("SP", 100.0, 10)]))
+
+    def test_unaliased_aggregates_keep_their_names(self):
+        query = "SELECT state, COUNT(*), SUM(value) FROM orders_ia GROUP BY state ORDER BY COUNT(*)"
+        sql = approximate_query(query, 10).sql
+
+        self.assertIn("(COUNT(*) * (100.0 / 10)) AS count, (SUM(value) * (100.0 / 10)) AS sum", sql)
+        self.assertTrue(sql.endswith("ORDER BY (COUNT(*) * (100.0 / 10))"))
+        self.assertNotIn("AS round", approximate_query("SELECT ROUND(SUM(value), 2) FROM orders_ia", 10).sql)
+
+    def test_margin_only_for_count_queries(self):
+        approximate = approximate_query("SELECT state, SUM(value) AS faturamento FROM orders_ia GROUP BY state", 10)
+        _, _, info = approximate.finish(["state", "faturamento", SAMPLE_COLUMN], [("SP", 4e6, 4000)])
+
+        self.assertIsNone(info["margin"])
+        average = approximate_query("SELECT AVG(value) FROM orders_ia", 10)
+        self.assertIsNone(average.finish(["avg", SAMPLE_COLUMN], [(10.0, 4000)])[2]["margin"])
+        self.assertIn("sem margem de erro calculada", render_answer("Faturamento?", ["sum"], [[1.0]], approximation=info))
+
+    def test_answer_discloses_approximation(self):
+        approximation = {"sample_percent": 5, "sample_rows": 20000, "margin": 0.0137}
+        answer = render_answer("Quantos pedidos?", ["pedidos"], [[123450.0]], approximation=approximation)
+
+        self.assertTrue(answer.startswith("Pedidos: 123.450"))
+        self.assertIn("amostra de 5% dos dados (margem de erro de ±1,4%", answer)
+
+
+class FakeDuckCursor:
+    """Registra os comandos enviados ao DuckDB; nenhum banco está anexado."""
+
+    def __init__(self):
+        self.statements = []
+        self.description = [("total",)]
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return self
+
+    def fetchone(self):
+        return (0,)
+
+    def fetchall(self):
+        return [(3,)]
+
+
+class TestMirror(unittest.TestCase):
+    """Testa o roteamento e a tradução de dialeto do espelho DuckDB (sem DuckDB instalado)."""
+
+    def setUp(self):
+        # 🔹 Sem `__init__`: o construtor abriria o arquivo do DuckDB
+        self.mirror = AnalyticsMirror.__new__(AnalyticsMirror)
+        self.mirror.pg_dsn, self.mirror.pg_schema = "postgresql://bi:s3nh'a@db/vendas", "public"
+        self.mirror.tables, self.mirror.max_lag, self.mirror.last_sync = {"orders_ia": "creationdate"}, 900, time.time()
+        self.cursor = FakeDuckCursor()
+        self.mirror.conn = mock.Mock(cursor=lambda: self.cursor)
+
+    def test_translate_strips_schema_and_converts_to_char(self):
+        sql = self.mirror.translate(
+            "SELECT TO_CHAR(creationdate, 'YYYY-MM'), COUNT(*) FROM public.orders_ia GROUP BY 1;"
+        )
+        self.assertEqual(sql, "SELECT strftime(creationdate, '%Y-%m'), COUNT(*) FROM \"orders_ia\" GROUP BY 1")
+
+    def test_can_serve_only_fresh_analytical_reads_on_mirrored_tables(self):
+        self.assertTrue(self.mirror.can_serve("SELECT state, COUNT(*) FROM orders_ia GROUP BY state"))
+        self.assertTrue(
+            self.mirror.can_serve("SELECT EXTRACT(MONTH FROM creationdate), SUM(value) FROM orders_ia GROUP BY 1")
+        )
+        self.assertFalse(self.mirror.can_serve("SELECT orderid FROM orders_ia LIMIT 5"))
+        self.assertFalse(self.mirror.can_serve("SELECT COUNT(*) FROM orders_ia o JOIN clientes c ON c.id = o.clientid"))
+        self.assertFalse(self.mirror.can_serve("DELETE FROM orders_ia WHERE id IN (SELECT MAX(id) FROM orders_ia)"))
+
+        self.mirror.last_sync = time.time() - 3600
+        self.assertFalse(self.mirror.can_serve("SELECT COUNT(*) FROM orders_ia"))
+
+    def test_integer_division_matches_postgres(self):
+        self.assertEqual(self.mirror.fetch("SELECT SUM(quantity) / COUNT(*) FROM orders_ia"), (["total"], [(3,)]))
+        self.assertEqual(self.cursor.statements[0], "SET integer_division = true")
+
+    def test_dsn_quotes_are_escaped_on_attach(self):
+        self.mirror._attach(self.cursor)
+        attach = self.cursor.statements[-1]
+        self.assertEqual(attach, "ATTACH 'postgresql://bi:s3nh''a@db/vendas' AS pg (TYPE postgres, READ_ONLY)")
+
+
+class TestSqlRepair(unittest.TestCase):
+    """Testa as correções locais de SQL a partir do erro do PostgreSQL."""
+
+    SCHEMAS = {
+        "orders_ia": "CREATE TABLE orders_ia (\n\torderid INTEGER, \n\tstate VARCHAR(2), \n\tvalue NUMERIC, "
+        "\n\tcreationdate TIMESTAMP\n)\n\n/*\n3 rows from orders_ia table:\n*/",
+        "orders_items_ia": "CREATE TABLE orders_items_ia (\n\torderid INTEGER, \n\tidprod INTEGER, "
+        "\n\tquantity INTEGER, \n\tcreationdate TIMESTAMP\n)",
+    }
+
+    def test_undefined_column_uses_the_closest_name(self):
+        fixed = repair_sql("SELECT SUM(vlue) FROM orders_ia", 'ERROR: column "vlue" does not exist', self.SCHEMAS)
+        self.assertEqual(fixed, "SELECT SUM(value) FROM orders_ia")
+
+    def test_operator_mismatch_quotes_literals_for_text_columns(self):
+        error = "ERROR: operator does not exist: character varying = integer"
+        fixed = repair_sql("SELECT COUNT(*) FROM orders_ia WHERE state = 35 OR state IN (41, 42)", error, self.SCHEMAS)
+        self.assertEqual(fixed, "SELECT COUNT(*) FROM orders_ia WHERE state = '35' OR state IN ('41', '42')")
+
+    def test_ambiguous_column_is_qualified(self):
+        query = "SELECT creationdate, quantity FROM orders_ia o JOIN orders_items_ia i ON i.orderid = o.orderid"
+        fixed = repair_sql(query, 'ERROR: column reference "creationdate" is ambiguous', self.SCHEMAS)
+        self.assertEqual(fixed, query.replace("SELECT creationdate", "SELECT o.creationdate"))
+
+    def test_columns_inside_using_are_not_qualified(self):
+        query = "SELECT orderid, SUM(quantity) FROM orders_ia o JOIN orders_items_ia i USING (orderid) GROUP BY orderid"
+        fixed = repair_sql(query, 'ERROR: column reference "orderid" is ambiguous', self.SCHEMAS)
+        self.assertEqual(
+            fixed,
+            "SELECT o.orderid, SUM(quantity) FROM orders_ia o JOIN orders_items_ia i USING (orderid) GROUP BY o.orderid",
+        )
+
+    def test_extract_from_is_not_a_table_reference(self):
+        query = "SELECT EXTRACT(YEAR FROM o.creationdate), COUNT(*) FROM orders_ia o GROUP BY 1"
+        self.assertEqual(_table_aliases(query), [("orders_ia", "o")])
+
+    def test_unknown_errors_are_left_to_the_llm(self):
+        self.assertIsNone(repair_sql("SELECT 1 FROM orders_ia", "ERROR: division by zero", self.SCHEMAS))
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -1,10 +1,10 @@
-from agent.graph.state import AgentState
+from state import AgentState
 from database import PostgresDB
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.tools import tool
 from llm import model  # Importamos o modelo configurado
-from prompt import format_answer_prompt, sql_prompt
+from prompt import answer_system_prompt, format_answer_prompt, sql_question_prompt, sql_system_prompt
 
 
 def classify_query(state: AgentState) -> dict:
@@ -94,8 +94,7 @@ def generate_sql(state: AgentState) -> AgentState:
     print(schema_context)
 
     # Criamos o prompt e pedimos ao LLM para gerar a query SQL
-    sql_prompt_text = sql_prompt(schema_context, user_question)
-    sql_query = model.invoke([HumanMessage(content=sql_prompt_text)]).content.strip()
+    sql_query = model.invoke([sql_system_prompt(schema_context), sql_question_prompt(user_question)]).content.strip()
 
     if not sql_query.lower().startswith("select"):
         state["sql_query"] = f"Erro: A query gerada não é uma consulta SELECT válida.\nQuery: {sql_query}"
@@ -151,7 +150,7 @@ def generate_answer(state: AgentState) -> AgentState:
     answer_prompt = format_answer_prompt(user_question, sql_query, query_result)
 
     # 🔹 Chama o LLM para gerar a resposta final
-    final_answer = model.invoke([HumanMessage(content=answer_prompt)]).content.strip()
+    final_answer = model.invoke([answer_system_prompt(), answer_prompt]).content.strip()
 
     # 🔹 Atualiza o estado com a resposta gerada
     state["final_answer"] = final_answer
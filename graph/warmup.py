@@ -0,0 +1,142 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from typing import Any, Dict
+
+from mirror import is_read_only
+from snapshots import get_snapshot_store
+
+# Arquivo de configuração do servidor; a seção `warmup` define as etapas do aquecimento
+LANGGRAPH_CONFIG = os.getenv("LANGGRAPH_CONFIG", os.path.join(os.path.dirname(__file__), "..", "langgraph.json"))
+
+# Valores padrão de cada etapa (sobrescritos pela seção `warmup` e por variáveis `WARMUP_<CHAVE>`).
+# Desligado por padrão: só roda quando o `langgraph.json` (ou `WARMUP_ENABLED=true`) o habilita.
+WARMUP_DEFAULTS = {
+    "enabled": False,
+    "schemas": True,
+    "column_stats": True,
+    "connections": 5,
+    "llm": True,
+    "replay_questions": 10,
+    "timeout_seconds": 120.0,
+}
+
+
+def load_warmup_config(path: str = LANGGRAPH_CONFIG) -> Dict[str, Any]:
+    """
+    Lê a seção `warmup` do `langgraph.json`. Variáveis de ambiente `WARMUP_<CHAVE>` têm precedência
+    (úteis na imagem de deploy, que copia apenas as dependências e não o `langgraph.json`).
+    """
+    config = dict(WARMUP_DEFAULTS)
+    try:
+        with open(path, encoding="utf-8") as f:
+            config |= json.load(f).get("warmup", {})
+    except (OSError, ValueError):
+        pass
+
+    for key, default in WARMUP_DEFAULTS.items():
+        value = os.getenv(f"WARMUP_{key.upper()}")
+        if value is not None:
+            config[key] = value.lower() == "true" if isinstance(default, bool) else type(default)(value)
+    return config
+
+
+class Warmup:
+    """
+    Etapas do aquecimento de um worker: esquemas e estatísticas de colunas em cache, conexões do pool abertas,
+    conexão TLS com o LLM e prefixo do prompt de SQL no cache do provedor, e as SQL das perguntas mais
+    frequentes executadas de novo (buffers do PostgreSQL e espelho DuckDB quentes).
+    """
+
+    def __init__(self, agent, config: Dict[str, Any]):
+        self.agent = agent
+        self.config = config
+        self.timings: Dict[str, float] = {}
+
+    def _timed(self, name: str, step):
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"⚠️ Aquecimento '{name}' falhou:", str(e))
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def schemas(self):
+        self.agent.load_table_schemas()
+
+    def column_stats(self):
+        if not self.agent.profiler.wait(self.config["timeout_seconds"]):
+            print("⚠️ Estatísticas de colunas ainda não prontas; o profiling continua em segundo plano")
+
+    def connections(self):
+        """Abre as conexões ao mesmo tempo, para que o pool as mantenha abertas."""
+        with ExitStack() as stack:
+            conns = [stack.enter_context(self.agent.db.connection()) for _ in range(self.config["connections"])]
+            for conn in conns:
+                conn.exec_driver_sql("SELECT 1")
+
+    def llm(self):
+        """Uma chamada de 1 token com o mesmo prefixo do prompt de SQL: TLS aberto e prefixo no cache do provedor."""
+        from llm import gateway
+
+        messages = self.agent.sql_prompt("SELECT 1", self.agent.load_table_schemas(), self.agent.current_column_stats())
+        gateway.invoke(messages, lane="sql", coalesce=False, max_tokens=1)
+
+    def replay(self):
+        """
+        Executa de novo a SQL já gerada para as perguntas mais frequentes. O agente não tem cache de SQL nem de
+        resultados entre execuções (o `ResultCache` vale só dentro de um lote), então o ganho é no banco: páginas
+        das tabelas nos buffers do PostgreSQL e no cache do sistema de arquivos, e espelho DuckDB já consultado.
+        """
+        store = get_snapshot_store()
+        if store is None:
+            return
+        queries = [sql for _, sql in store.top_questions(self.config["replay_questions"]) if sql and is_read_only(sql)]
+        if queries:
+            with ThreadPoolExecutor(max_workers=min(4, len(queries))) as executor:
+                list(executor.map(self._replay_query, queries))
+
+    def _replay_query(self, query: str):
+        try:
+            self.agent.db.fetch(query)
+        except Exception as e:
+            print("⚠️ Falha ao repetir query no aquecimento:", str(e))
+
+    def run(self) -> Dict[str, float]:
+        """Executa as etapas habilitadas em paralelo (o LLM depois dos esquemas e estatísticas) e retorna os tempos."""
+        config = self.config
+        started = time.perf_counter()
+
+        def prompt_chain():
+            if config["schemas"]:
+                self._timed("schemas", self.schemas)
+            if config["column_stats"]:
+                self._timed("column_stats", self.column_stats)
+            if config["llm"]:
+                self._timed("llm", self.llm)
+
+        steps = [prompt_chain]
+        if config["connections"]:
+            steps.append(lambda: self._timed("connections", self.connections))
+        if config["replay_questions"]:
+            steps.append(lambda: self._timed("replay", self.replay))
+
+        executor = ThreadPoolExecutor(max_workers=len(steps))
+        _, pending = wait([executor.submit(step) for step in steps], timeout=config["timeout_seconds"])
+        executor.shutdown(wait=False)  # 🔹 Etapas que estouraram o tempo continuam em segundo plano
+
+        self.timings["total"] = time.perf_counter() - started
+        summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+        print(f"🔥 Aquecimento concluído{' (com etapas pendentes)' if pending else ''}: {summary}")
+        return self.timings
+
+
+def warmup(agent, config: Dict[str, Any] = None) -> Dict[str, float]:
+    """Aquece o worker antes de ele começar a atender (chamado na inicialização do servidor, ver `app.py`)."""
+    config = config or load_warmup_config()
+    if not config["enabled"]:
+        return {}
+    return Warmup(agent, config).run()
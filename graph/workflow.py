@@ -1,12 +1,17 @@
+import os
+
 from langgraph.graph import END, START, StateGraph
 from state import InputState, OutputState
-from typing import Literal
-from agent import EcommerceAgent
+from typing import List, Literal
+from runtime import get_agent, register_graph
+
+# Limite de voltas execute/validate → generate_sql antes de desistir e responder ao usuário
+MAX_SQL_RETRIES = int(os.getenv("MAX_SQL_RETRIES", "3"))
 
 
 class WorkflowManager:
     def __init__(self):
-        self.agent = EcommerceAgent()
+        self.agent = get_agent()
 
     def create_workflow(self) -> StateGraph:
         """Cria e configura o fluxo de trabalho do agente."""
@@ -15,12 +20,25 @@ class WorkflowManager:
         # Definição dos nós
         workflow.add_node("interact_with_user", self.agent.interact_with_user)
         workflow.add_node("collect_user_interaction", self.agent.collect_user_interaction)
+        workflow.add_node("prefetch_schemas", self.agent.prefetch_schemas)
         workflow.add_node("analyze_tables", self.agent.analyze_tables)
+        workflow.add_node("plan_query", self.agent.plan_query)
+        workflow.add_node("run_sub_queries", self.agent.run_sub_queries)
         workflow.add_node("generate_sql", self.agent.generate_sql)
         workflow.add_node("validate_sql", self.agent.validate_sql)
         workflow.add_node("execute_sql", self.agent.execute_sql)
         workflow.add_node("generate_answer", self.agent.generate_answer)
         workflow.add_node("choose_visualization", self.agent.choose_visualization)
+        workflow.add_node("serve_snapshot", self.agent.serve_snapshot)
+
+        def route_from_start(state: dict) -> List[Literal["serve_snapshot","interact_with_user","prefetch_schemas"]]:
+            """
+            Perguntas recorrentes com snapshot válido são respondidas direto do armazenamento.
+            As demais seguem para `interact_with_user`, com a carga dos esquemas em paralelo, fora do caminho crítico.
+            """
+            if self.agent.find_snapshot(state):
+                return ["serve_snapshot"]
+            return ["interact_with_user", "prefetch_schemas"]
 
         def route_after_interaction(state: dict) -> Literal["analyze_tables","collect_user_interaction"]:
             """
@@ -32,20 +50,40 @@ class WorkflowManager:
 
             return "collect_user_interaction"
 
+        def route_after_planning(state: dict) -> Literal["run_sub_queries","generate_sql"]:
+            """Perguntas compostas seguem para as sub-queries em paralelo; as simples, para a query única."""
+            return "run_sub_queries" if state.get("sub_questions") else "generate_sql"
+
+        def route_after_sub_queries(state: dict) -> Literal["generate_answer","generate_sql"]:
+            """Se alguma sub-pergunta falhou (`sub_questions` limpo), a pergunta inteira vira uma única query."""
+            return "generate_answer" if state.get("sub_questions") else "generate_sql"
+
+        def route_after_generation(state: dict) -> Literal["validate_sql","execute_sql"]:
+            """Candidatas já validadas pelo EXPLAIN seguem direto para a execução."""
+            return "execute_sql" if state.get("sql_validated") else "validate_sql"
+
         def route_after_validation(state: dict) -> Literal["generate_sql","execute_sql"]:
-            """Se a query falhar na validação, volta para a geração."""
-            return "generate_sql" if state.get("retry_generate_sql") else "execute_sql"
+            """Se a query falhar na validação, volta para a geração (respeitando o limite de tentativas)."""
+            if state.get("retry_generate_sql") and state.get("sql_attempts", 0) < MAX_SQL_RETRIES:
+                return "generate_sql"
+            return "execute_sql"
 
         def route_after_execution(state: dict) -> Literal["generate_sql","generate_answer"]:
-            """Se a execução falhar, volta para gerar a query."""
-            return "generate_sql" if state.get("query_error") else "generate_answer"
+            """Se a execução falhar, volta para gerar a query (respeitando o limite de tentativas)."""
+            if state.get("query_error") and state.get("sql_attempts", 0) < MAX_SQL_RETRIES:
+                return "generate_sql"
+            return "generate_answer"
 
         # Fluxo de execução
-        workflow.add_edge(START, "interact_with_user")
+        workflow.add_conditional_edges(START, route_from_start, ["serve_snapshot", "interact_with_user", "prefetch_schemas"])
+        workflow.add_edge("serve_snapshot", END)
+        workflow.add_edge("prefetch_schemas", END)
         workflow.add_conditional_edges("interact_with_user", route_after_interaction)
         workflow.add_edge("collect_user_interaction", "interact_with_user")
-        workflow.add_edge("analyze_tables", "generate_sql")
-        workflow.add_edge("generate_sql", "validate_sql")
+        workflow.add_edge("analyze_tables", "plan_query")
+        workflow.add_conditional_edges("plan_query", route_after_planning)
+        workflow.add_conditional_edges("run_sub_queries", route_after_sub_queries)
+        workflow.add_conditional_edges("generate_sql", route_after_generation)
         workflow.add_conditional_edges("validate_sql", route_after_validation)
         workflow.add_conditional_edges("execute_sql", route_after_execution)
         workflow.add_edge("generate_answer", "choose_visualization")
@@ -62,8 +100,11 @@ class WorkflowManager:
             "messages": result["messages"],
         }
 
-    def returnGraph(self):
-        return self.create_workflow().compile()
+    def returnGraph(self, checkpointer=None):
+        """Compila o grafo; o servidor da LangGraph API fornece o próprio checkpointer, o modo embarcado passa o seu."""
+        return self.create_workflow().compile(checkpointer=checkpointer)
 
 
-graph = WorkflowManager().returnGraph()
+manager = WorkflowManager()
+graph = manager.returnGraph()
+register_graph(graph)